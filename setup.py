@@ -43,6 +43,13 @@ setup(
     ],
     extras_require={
         'mcp': ['mcp[cli]>=1.0.0'],
+        's3': ['boto3>=1.26.0'],
+        'brotli': ['brotli>=1.0.9'],
+        'metrics': ['numpy>=1.22', 'scipy>=1.8'],
+        'server': [
+            'waitress>=2.1.0',
+            'gunicorn>=21.2.0; platform_system != "Windows"',
+        ],
         'rag': [
             'chromadb>=0.4.0',
             'sentence-transformers>=2.2.0',
@@ -1,6 +1,7 @@
 # conftest.py
 import logging
 import pytest
+from tools4zettelkasten import settings as st
 
 LOGGER = logging.getLogger(__name__)
 
@@ -10,3 +11,11 @@ def example_fixture():
     LOGGER.info("Setting Up Example Fixture...")
     yield
     LOGGER.info("Tearing Down Example Fixture...")
+
+
+@pytest.fixture(autouse=True)
+def lock_path(tmp_path_factory, monkeypatch):
+    """keeps the lock files of the tests out of the home directory"""
+    path = tmp_path_factory.getbasetemp() / 'locks'
+    monkeypatch.setattr(st, 'LOCK_PATH', str(path))
+    return path
@@ -0,0 +1,107 @@
+# test_analyse.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import pytest
+from .context import tools4zettelkasten as zt
+from tools4zettelkasten import analyse as an
+from tools4zettelkasten.persistency import PersistencyManager
+
+
+@pytest.fixture
+def zettelkasten(tmp_path):
+    notes = {
+        '01_Topic_aaaaaaaaa.md': '# Topic\n',
+        '01_01_Detail_bbbbbbbbb.md':
+            '# Detail\n[Other](02_Other_ccccccccc.md)\n',
+        '01_02_Second_ddddddddd.md': '# Second\n',
+        '02_Other_ccccccccc.md': '# Other\n[Far](03_Far_eeeeeeeee.md)\n',
+        '03_Far_eeeeeeeee.md': '# Far\n',
+        '011_Similar_fffffffff.md': '# Similar\n',
+    }
+    for filename, content in notes.items():
+        (tmp_path / filename).write_text(content)
+    return PersistencyManager(tmp_path)
+
+
+def test_is_in_topic():
+    assert an.is_in_topic('01_02_Note_aaaaaaaaa.md', '01')
+    assert an.is_in_topic('01_Note_aaaaaaaaa.md', '01')
+    assert not an.is_in_topic('011_Note_aaaaaaaaa.md', '01')
+
+
+def test_topic_analysis_contains_only_the_topic(zettelkasten):
+    analysis = an.create_topic_analysis(zettelkasten, '01')
+    assert sorted(analysis.list_of_filenames) == [
+        '01_01_Detail_bbbbbbbbb.md', '01_02_Second_ddddddddd.md',
+        '01_Topic_aaaaaaaaa.md']
+    # the link to 02_Other leaves the topic
+    assert analysis.list_of_explicit_links == []
+    assert len(analysis.list_of_structure_links) == 2
+
+
+def test_neighborhood_follows_links_in_both_directions(zettelkasten):
+    analysis = an.create_graph_analysis(zettelkasten)
+    one_hop = an.create_neighborhood_analysis(analysis, 'ccccccccc', 1)
+    assert sorted(one_hop.list_of_filenames) == [
+        '01_01_Detail_bbbbbbbbb.md', '02_Other_ccccccccc.md',
+        '03_Far_eeeeeeeee.md']
+    assert len(one_hop.list_of_explicit_links) == 2
+    two_hops = an.create_neighborhood_analysis(
+        analysis, '03_Far_eeeeeeeee.md', 2)
+    assert '01_01_Detail_bbbbbbbbb.md' in two_hops.list_of_filenames
+    with pytest.raises(ValueError):
+        an.create_neighborhood_analysis(analysis, 'missing', 1)
+
+
+def test_overview_collapses_subtrees(zettelkasten):
+    (zettelkasten.directory / '01_03_Third_ggggggggg.md').write_text(
+        '# Third\n[Other](02_Other_ccccccccc.md)\n')
+    analysis = an.create_graph_analysis(zettelkasten)
+    dot = an.create_overview_graph_of_zettelkasten(
+        analysis.list_of_filenames,
+        analysis.list_of_structure_links,
+        analysis.list_of_explicit_links,
+        depth=1,
+        url_in_nodes=False)
+    source = dot.source
+    assert '01 Topic (4 notes)' in source
+    assert source.count('shape=folder') == 1
+    # both links from topic 01 to 02 are combined into one edge
+    assert '"cluster 01" -> "cluster 02" [label=2 color=red' in source
+    assert '"cluster 02" -> "cluster 03" [label=1 color=red' in source
+
+
+def test_streamed_dot_lines_equal_the_digraph_source(zettelkasten):
+    analysis = an.create_graph_analysis(zettelkasten)
+    dot = an.create_graph_of_zettelkasten(
+        analysis.list_of_filenames, analysis.list_of_links,
+        url_in_nodes=False)
+    lines = an.iter_dot_lines_of_zettelkasten(
+        analysis.list_of_filenames, analysis.list_of_links,
+        url_in_nodes=False)
+    assert ''.join(lines) == dot.source
+
+
+def test_analyse_writes_dot_source_to_stdout(zettelkasten, monkeypatch):
+    from click.testing import CliRunner
+    monkeypatch.setattr(
+        zt.settings, 'ZETTELKASTEN', str(zettelkasten.directory))
+    result = CliRunner(mix_stderr=False).invoke(
+        zt.cli.analyse, ['--dot-file', '-'])
+    assert result.exit_code == 0
+    assert result.stdout.startswith('// Zettelkasten\ndigraph {')
+    assert 'Number of Zettel' not in result.stdout
+
+
+def test_banner_is_not_written_into_the_dot_source(
+        zettelkasten, tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    monkeypatch.setattr(
+        zt.settings, 'ZETTELKASTEN', str(zettelkasten.directory))
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN_INPUT', str(tmp_path))
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN_IMAGES', str(tmp_path))
+    result = CliRunner(mix_stderr=False).invoke(
+        zt.cli.messages, ['analyse', '--dot-file', '-'])
+    assert result.exit_code == 0
+    assert result.stdout.startswith('// Zettelkasten\ndigraph {')
@@ -0,0 +1,133 @@
+# test_archive_persistency.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+from .context import tools4zettelkasten as zt
+from tools4zettelkasten.archive_persistency import ArchivePersistencyManager
+
+NOTES = {
+    '1_first_topic_41b4e4f8f.md': '# First topic\n\nsome text\n',
+    '1_1_a_Thought_2c3c34ff5.md':
+        '# A Thought\n\n[first](1_first_topic_41b4e4f8f.md)\n',
+}
+
+
+@pytest.fixture
+def zip_snapshot(tmp_path):
+    archive = tmp_path / 'mycelium.zip'
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for filename, content in NOTES.items():
+            zf.writestr('mycelium/' + filename, content)
+        zf.writestr('mycelium/images/picture.png', b'not a note')
+        zf.writestr('mycelium/.hidden.md', 'hidden')
+    return archive
+
+
+@pytest.fixture
+def tar_snapshot(tmp_path):
+    folder = tmp_path / 'mycelium'
+    folder.mkdir()
+    for filename, content in NOTES.items():
+        (folder / filename).write_text(content)
+    archive = tmp_path / 'mycelium.tar.gz'
+    with tarfile.open(archive, 'w:gz') as tf:
+        tf.add(folder, arcname='.')
+    return archive
+
+
+def test_zip_snapshot(zip_snapshot):
+    manager = ArchivePersistencyManager(zip_snapshot)
+    assert sorted(manager.get_list_of_filenames()) == sorted(NOTES)
+    assert manager.is_file_existing('1_first_topic_41b4e4f8f.md')
+    assert not manager.is_file_existing('.hidden.md')
+    assert manager.get_string_from_file_content(
+        '1_first_topic_41b4e4f8f.md') == NOTES['1_first_topic_41b4e4f8f.md']
+
+
+def test_tar_snapshot(tar_snapshot):
+    manager = zt.persistency.create_persistency_manager(str(tar_snapshot))
+    assert isinstance(manager, ArchivePersistencyManager)
+    assert sorted(manager.get_list_of_filenames()) == sorted(NOTES)
+    assert manager.get_file_content('1_1_a_Thought_2c3c34ff5.md')[0] == (
+        '# A Thought\n')
+    # the index is built only once per snapshot
+    assert zt.persistency.create_persistency_manager(
+        str(tar_snapshot)) is manager
+
+
+def test_snapshot_is_read_only(zip_snapshot):
+    manager = ArchivePersistencyManager(zip_snapshot)
+    with pytest.raises(PermissionError):
+        manager.overwrite_file_content('1_first_topic_41b4e4f8f.md', 'x')
+    with pytest.raises(PermissionError):
+        manager.rename_file('1_first_topic_41b4e4f8f.md', 'x.md')
+
+
+def test_analyse_snapshot(zip_snapshot):
+    manager = ArchivePersistencyManager(zip_snapshot)
+    analysis = zt.analyse.create_graph_analysis(manager)
+    assert len(analysis.list_of_filenames) == 2
+    assert len(analysis.list_of_explicit_links) == 1
+
+
+def test_zip_from_macos_finder(tmp_path):
+    archive = tmp_path / 'mycelium.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for filename, content in NOTES.items():
+            zf.writestr('mycelium/' + filename, content)
+            zf.writestr('__MACOSX/mycelium/._' + filename, b'resource fork')
+        zf.writestr('.DS_Store', b'finder')
+    manager = ArchivePersistencyManager(archive)
+    assert sorted(manager.get_list_of_filenames()) == sorted(NOTES)
+
+
+@pytest.mark.parametrize('mode', ['w', 'w:gz', 'w:bz2', 'w:xz'])
+def test_tar_compressions(tmp_path, mode):
+    folder = tmp_path / 'mycelium'
+    folder.mkdir()
+    for filename, content in NOTES.items():
+        (folder / filename).write_text(content)
+    archive = tmp_path / 'mycelium.tar'
+    with tarfile.open(archive, mode) as tf:
+        tf.add(folder, arcname='mycelium')
+    manager = ArchivePersistencyManager(archive)
+    # notes are read in any order from the decompressed tar
+    for filename in reversed(sorted(NOTES)):
+        assert manager.get_string_from_file_content(filename) == (
+            NOTES[filename])
+    manager.close()
+
+
+
+def write_tar(archive, notes):
+    with tarfile.open(archive, 'w:gz') as tf:
+        for filename, content in notes.items():
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(filename)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+
+def test_replaced_and_evicted_snapshots_are_closed(tmp_path, monkeypatch):
+    from tools4zettelkasten import archive_persistency
+    monkeypatch.setattr(archive_persistency, 'MAX_OPEN_SNAPSHOTS', 1)
+    first = tmp_path / 'first.tar.gz'
+    write_tar(first, NOTES)
+    manager = archive_persistency.open_snapshot(str(first))
+    # a new snapshot written to the same path replaces the old one
+    write_tar(first, {'2_new_note_abcdef123.md': '# New\n'})
+    os.utime(first, ns=(0, 0))
+    replacing = archive_persistency.open_snapshot(str(first))
+    assert replacing.get_list_of_filenames() == ['2_new_note_abcdef123.md']
+    assert manager._tar.fileobj.closed
+    second = tmp_path / 'second.tar.gz'
+    write_tar(second, NOTES)
+    archive_persistency.open_snapshot(str(second))
+    # the least recently used snapshot is closed with its temporary file
+    assert replacing._tar.fileobj.closed
+    archive_persistency.close_snapshots()
@@ -0,0 +1,48 @@
+# test_chat_store.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import time
+from tools4zettelkasten.chat_store import ChatHistoryStore, window_history
+
+
+def test_history_is_kept_per_conversation(tmp_path):
+    store = ChatHistoryStore(str(tmp_path / "chat.db"))
+    store.append("a", "user", "Frage")
+    store.append("a", "assistant", "Antwort", sources=[{'zettel_id': 'x'}])
+    store.append("b", "user", "andere Frage")
+    assert store.get_history("a") == [
+        {'role': 'user', 'content': 'Frage'},
+        {'role': 'assistant', 'content': 'Antwort',
+         'sources': [{'zettel_id': 'x'}]},
+    ]
+    store.reset("a")
+    assert store.get_history("a") == []
+    assert len(store.get_history("b")) == 1
+
+
+def test_retention_is_bounded(tmp_path, monkeypatch):
+    store = ChatHistoryStore(
+        str(tmp_path / "chat.db"), max_messages=3, ttl_days=1)
+    for number in range(5):
+        store.append("a", "user", str(number))
+    assert [m['content'] for m in store.get_history("a")] == ['2', '3', '4']
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 2 * 24 * 60 * 60)
+    store.append("b", "user", "neu")
+    assert store.get_history("a") == []
+    assert len(store.get_history("b")) == 1
+
+
+def test_window_history_keeps_newest_messages():
+    history = [
+        {'role': 'user', 'content': 'q1'},
+        {'role': 'assistant', 'content': 'a1'},
+        {'role': 'user', 'content': 'q2'},
+        {'role': 'assistant', 'content': 'a2'},
+    ]
+    assert window_history(history, max_messages=3, max_chars=100) == (
+        history[2:])
+    assert window_history(history, max_messages=10, max_chars=3) == []
+    assert window_history(history, max_messages=10, max_chars=4) == (
+        history[2:])
@@ -113,6 +113,52 @@ def test_batch_rename_aborts_on_decline(tmp_path, monkeypatch):
     assert not (test_dir / "new.md").exists()
 
 
+def test_batch_rename_skips_commands_outdated_at_the_lock(
+        tmp_path, monkeypatch):
+    (tmp_path / "1_note.md").write_text("content")
+    persistency_manager = zt.persistency.PersistencyManager(tmp_path)
+
+    def rename_elsewhere(questions):
+        # e.g. the MCP server renames the note while the user is asked
+        (tmp_path / "1_note.md").rename(tmp_path / "2_note.md")
+        return {'proceed': True}
+    monkeypatch.setattr('tools4zettelkasten.cli.prompt', rename_elsewhere)
+    zt.cli.batch_rename_from(zt.reorganize.attach_missing_ids,
+                             persistency_manager)
+    assert [path.name for path in tmp_path.iterdir()] == ["2_note.md"]
+
+
+def test_batch_rename_from_renames_unchanged_files(tmp_path, monkeypatch):
+    (tmp_path / "1_note.md").write_text("content")
+    persistency_manager = zt.persistency.PersistencyManager(tmp_path)
+    monkeypatch.setattr('tools4zettelkasten.cli.prompt',
+                        lambda x: {'proceed': True})
+    zt.cli.batch_rename_from(zt.reorganize.attach_missing_ids,
+                             persistency_manager)
+    [renamed] = [path.name for path in tmp_path.iterdir()]
+    assert renamed.startswith("1_note_") and renamed != "1_note_.md"
+
+
+def test_batch_replace_skips_commands_outdated_at_the_lock(
+        tmp_path, monkeypatch):
+    (tmp_path / "2_target_bbbbbbbbb.md").write_text("# Target\n")
+    source = tmp_path / "1_source_aaaaaaaaa.md"
+    source.write_text("# Source\n[Target](1_target_bbbbbbbbb.md)\n")
+    persistency_manager = zt.persistency.PersistencyManager(tmp_path)
+
+    def rename_elsewhere(questions):
+        # the confirmed command would link to 2_target_bbbbbbbbb.md
+        (tmp_path / "2_target_bbbbbbbbb.md").rename(
+            tmp_path / "3_target_bbbbbbbbb.md")
+        return {'proceed': True}
+    monkeypatch.setattr('tools4zettelkasten.cli.prompt', rename_elsewhere)
+    zt.cli.batch_replace_from(
+        zt.reorganize.generate_list_of_link_correction_commands,
+        persistency_manager)
+    assert source.read_text() == (
+        "# Source\n[Target](1_target_bbbbbbbbb.md)\n")
+
+
 def test_batch_rename_empty_list(tmp_path, monkeypatch):
     """Test that batch_rename handles empty command list gracefully"""
     test_dir = tmp_path / "subdir"
@@ -278,3 +324,70 @@ def test_get_env_var_status_not_set(monkeypatch):
     is_set, value = zt.cli.get_env_var_status('NONEXISTENT_VAR')
     assert is_set is False
     assert value is None
+
+
+def test_start_production_passes_server_options(monkeypatch):
+    from click.testing import CliRunner
+    calls = []
+    monkeypatch.setattr(
+        zt.cli.fv, 'run_production_server',
+        lambda **kwargs: calls.append(kwargs))
+    result = CliRunner().invoke(zt.cli.start, [
+        '--production', '--host', '0.0.0.0', '--port', '8080',
+        '--workers', '4', '--server', 'gunicorn', '--no-warm-up'])
+    assert result.exit_code == 0
+    assert calls == [{
+        'host': '0.0.0.0', 'port': 8080, 'workers': 4, 'threads': 8,
+        'server': 'gunicorn', 'warm_up': False}]
+
+
+def test_production_server_preloads_note_index(tmp_path, monkeypatch):
+    import sys
+    import types
+    (tmp_path / '01_Note_abc123456.md').write_text('# Note\n')
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN', str(tmp_path))
+    served = []
+    fake_waitress = types.SimpleNamespace(
+        serve=lambda app, **kwargs: served.append(kwargs))
+    monkeypatch.setitem(sys.modules, 'waitress', fake_waitress)
+    zt.note_index.clear_note_indexes()
+    zt.flask_views.run_production_server(host='0.0.0.0', threads=4)
+    assert served == [{'host': '0.0.0.0', 'port': 5001, 'threads': 4}]
+    assert zt.note_index._indexes[str(tmp_path)].order == [
+        '01_Note_abc123456.md']
+
+
+def test_gunicorn_workers_do_not_inherit_the_database(tmp_path, monkeypatch):
+    from tools4zettelkasten import sqlite_persistency
+    database = tmp_path / 'notes.db'
+    manager = sqlite_persistency.SqlitePersistencyManager(database)
+    manager.overwrite_file_content('01_Note_abc123456.md', '# Note\n')
+    manager.close()
+    location = 'sqlite://' + str(database)
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN', location)
+    open_at_fork = []
+    monkeypatch.setattr(
+        zt.flask_views, '_run_gunicorn',
+        lambda *args: open_at_fork.append(
+            dict(sqlite_persistency._databases)))
+    zt.note_index.clear_note_indexes()
+    zt.flask_views.run_production_server(server='gunicorn', workers=2)
+    assert open_at_fork == [{}]
+    # the index built before the fork is kept
+    [index] = zt.note_index._indexes.values()
+    assert index.order == ['01_Note_abc123456.md']
+
+
+def test_debug_server_warms_up_only_in_the_reloader_child(monkeypatch):
+    warmed_up = []
+    monkeypatch.setattr(
+        zt.flask_views, 'warm_up_rag', lambda: warmed_up.append(True))
+    monkeypatch.setattr(zt.flask_views.app, 'run', lambda **kwargs: None)
+    # run_flask_server switches on the debug mode
+    monkeypatch.setattr(zt.flask_views.app, 'debug', False)
+    monkeypatch.delenv('WERKZEUG_RUN_MAIN', raising=False)
+    zt.flask_views.run_flask_server(warm_up=True)
+    assert warmed_up == []
+    monkeypatch.setenv('WERKZEUG_RUN_MAIN', 'true')
+    zt.flask_views.run_flask_server(warm_up=True)
+    assert warmed_up == [True]
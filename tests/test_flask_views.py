@@ -19,12 +19,20 @@ def zettelkasten_dir(tmp_path):
 
 
 @pytest.fixture
-def client(zettelkasten_dir):
+def client(zettelkasten_dir, tmp_path_factory, monkeypatch):
     """Create a test client for the Flask app with isolated Zettelkasten."""
     from tools4zettelkasten.flask_views import app
     from tools4zettelkasten import settings as st
     original_zettelkasten = st.ZETTELKASTEN
     st.ZETTELKASTEN = str(zettelkasten_dir)
+    monkeypatch.setattr(
+        st, 'CHAT_HISTORY_PATH',
+        str(tmp_path_factory.mktemp('chat') / 'chat_history.db'))
+    from tools4zettelkasten import flask_views
+    from tools4zettelkasten.graph_layout import LayoutCache
+    monkeypatch.setattr(
+        flask_views, 'layout_cache',
+        LayoutCache(str(tmp_path_factory.mktemp('layouts'))))
     app.config['TESTING'] = True
     app.config['WTF_CSRF_ENABLED'] = False
     app.config['SECRET_KEY'] = 'test-secret-key'
@@ -367,3 +375,204 @@ def test_edit_view_has_fixed_footer(client):
             response = client.get(f'/edit/{note_filename}')
             html = response.data.decode('utf-8')
             assert 'edit-footer' in html or 'fixed' in html
+
+
+# Tests for the streaming chat endpoint
+
+@pytest.fixture
+def fake_rag(monkeypatch):
+    """Replace vector search and LLM by fakes."""
+    import tools4zettelkasten.rag as rag
+
+    class FakeStore:
+        def search(self, query, top_k=None):
+            return [rag.SearchResult(
+                zettel_id='abc123456', title='Test Note', ordering='01',
+                filename='01_Test_Note_abc123456.md', content='# Test Note',
+                score=0.9)]
+
+    def fake_chat_completion(query, search_results, conversation_history,
+                             stream=False):
+        return iter(['Hallo', ' Welt'])
+
+    monkeypatch.setattr(rag, 'get_vector_store', lambda: FakeStore())
+    monkeypatch.setattr(rag, 'chat_completion', fake_chat_completion)
+    return rag
+
+
+def test_chat_stream_sends_sources_before_tokens(client, fake_rag):
+    response = client.get('/chat/stream?query=Frage')
+    assert response.mimetype == 'text/event-stream'
+    body = response.data.decode('utf-8')
+    assert body.index('event: sources') < body.index('event: token')
+    assert body.index('"Hallo"') < body.index('" Welt"')
+    assert body.rstrip().endswith('event: done\ndata: {}')
+    assert '01_Test_Note_abc123456.md' in body
+
+
+def test_chat_stream_stores_exchange_on_server(client, fake_rag):
+    client.get('/chat/stream?query=Frage').data
+    with client.session_transaction() as session:
+        assert list(session) == ['chat_id']
+    html = client.get('/chat').data.decode('utf-8')
+    assert 'Hallo Welt' in html
+    assert 'chat/stream' in html
+    client.post('/chat/reset')
+    assert 'Hallo Welt' not in client.get('/chat').data.decode('utf-8')
+
+
+# Tests for conditional GET and compression
+
+def test_show_md_file_answers_304_for_matching_etag(client):
+    response = client.get('/01_Test_Note_abc123456.md')
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get(
+        '/01_Test_Note_abc123456.md', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_show_md_file_etag_changes_with_content(client, zettelkasten_dir):
+    etag = client.get('/01_Test_Note_abc123456.md').headers['ETag']
+    (zettelkasten_dir / '01_Test_Note_abc123456.md').write_text(
+        '# Test Note\n\nChanged.\n')
+    response = client.get(
+        '/01_Test_Note_abc123456.md', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Changed.' in response.data.decode('utf-8')
+
+
+def test_index_answers_304_for_matching_etag(client):
+    etag = client.get('/').headers['ETag']
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_html_is_gzip_compressed_when_accepted(client, monkeypatch):
+    import gzip
+    from tools4zettelkasten import flask_views
+    monkeypatch.setattr(flask_views, 'brotli', None)
+    plain = client.get('/01_Test_Note_abc123456.md').data
+    response = client.get(
+        '/01_Test_Note_abc123456.md', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == plain
+
+
+# Tests for the graph laid out in the browser
+
+def test_api_graph_returns_nodes_and_edges(client):
+    data = client.get('/api/graph').get_json()
+    assert data['total_nodes'] == 2
+    assert data['link_types'] == ['structure', 'explicit']
+    filenames = [node[0] for node in data['nodes']]
+    assert '01_Test_Note_abc123456.md' in filenames
+    position = filenames.index('01_Test_Note_abc123456.md')
+    sub_position = filenames.index('01_01_Sub_Note_def123456.md')
+    assert sorted(data['edges']) == sorted([
+        [position, sub_position, 0], [sub_position, position, 1]])
+
+
+def test_api_graph_filters_link_type(client):
+    data = client.get('/api/graph?link_type=explicit').get_json()
+    assert [edge[2] for edge in data['edges']] == [1]
+    assert client.get('/api/graph?link_type=other').status_code == 400
+
+
+def test_api_graph_pages_contain_the_edges_of_their_nodes(client):
+    pages = [
+        client.get(f'/api/graph?per_page=1&page={page}').get_json()
+        for page in (1, 2)]
+    assert pages[0]['pages'] == 2
+    assert [len(page['nodes']) for page in pages] == [1, 1]
+    for page in pages:
+        assert all(edge[0] == page['offset'] for edge in page['edges'])
+    assert sum(len(page['edges']) for page in pages) == 2
+
+
+def test_api_graph_answers_304_for_matching_etag(client):
+    etag = client.get('/api/graph').headers['ETag']
+    response = client.get('/api/graph', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_graph_view_loads_the_api(client):
+    html = client.get('/graph?topic=01').data.decode('utf-8')
+    assert 'force-graph' in html
+    assert '/api/graph' in html
+    assert '"01"' in html
+
+
+def test_graph_view_links_notes_below_the_script_root(client):
+    html = client.get(
+        '/graph', environ_overrides={'SCRIPT_NAME': '/notes'}
+    ).data.decode('utf-8')
+    assert 'const noteUrl = "/notes/";' in html
+
+
+# Tests for the lazily loaded tree of the start page
+
+def test_index_shows_only_the_top_level(client):
+    html = client.get('/').data.decode('utf-8')
+    assert 'href="/01_Test_Note_abc123456.md"' in html
+    assert '01_01_Sub_Note_def123456.md' not in html
+    assert '(1)' in html
+
+
+def test_api_tree_returns_children_with_subtree_sizes(client):
+    data = client.get('/api/tree').get_json()
+    assert data['total'] == 1
+    assert data['children'][0]['filename'] == '01_Test_Note_abc123456.md'
+    assert data['children'][0]['descendants'] == 1
+    data = client.get('/api/tree?ordering=01').get_json()
+    assert [node['filename'] for node in data['children']] == [
+        '01_01_Sub_Note_def123456.md']
+    assert data['children'][0]['url'] == '/01_01_Sub_Note_def123456.md'
+
+
+def test_api_tree_pages_large_sibling_groups(client, zettelkasten_dir):
+    for number in range(2, 6):
+        filename = f'01_0{number}_Note_abc12345{number}.md'
+        (zettelkasten_dir / filename).write_text('# Note\n')
+    data = client.get('/api/tree?ordering=01&offset=2&limit=2').get_json()
+    assert data['total'] == 5
+    assert [node['ordering'] for node in data['children']] == [
+        '01_03', '01_04']
+
+
+# Tests for the title suggestions
+
+def test_api_suggest_returns_fuzzy_matches(client):
+    suggestions = client.get('/api/suggest?q=sub nte').get_json()
+    assert suggestions[0]['filename'] == '01_01_Sub_Note_def123456.md'
+    assert suggestions[0]['title'] == 'Sub Note'
+    assert suggestions[0]['url'] == '/01_01_Sub_Note_def123456.md'
+
+
+def test_saving_a_note_updates_the_suggestions(client):
+    client.post(
+        '/edit/01_Test_Note_abc123456.md',
+        data={'pagedown': '# Kaffeemaschine\n', 'submit': 'Save'})
+    suggestions = client.get('/api/suggest?q=kafeemaschine').get_json()
+    assert suggestions[0]['title'] == 'Kaffeemaschine'
+
+
+def test_edit_view_has_link_search(client):
+    html = client.get('/edit/01_Test_Note_abc123456.md').data.decode('utf-8')
+    assert 'link-search' in html
+    assert '/api/suggest' in html
+
+
+def test_chat_stream_uses_the_selected_search_mode(client, fake_rag,
+                                                   monkeypatch):
+    modes = []
+    monkeypatch.setattr(
+        fake_rag, 'search',
+        lambda query, top_k=None, mode=None: modes.append(mode) or [])
+    client.get('/chat/stream?query=Frage&mode=hybrid').data
+    client.get('/chat/stream?query=Frage&mode=unknown').data
+    assert modes == ['hybrid', zt.settings.RAG_SEARCH_MODE]
+    assert '<option value="hybrid"' in client.get('/chat').data.decode(
+        'utf-8')
@@ -0,0 +1,131 @@
+# test_graph_export.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import io
+import json
+import xml.etree.ElementTree as ET
+import pytest
+from .context import tools4zettelkasten as zt
+from tools4zettelkasten import analyse as an
+from tools4zettelkasten import graph_export as ge
+from tools4zettelkasten.persistency import PersistencyManager
+
+TOPIC = '01_Topic_&_More_aaaaaaaaa.md'
+DETAIL = '01_01_Detail_bbbbbbbbb.md'
+OTHER = '02_Other_ccccccccc.md'
+
+
+@pytest.fixture
+def analysis(tmp_path):
+    notes = {
+        TOPIC: '# Topic\n',
+        DETAIL: f'# Detail\n[Other]({OTHER})\n[Gone](03_Gone_ddddddddd.md)\n',
+        OTHER: '# Other\n',
+    }
+    for filename, content in notes.items():
+        (tmp_path / filename).write_text(content)
+    return an.create_graph_analysis(PersistencyManager(tmp_path))
+
+
+def export(format, analysis):
+    output = io.StringIO()
+    ge.write_export(
+        format, analysis.list_of_filenames, analysis.link_table, output)
+    return output.getvalue()
+
+
+def test_graphml_export(analysis):
+    namespace = {'g': 'http://graphml.graphdrawing.org/xmlns'}
+    root = ET.fromstring(export('graphml', analysis))
+    nodes = root.findall('g:graph/g:node', namespace)
+    assert sorted(node.get('id') for node in nodes) == sorted(
+        [TOPIC, DETAIL, OTHER])
+    topic = next(node for node in nodes if node.get('id') == TOPIC)
+    assert topic.find("g:data[@key='title']", namespace).text == 'Topic & More'
+    edges = root.findall('g:graph/g:edge', namespace)
+    # the link to the missing note is not exported
+    assert sorted(
+        (edge.get('source'), edge.get('target'),
+         edge.find("g:data[@key='type']", namespace).text)
+        for edge in edges) == [
+            (DETAIL, OTHER, 'explicit'), (TOPIC, DETAIL, 'structure')]
+
+
+def test_json_export_is_node_link_data(analysis):
+    graph = json.loads(export('json', analysis))
+    assert graph['directed'] is True
+    assert {node['id']: node['note_id'] for node in graph['nodes']} == {
+        TOPIC: 'aaaaaaaaa', DETAIL: 'bbbbbbbbb', OTHER: 'ccccccccc'}
+    assert graph['links'] == [
+        {'source': TOPIC, 'target': DETAIL, 'type': 'structure',
+         'description': zt.settings.DIRECT_DAUGHTER_ZETTEL},
+        {'source': DETAIL, 'target': OTHER, 'type': 'explicit',
+         'description': 'Other'}]
+
+
+def test_npz_export_round_trip(analysis, tmp_path):
+    pytest.importorskip('numpy')
+    pytest.importorskip('scipy')
+    path = tmp_path / 'zettelkasten.npz'
+    ge.write_export(
+        'npz', analysis.list_of_filenames, analysis.link_table, path)
+    graph = ge.load_npz(path)
+    assert graph['filenames'] == analysis.list_of_filenames
+    position = {
+        filename: index for index, filename in enumerate(graph['filenames'])}
+    assert graph['explicit'].nnz == 1
+    assert graph['explicit'][position[DETAIL], position[OTHER]] == 1
+    assert graph['structure'][position[TOPIC], position[DETAIL]] == 1
+
+
+def test_cli_export(analysis, tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN', str(tmp_path))
+    export_file = tmp_path / 'graph.json'
+    result = CliRunner().invoke(
+        zt.cli.analyse,
+        ['--export', 'json', '--export-file', str(export_file)])
+    assert result.exit_code == 0
+    assert 'Graph exported to' in result.output
+    assert len(json.loads(export_file.read_text())['nodes']) == 3
+
+
+def test_cli_export_npz_adds_the_suffix(analysis, tmp_path, monkeypatch):
+    pytest.importorskip('numpy')
+    pytest.importorskip('scipy')
+    from click.testing import CliRunner
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN', str(tmp_path))
+    export_file = tmp_path / 'graph'
+    result = CliRunner().invoke(
+        zt.cli.analyse,
+        ['--export', 'npz', '--export-file', str(export_file)])
+    assert result.exit_code == 0
+    assert 'Graph exported to ' + str(export_file) + '.npz' in result.output
+    assert ge.load_npz(str(export_file) + '.npz')['filenames']
+
+
+def invoke_export_to_stdout(format, tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN', str(tmp_path))
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN_INPUT', str(tmp_path))
+    monkeypatch.setattr(zt.settings, 'ZETTELKASTEN_IMAGES', str(tmp_path))
+    result = CliRunner(mix_stderr=False).invoke(
+        zt.cli.messages,
+        ['analyse', '--export', format, '--export-file', '-'])
+    assert result.exit_code == 0
+    return result.stdout_bytes
+
+
+def test_cli_export_to_stdout_is_json(analysis, tmp_path, monkeypatch):
+    graph = json.loads(
+        invoke_export_to_stdout('json', tmp_path, monkeypatch))
+    assert len(graph['nodes']) == 3
+
+
+def test_cli_export_to_stdout_is_npz(analysis, tmp_path, monkeypatch):
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('scipy')
+    output = invoke_export_to_stdout('npz', tmp_path, monkeypatch)
+    with np.load(io.BytesIO(output)) as arrays:
+        assert len(arrays['filenames']) == 3
@@ -0,0 +1,77 @@
+# test_graph_layout.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import json
+from graphviz import Digraph
+from tools4zettelkasten import graph_layout as gl
+
+
+class FakeLayoutGraph(Digraph):
+    """places every node which is not pinned at (100, 100)"""
+
+    pipes = []
+
+    def pipe(self, format=None, engine=None, **kwargs):
+        FakeLayoutGraph.pipes.append((format, self.engine, self.source))
+        if format == 'svg':
+            return b'<svg></svg>'
+        objects = []
+        for line in self.body:
+            name = line.split()[0]
+            if 'pos=' in line:
+                x, y = line.split('pos="')[1].split('!')[0].split(',')
+                pos = f'{x},{y}'
+            elif any(o['name'] == name for o in objects):
+                continue
+            else:
+                pos = '100,100'
+            objects = [o for o in objects if o['name'] != name]
+            objects.append({'name': name, 'pos': pos})
+        return json.dumps({'objects': objects}).encode('utf-8')
+
+
+def create_graph(*node_ids):
+    dot = FakeLayoutGraph()
+    for node_id in node_ids:
+        dot.node(node_id, node_id)
+    return dot
+
+
+def test_layout_cache_round_trip(tmp_path):
+    cache = gl.LayoutCache(str(tmp_path / 'layouts'))
+    assert cache.load('/notes') == {}
+    cache.save('/notes', {'a': [1.0, 2.0]})
+    assert cache.load('/notes') == {'a': [1.0, 2.0]}
+    assert cache.load('/other') == {}
+
+
+def test_pin_nodes_fixes_positions():
+    dot = create_graph('a', 'b')
+    pinned = gl.pin_nodes(dot, {'a': [1.5, 2.0]})
+    assert pinned.engine == 'neato'
+    assert 'a [pos="1.5,2.0!"]' in pinned.source
+    assert 'pos' not in dot.source
+
+
+def test_only_new_nodes_are_placed(tmp_path):
+    cache = gl.LayoutCache(str(tmp_path))
+    cache.save('/notes', {'a': [1.0, 2.0], 'gone': [5.0, 5.0]})
+    FakeLayoutGraph.pipes = []
+    svg = gl.render_svg_with_stable_layout(
+        create_graph('a', 'b'), ['a', 'b'], cache, '/notes')
+    assert svg == '<svg></svg>'
+    # the stored node keeps its place, the removed node is forgotten
+    assert cache.load('/notes') == {'a': [1.0, 2.0], 'b': [100.0, 100.0]}
+    layout_source = FakeLayoutGraph.pipes[0][2]
+    assert 'a [pos="1.0,2.0!"]' in layout_source
+    assert 'gone' not in layout_source
+
+
+def test_unchanged_graph_is_not_laid_out_again(tmp_path):
+    cache = gl.LayoutCache(str(tmp_path))
+    cache.save('/notes', {'a': [1.0, 2.0], 'b': [3.0, 4.0]})
+    FakeLayoutGraph.pipes = []
+    gl.render_svg_with_stable_layout(
+        create_graph('a', 'b'), ['a', 'b'], cache, '/notes')
+    assert [format for format, _, _ in FakeLayoutGraph.pipes] == ['svg']
@@ -0,0 +1,46 @@
+# test_graph_metrics.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import pytest
+from tools4zettelkasten.reorganize import Link
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+from tools4zettelkasten import graph_metrics as gm  # noqa: E402
+
+FILENAMES = [
+    '01_A_aaaaaaaaa.md', '02_B_bbbbbbbbb.md', '03_C_ccccccccc.md',
+    '04_D_ddddddddd.md', '05_E_eeeeeeeee.md']
+
+
+def link(source, target):
+    return Link(FILENAMES[source], 'see', FILENAMES[target])
+
+
+def test_pagerank_of_a_cycle_is_uniform():
+    metrics = gm.compute_graph_metrics(
+        FILENAMES[:3], [link(0, 1), link(1, 2), link(2, 0)])
+    assert np.allclose(metrics.pagerank, 1 / 3)
+    assert metrics.number_of_strong_components == 1
+
+
+def test_orphans_dead_ends_and_components():
+    links = [link(0, 1), link(0, 2), link(1, 2), link(0, 1),
+             Link(FILENAMES[3], 'see', 'missing.md')]
+    metrics = gm.compute_graph_metrics(FILENAMES, links)
+    assert metrics.orphans == [FILENAMES[3], FILENAMES[4]]
+    assert metrics.dead_ends == [FILENAMES[2]]
+    assert list(metrics.in_degree) == [0, 1, 2, 0, 0]
+    assert list(metrics.out_degree) == [2, 1, 0, 0, 0]
+    assert metrics.number_of_weak_components == 3
+    assert metrics.number_of_strong_components == 5
+    assert metrics.top(metrics.pagerank, 1)[0][0] == FILENAMES[2]
+    assert metrics.top(metrics.hub_score, 1)[0][0] == FILENAMES[0]
+    summary = gm.summarize_graph_metrics(metrics, top=2)
+    # the parallel links from A to B are one pair
+    assert summary['connected_pairs'] == 3
+    assert summary['largest_weak_component'] == 3
+    # the parallel links from A make B the strongest authority
+    assert [entry['id'] for entry in summary['authorities']] == [
+        'bbbbbbbbb', 'ccccccccc']
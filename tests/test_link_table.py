@@ -0,0 +1,72 @@
+# test_link_table.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import pytest
+from tools4zettelkasten import link_table
+from tools4zettelkasten.link_table import LinkTable, STRUCTURE, EXPLICIT
+from tools4zettelkasten.reorganize import Link
+
+A = '01_A_aaaaaaaaa.md'
+B = '01_01_B_bbbbbbbbb.md'
+C = '01_02_C_ccccccccc.md'
+D = '02_D_ddddddddd.md'
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def selection(request, monkeypatch):
+    """runs a test with numpy masks and with the pure python fallback"""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(link_table, 'np', None)
+    return request.param
+
+
+def create_table():
+    table = LinkTable()
+    table.extend([Link(A, 'detail / digression', B),
+                  Link(B, 'train of thoughts', C)], STRUCTURE)
+    table.extend([Link(A, 'see', D), Link(C, 'see', B),
+                  Link(D, 'see', 'missing.md')], EXPLICIT)
+    return table
+
+
+def test_filenames_and_descriptions_are_interned():
+    table = create_table()
+    assert len(table) == 5
+    assert table.notes == [A, B, C, D, 'missing.md']
+    assert table.descriptions == [
+        'detail / digression', 'train of thoughts', 'see']
+    assert table.find_note_id(C) == 2
+    assert table.find_note_id('unknown.md') is None
+
+
+def test_to_links_keeps_the_order():
+    links = [Link(A, 'see', D), Link(C, 'see', B)]
+    assert LinkTable.from_links(links).to_links() == links
+
+
+def test_select_by_kind(selection):
+    table = create_table()
+    assert table.select(kind=STRUCTURE).to_links() == [
+        Link(A, 'detail / digression', B), Link(B, 'train of thoughts', C)]
+    assert len(table.select(kind=EXPLICIT)) == 3
+
+
+def test_select_by_topic_and_filenames(selection):
+    table = create_table()
+    assert table.select(topic='01').to_links() == [
+        Link(A, 'detail / digression', B), Link(B, 'train of thoughts', C),
+        Link(C, 'see', B)]
+    assert table.select(kind=EXPLICIT, topic='01').to_links() == [
+        Link(C, 'see', B)]
+    selected = table.select(filenames=[A, B, D])
+    assert selected.to_links() == [
+        Link(A, 'detail / digression', B), Link(A, 'see', D)]
+    # selected tables share the interned filenames
+    assert selected.notes is table.notes
+
+
+def test_select_from_empty_table(selection):
+    assert len(LinkTable().select(kind=EXPLICIT, topic='01')) == 0
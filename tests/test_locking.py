@@ -0,0 +1,116 @@
+# test_locking.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import threading
+import time
+import pytest
+from .context import tools4zettelkasten as zt
+from tools4zettelkasten.locking import LockManager, ReadWriteLock
+
+
+@pytest.fixture
+def lock_manager(tmp_path):
+    return LockManager(
+        tmp_path / "mycelium", lock_directory=tmp_path / "locks")
+
+
+def test_lock_directory_is_created_on_first_use(tmp_path):
+    lock_manager = LockManager(
+        tmp_path / "mycelium", lock_directory=tmp_path / "locks")
+    assert not (tmp_path / "locks").exists()
+    with lock_manager.shared():
+        pass
+    assert (tmp_path / "locks").is_dir()
+
+
+def test_readers_do_not_block_each_other(lock_manager):
+    inside = []
+    both_inside = threading.Event()
+
+    def reader():
+        with lock_manager.shared():
+            inside.append(1)
+            if len(inside) == 2:
+                both_inside.set()
+            assert both_inside.wait(timeout=5)
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert both_inside.is_set()
+
+
+def test_exclusive_lock_blocks_readers(lock_manager):
+    events = []
+    writer_inside = threading.Event()
+
+    def writer():
+        with lock_manager.exclusive():
+            writer_inside.set()
+            time.sleep(0.2)
+            events.append('writer done')
+
+    def reader():
+        writer_inside.wait(timeout=5)
+        with lock_manager.shared():
+            events.append('reader')
+
+    threads = [
+        threading.Thread(target=writer), threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert events == ['writer done', 'reader']
+
+
+def test_locks_are_reentrant(lock_manager):
+    with lock_manager.exclusive():
+        with lock_manager.shared():
+            with lock_manager.exclusive():
+                pass
+    with lock_manager.shared():
+        with lock_manager.shared():
+            with pytest.raises(RuntimeError):
+                with lock_manager.exclusive():
+                    pass
+
+
+def test_file_lock_serializes_edits(lock_manager):
+    active = []
+    overlaps = []
+
+    def edit():
+        with lock_manager.shared(), lock_manager.file_lock("a.md"):
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(1)
+            time.sleep(0.05)
+            active.pop()
+
+    threads = [threading.Thread(target=edit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+
+
+def test_in_process_read_write_lock():
+    lock = ReadWriteLock()
+    lock.acquire('shared')
+    lock.acquire('shared')
+    lock.release('shared')
+    lock.release('shared')
+    lock.acquire('exclusive')
+    lock.release('exclusive')
+
+
+def test_persistency_manager_has_locks(tmp_path):
+    persistency_manager = zt.persistency.PersistencyManager(tmp_path)
+    with persistency_manager.locks.exclusive():
+        persistency_manager.overwrite_file_content("a.md", "content")
+    assert (tmp_path / "a.md").read_text() == "content"
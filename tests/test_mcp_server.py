@@ -138,7 +138,8 @@ def test_mcp_tools_registered():
         'list_input_files', 'preview_staging', 'stage_file',
         'get_zettel', 'search_zettel', 'list_zettel', 'get_statistics',
         'get_links', 'find_related', 'analyze_structure',
-        'preview_reorganize', 'execute_reorganize'
+        'preview_reorganize', 'execute_reorganize', 'graph_metrics',
+        'find_by_title', 'semantic_search'
     ]
     mcp_instance = mcp_module.mcp
     tool_list = asyncio.get_event_loop().run_until_complete(mcp_instance.list_tools())
@@ -156,3 +157,39 @@ def test_mcp_server_no_importlib():
     server_path = Path(__file__).parent.parent / 'tools4zettelkasten' / 'mcp_server.py'
     server_code = server_path.read_text()
     assert 'importlib' not in server_code
+
+
+@requires_mcp
+def test_search_zettel_ranks_and_highlights(tmp_path, monkeypatch):
+    import tools4zettelkasten.settings as st
+    from tools4zettelkasten import search_index
+    (tmp_path / '01_Other_aaaaaaaaa.md').write_text(
+        '# Other\nA note mentioning bm25 once among many other words.\n')
+    (tmp_path / '02_Ranking_bbbbbbbbb.md').write_text(
+        '# Ranking\nBM25 ranking: bm25 scores.\n')
+    monkeypatch.setattr(st, 'ZETTELKASTEN', str(tmp_path))
+    monkeypatch.setattr(st, 'SEARCH_INDEX_PATH', '')
+    search_index.clear_search_indexes()
+    results = mcp_module.search_zettel('bm25')
+    assert [result['filename'] for result in results] == [
+        '02_Ranking_bbbbbbbbb.md', '01_Other_aaaaaaaaa.md']
+    assert '**BM25** ranking' in results[0]['snippet']
+    assert results[0]['score'] > results[1]['score']
+
+
+@requires_mcp
+def test_read_tools_wait_for_exclusive_lock(tmp_path, monkeypatch):
+    import threading
+    import tools4zettelkasten.settings as st
+    (tmp_path / '01_Note_aaaaaaaaa.md').write_text('# Note\ntext\n')
+    monkeypatch.setattr(st, 'ZETTELKASTEN', str(tmp_path))
+    results = []
+    manager = mcp_module.get_zettelkasten_manager()
+    with manager.locks.exclusive():
+        reader = threading.Thread(
+            target=lambda: results.append(mcp_module.list_zettel()))
+        reader.start()
+        reader.join(timeout=0.2)
+        assert results == []
+    reader.join(timeout=5)
+    assert results[0][0]['filename'] == '01_Note_aaaaaaaaa.md'
@@ -0,0 +1,89 @@
+# test_note_index.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+from tools4zettelkasten import note_index
+from tools4zettelkasten.persistency import PersistencyManager
+from tools4zettelkasten.sqlite_persistency import SqlitePersistencyManager
+
+
+def create_notes(directory):
+    for filename in ('01_Start_abc123456.md', '01_01_Detail_def123456.md',
+                     '02_Next_ghi123456.md'):
+        (directory / filename).write_text('# ' + filename + '\n')
+
+
+def test_note_index_maps_neighbours():
+    index = note_index.NoteIndex(None, ['a.md', 'b.md', 'c.md'])
+    assert index.get_adjacent_files('b.md') == ('a.md', 'c.md')
+    assert index.get_adjacent_files('a.md') == (None, 'b.md')
+    assert index.get_adjacent_files('x.md') == (None, None)
+
+
+def test_note_index_is_cached_until_files_change(tmp_path, monkeypatch):
+    create_notes(tmp_path)
+    note_index.clear_note_indexes()
+    builds = []
+    build_note_index = note_index.build_note_index
+
+    def counting_build(*args):
+        builds.append(1)
+        return build_note_index(*args)
+
+    monkeypatch.setattr(note_index, 'build_note_index', counting_build)
+    persistencyManager = PersistencyManager(tmp_path)
+    index = note_index.get_note_index(persistencyManager)
+    assert index.order == [
+        '01_Start_abc123456.md', '01_01_Detail_def123456.md',
+        '02_Next_ghi123456.md']
+    assert note_index.get_note_index(PersistencyManager(tmp_path)) is index
+    assert len(builds) == 1
+    persistencyManager.rename_file(
+        '02_Next_ghi123456.md', '03_Next_ghi123456.md')
+    index = note_index.get_note_index(persistencyManager)
+    assert index.order[-1] == '03_Next_ghi123456.md'
+    assert len(builds) == 2
+
+
+def test_sqlite_fingerprint_changes_only_with_filenames(tmp_path):
+    persistencyManager = SqlitePersistencyManager(tmp_path / "notes.db")
+    persistencyManager.overwrite_file_content('01_A_abc123456.md', '# A\n')
+    fingerprint = persistencyManager.get_directory_fingerprint()
+    persistencyManager.overwrite_file_content('01_A_abc123456.md', '# B\n')
+    assert persistencyManager.get_directory_fingerprint() == fingerprint
+    persistencyManager.rename_file('01_A_abc123456.md', '02_A_abc123456.md')
+    assert persistencyManager.get_directory_fingerprint() != fingerprint
+
+
+def test_note_index_children_and_subtree_sizes():
+    index = note_index.NoteIndex(None, [
+        '1_A_aaaaaaaaa.md', '1_1_B_bbbbbbbbb.md', '1_1_1_C_ccccccccc.md',
+        '1_3_1_D_ddddddddd.md', '2_E_eeeeeeeee.md'])
+    assert index.get_children() == ['1_A_aaaaaaaaa.md', '2_E_eeeeeeeee.md']
+    # 1_3 does not exist, so 1_3_1 is a child of 1
+    assert index.get_children('1') == [
+        '1_1_B_bbbbbbbbb.md', '1_3_1_D_ddddddddd.md']
+    assert index.get_children('1_1') == ['1_1_1_C_ccccccccc.md']
+    assert index.get_children('2') == []
+    assert index.count_descendants('1') == 3
+    assert index.count_descendants('1_1') == 1
+    assert index.count_descendants('2') == 0
+
+
+def test_note_index_notices_changes_missed_by_the_fingerprint(
+        tmp_path, monkeypatch):
+    create_notes(tmp_path)
+    note_index.clear_note_indexes()
+    persistencyManager = PersistencyManager(tmp_path)
+    # e.g. a rename within the same tick of the directory mtime
+    monkeypatch.setattr(
+        persistencyManager, 'get_directory_fingerprint', lambda: 'same')
+    index = note_index.get_note_index(persistencyManager)
+    persistencyManager.rename_file(
+        '02_Next_ghi123456.md', '03_Next_ghi123456.md')
+    assert note_index.get_note_index(persistencyManager) is index
+    monkeypatch.setattr(note_index, 'REFRESH_INTERVAL', 0)
+    index = note_index.get_note_index(persistencyManager)
+    assert index.order[-1] == '03_Next_ghi123456.md'
+    # an unchanged list of filenames keeps the index
+    assert note_index.get_note_index(persistencyManager) is index
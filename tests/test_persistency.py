@@ -2,6 +2,7 @@
 # Copyright (c) 2021 Dr. Rupert Rebentisch
 # Licensed under the MIT license
 
+import threading
 from .context import tools4zettelkasten as zt
 
 
@@ -119,3 +120,72 @@ def test_overwrite_file_content(tmp_path):
     zt.persistency.overwrite_file_content(test_dir, "test.md", "def")
     content_read = zt.persistency.get_string_from_file_content(test_dir, "test.md")
     assert content_read == "def"
+
+
+def test_overwrite_file_content_atomic(tmp_path):
+    test_dir = tmp_path / "subdir"
+    test_dir.mkdir()
+    testfile = test_dir / "test.md"
+    testfile.write_text("abc")
+    testfile.chmod(0o644)
+    zt.persistency.overwrite_file_content(
+        test_dir, "test.md", "def", atomic=True)
+    assert testfile.read_text() == "def"
+    assert (testfile.stat().st_mode & 0o777) == 0o644
+    # no temporary files are left behind
+    assert [p.name for p in test_dir.iterdir()] == ["test.md"]
+
+
+def test_persistency_manager_group_commit(tmp_path, monkeypatch):
+    test_dir = tmp_path / "subdir"
+    test_dir.mkdir()
+    for name in ["a.md", "b.md", "c.md"]:
+        (test_dir / name).write_text("old")
+    synced = []
+    monkeypatch.setattr(
+        zt.persistency, 'fsync_directory',
+        lambda directory: synced.append(directory))
+    persistency_manager = zt.persistency.PersistencyManager(test_dir)
+    with persistency_manager.group_commit():
+        for name in ["a.md", "b.md", "c.md"]:
+            persistency_manager.overwrite_file_content(name, "new")
+        persistency_manager.rename_file("c.md", "d.md")
+        assert synced == []
+    assert synced == [test_dir]
+    assert (test_dir / "a.md").read_text() == "new"
+    assert (test_dir / "d.md").read_text() == "new"
+    persistency_manager.overwrite_file_content("a.md", "newer")
+    assert len(synced) == 2
+
+
+def test_persistency_manager_rename_syncs_directory(tmp_path, monkeypatch):
+    test_dir = tmp_path / "subdir"
+    test_dir.mkdir()
+    (test_dir / "a.md").write_text("old")
+    synced = []
+    monkeypatch.setattr(
+        zt.persistency, 'fsync_directory',
+        lambda directory: synced.append(directory))
+    persistency_manager = zt.persistency.PersistencyManager(test_dir)
+    persistency_manager.rename_file("a.md", "b.md")
+    assert synced == [test_dir]
+    assert (test_dir / "b.md").read_text() == "old"
+
+
+def test_persistency_manager_group_commit_per_thread(tmp_path, monkeypatch):
+    test_dir = tmp_path / "subdir"
+    test_dir.mkdir()
+    synced = []
+    monkeypatch.setattr(
+        zt.persistency, 'fsync_directory',
+        lambda directory: synced.append(directory))
+    persistency_manager = zt.persistency.PersistencyManager(test_dir)
+    with persistency_manager.group_commit():
+        # a write of another thread is not part of this batch
+        thread = threading.Thread(
+            target=persistency_manager.overwrite_file_content,
+            args=("a.md", "new"))
+        thread.start()
+        thread.join()
+        assert synced == [test_dir]
+    assert synced == [test_dir]
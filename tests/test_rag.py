@@ -187,3 +187,74 @@ def test_chat_cli_command_exists():
     runner = CliRunner()
     result = runner.invoke(cli.messages, ['--help'])
     assert 'chat' in result.output
+
+
+# --- TEST-12 ---
+@pytest.mark.skipif(not HAS_RAG_CORE, reason="rag module not importable")
+def test_get_vector_store_is_shared(monkeypatch):
+    """Der VectorStore wird nur einmal pro Prozess erzeugt."""
+    import threading
+    import tools4zettelkasten.rag as rag
+
+    created = []
+
+    class FakeStore:
+        def __init__(self, embedder=None):
+            created.append(self)
+
+    monkeypatch.setattr(rag, 'VectorStore', FakeStore)
+    monkeypatch.setattr(rag, 'get_embedder', lambda: None)
+    monkeypatch.setattr(rag, '_vector_store', None)
+    threads = [threading.Thread(target=rag.get_vector_store)
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert rag.get_vector_store() is created[0]
+    rag.warm_up_vector_store(background=True).join()
+    assert len(created) == 1
+
+
+# --- Hybrid retrieval ---
+@pytest.mark.skipif(not HAS_RAG_CORE, reason="rag module not importable")
+def test_reciprocal_rank_fusion_prefers_results_of_both_rankings():
+    from tools4zettelkasten.rag import reciprocal_rank_fusion
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'd']], k=1)
+    assert [key for key, _ in fused] == ['c', 'a', 'b', 'd']
+    assert fused[0][1] == pytest.approx(1 / 4 + 1 / 2)
+
+
+@pytest.mark.skipif(not HAS_RAG_CORE, reason="rag module not importable")
+def test_hybrid_search_finds_exact_terms(tmp_path, monkeypatch):
+    import tools4zettelkasten.rag as rag
+    from tools4zettelkasten import search_index
+    from tools4zettelkasten.persistency import PersistencyManager
+    (tmp_path / '01_Innovation_aaaaaaaaa.md').write_text(
+        '# Innovation\nNew ideas come from combining old ones.\n')
+    (tmp_path / '02_Tooling_bbbbbbbbb.md').write_text(
+        '# Tooling\nThe function get_vector_store caches the store.\n')
+    monkeypatch.setattr(zt.settings, 'SEARCH_INDEX_PATH', '')
+    search_index.clear_search_indexes()
+
+    class FakeStore:
+        # the embedding model only finds the semantically close note
+        def search(self, query, top_k=None):
+            return [rag.SearchResult(
+                zettel_id='aaaaaaaaa', title='Innovation', ordering='01',
+                filename='01_Innovation_aaaaaaaaa.md',
+                content='normalized', score=0.4)]
+
+    results = rag.hybrid_search(
+        'where is get_vector_store', top_k=2,
+        persistency_manager=PersistencyManager(tmp_path),
+        vector_store=FakeStore())
+    assert [r.filename for r in results] == [
+        '01_Innovation_aaaaaaaaa.md', '02_Tooling_bbbbbbbbb.md']
+    assert results[1].zettel_id == 'bbbbbbbbb'
+    assert 'caches the store' in results[1].content
+    # the content of the vector store is kept for notes found by both
+    assert results[0].content == 'normalized'
+    with pytest.raises(ValueError):
+        rag.search('query', mode='unknown')
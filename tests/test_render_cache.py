@@ -0,0 +1,81 @@
+# test_render_cache.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+from tools4zettelkasten.render_cache import RenderCache
+
+
+class CountingRenderer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, content):
+        self.calls += 1
+        return '<p>' + content + '</p>'
+
+
+def test_unchanged_note_is_rendered_once():
+    cache = RenderCache(maxsize=2)
+    render = CountingRenderer()
+    assert cache.get_or_render('a.md', 'x', 'cfg', render) == '<p>x</p>'
+    assert cache.get_or_render('a.md', 'x', 'cfg', render) == '<p>x</p>'
+    assert render.calls == 1
+    assert cache.get_or_render('a.md', 'y', 'cfg', render) == '<p>y</p>'
+    cache.get_or_render('a.md', 'y', 'other cfg', render)
+    assert render.calls == 3
+
+
+def test_least_recently_used_note_is_evicted():
+    cache = RenderCache(maxsize=2)
+    render = CountingRenderer()
+    for filename in ('a.md', 'b.md', 'a.md', 'c.md', 'a.md'):
+        cache.get_or_render(filename, filename, 'cfg', render)
+    assert render.calls == 3
+    cache.get_or_render('b.md', 'b.md', 'cfg', render)
+    assert render.calls == 4
+
+
+def test_cache_is_persisted_on_disk(tmp_path):
+    render = CountingRenderer()
+    RenderCache(directory=str(tmp_path)).get_or_render(
+        'a.md', 'x', 'cfg', render)
+    cache = RenderCache(directory=str(tmp_path))
+    assert cache.get_or_render('a.md', 'x', 'cfg', render) == '<p>x</p>'
+    assert render.calls == 1
+    cache.get_or_render('a.md', 'changed', 'cfg', render)
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def create_graph_factory(graph_fingerprint, renders):
+    def create_graph():
+        def render():
+            renders.append(graph_fingerprint)
+            return '<svg>' + graph_fingerprint + '</svg>'
+        return graph_fingerprint, render
+    return create_graph
+
+
+def test_svg_is_rendered_once_per_graph():
+    from tools4zettelkasten.render_cache import SvgRenderCache
+    cache = SvgRenderCache()
+    renders = []
+    assert cache.get_svg('notes-1', create_graph_factory('g1', renders)) == (
+        '<svg>g1</svg>', 'notes-1')
+    cache.get_svg('notes-1', create_graph_factory('never', renders))
+    # an edit without changes of the graph is not rendered again
+    assert cache.get_svg('notes-2', create_graph_factory('g1', renders)) == (
+        '<svg>g1</svg>', 'notes-2')
+    assert renders == ['g1']
+
+
+def test_changed_graph_is_rendered_in_background():
+    from tools4zettelkasten.render_cache import SvgRenderCache
+    cache = SvgRenderCache()
+    renders = []
+    cache.get_svg('notes-1', create_graph_factory('g1', renders))
+    stale = cache.get_svg('notes-2', create_graph_factory('g2', renders))
+    assert stale == ('<svg>g1</svg>', 'notes-1')
+    cache.wait()
+    assert cache.get_svg('notes-2', create_graph_factory('g2', renders)) == (
+        '<svg>g2</svg>', 'notes-2')
+    assert renders == ['g1', 'g2']
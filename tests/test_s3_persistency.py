@@ -0,0 +1,154 @@
+# test_s3_persistency.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import pytest
+from .context import tools4zettelkasten as zt
+
+try:
+    import boto3
+    from moto import mock_aws
+    HAS_S3_DEPS = True
+except ImportError:
+    HAS_S3_DEPS = False
+
+requires_s3 = pytest.mark.skipif(
+    not HAS_S3_DEPS, reason="boto3 and moto not installed")
+
+
+@pytest.fixture
+def s3_manager(tmp_path):
+    from tools4zettelkasten.s3_persistency import S3PersistencyManager
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='zettelkasten')
+        client.put_object(
+            Bucket='zettelkasten', Key='mycelium/1_first_topic_41b4e4f8f.md',
+            Body=b'# First topic\n\nsome text\n')
+        client.put_object(
+            Bucket='zettelkasten', Key='mycelium/1_1_a_Thought_2c3c34ff5.md',
+            Body=b'# A Thought\n\n[first](1_first_topic_41b4e4f8f.md)\n')
+        client.put_object(
+            Bucket='zettelkasten', Key='mycelium/images/picture.png',
+            Body=b'not a note')
+        yield S3PersistencyManager(
+            'zettelkasten', 'mycelium/',
+            cache_directory=tmp_path / 'cache', client=client)
+
+
+@requires_s3
+def test_split_s3_location():
+    from tools4zettelkasten.s3_persistency import split_s3_location
+    assert split_s3_location('s3://bucket/some/prefix') == (
+        'bucket', 'some/prefix/')
+    assert split_s3_location('s3://bucket') == ('bucket', '')
+
+
+@requires_s3
+def test_s3_list_and_read(s3_manager):
+    assert sorted(s3_manager.get_list_of_filenames()) == [
+        '1_1_a_Thought_2c3c34ff5.md', '1_first_topic_41b4e4f8f.md']
+    assert s3_manager.is_file_existing('1_first_topic_41b4e4f8f.md')
+    assert not s3_manager.is_file_existing('nonexisting.md')
+    assert s3_manager.get_file_content('1_first_topic_41b4e4f8f.md') == [
+        '# First topic\n', '\n', 'some text\n']
+
+
+@requires_s3
+def test_s3_read_through_cache(s3_manager, monkeypatch):
+    s3_manager.get_list_of_filenames()
+    s3_manager.prefetch_files(wait=True)
+    assert (s3_manager.cache_directory / '1_first_topic_41b4e4f8f.md').exists()
+
+    def fail(**kwargs):
+        raise AssertionError("cache should have been used")
+    monkeypatch.setattr(s3_manager._client, 'get_object', fail)
+    assert s3_manager.get_string_from_file_content(
+        '1_first_topic_41b4e4f8f.md').startswith('# First topic')
+
+
+@requires_s3
+def test_s3_cache_is_validated_by_etag(s3_manager, monkeypatch):
+    from tools4zettelkasten import s3_persistency
+    s3_manager.get_list_of_filenames()
+    s3_manager.get_string_from_file_content('1_first_topic_41b4e4f8f.md')
+    s3_manager._client.put_object(
+        Bucket='zettelkasten', Key='mycelium/1_first_topic_41b4e4f8f.md',
+        Body=b'# Changed elsewhere\n')
+    # once the listing is outdated the fingerprint lists the bucket again
+    monkeypatch.setattr(s3_persistency, 'LISTING_MAX_AGE', 0)
+    s3_manager.get_directory_fingerprint()
+    assert s3_manager.get_string_from_file_content(
+        '1_first_topic_41b4e4f8f.md') == '# Changed elsewhere\n'
+
+
+@requires_s3
+def test_s3_batched_rename(s3_manager):
+    s3_manager.get_list_of_filenames()
+    with s3_manager.group_commit():
+        s3_manager.rename_file(
+            '1_first_topic_41b4e4f8f.md', '2_first_topic_41b4e4f8f.md')
+        s3_manager.rename_file(
+            '1_1_a_Thought_2c3c34ff5.md', '2_1_a_Thought_2c3c34ff5.md')
+        # the old keys are hidden although the delete is still pending
+        assert sorted(s3_manager.get_list_of_filenames()) == [
+            '2_1_a_Thought_2c3c34ff5.md', '2_first_topic_41b4e4f8f.md']
+    keys = [entry['Key'] for entry in s3_manager._client.list_objects_v2(
+        Bucket='zettelkasten', Prefix='mycelium/')['Contents']]
+    assert 'mycelium/1_first_topic_41b4e4f8f.md' not in keys
+    assert 'mycelium/2_first_topic_41b4e4f8f.md' in keys
+
+
+@requires_s3
+def test_s3_overwrite_and_link_correction(s3_manager):
+    s3_manager.rename_file(
+        '1_first_topic_41b4e4f8f.md', '2_first_topic_41b4e4f8f.md')
+    commands = zt.reorganize.generate_list_of_link_correction_commands(
+        s3_manager)
+    assert len(commands) == 1
+    content = s3_manager.get_string_from_file_content(commands[0].filename)
+    s3_manager.overwrite_file_content(
+        commands[0].filename,
+        content.replace(commands[0].to_be_replaced, commands[0].replace_with))
+    assert '(2_first_topic_41b4e4f8f.md)' in (
+        s3_manager.get_string_from_file_content(commands[0].filename))
+
+
+@requires_s3
+def test_s3_fingerprint_and_listing_cost_one_list(s3_manager, monkeypatch):
+    calls = []
+    get_paginator = s3_manager._client.get_paginator
+
+    def counting_paginator(name):
+        calls.append(name)
+        return get_paginator(name)
+    monkeypatch.setattr(s3_manager._client, 'get_paginator',
+                        counting_paginator)
+    s3_manager.get_directory_fingerprint()
+    assert len(s3_manager.get_list_of_filenames()) == 2
+    assert calls == ['list_objects_v2']
+
+
+@requires_s3
+def test_s3_fingerprint_reuses_a_recent_listing(s3_manager, monkeypatch):
+    fingerprint = s3_manager.get_directory_fingerprint()
+
+    def fail(name):
+        raise AssertionError("the listing should have been reused")
+    monkeypatch.setattr(s3_manager._client, 'get_paginator', fail)
+    assert s3_manager.get_directory_fingerprint() == fingerprint
+    # writes of the manager are applied to the reused listing
+    s3_manager.overwrite_file_content('2_new_note_abcdef123.md', '# New\n')
+    assert s3_manager.get_directory_fingerprint() != fingerprint
+
+
+@requires_s3
+def test_s3_manager_is_shared_per_location(tmp_path, monkeypatch):
+    from tools4zettelkasten import s3_persistency
+    monkeypatch.setattr(zt.settings, 'S3_CACHE_PATH', str(tmp_path))
+    with mock_aws():
+        manager = zt.persistency.create_persistency_manager(
+            's3://zettelkasten/mycelium')
+        assert manager is zt.persistency.create_persistency_manager(
+            's3://zettelkasten/mycelium')
+        s3_persistency.close_buckets()
@@ -0,0 +1,106 @@
+# test_search_index.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import os
+from tools4zettelkasten import search_index as si
+from tools4zettelkasten.persistency import PersistencyManager
+
+NOTES = {
+    '01_Repetition_aaaaaaaaa.md':
+        '# Spaced repetition\nSpaced repetition helps to remember.\n',
+    '02_Space_bbbbbbbbb.md':
+        '# Space\nThe space between notes is repetition of nothing.\n',
+    '03_Long_ccccccccc.md':
+        '# Long note\n' + 'filler words ' * 50 + 'repetition\n',
+}
+
+
+def create_notes(directory):
+    for filename, content in NOTES.items():
+        (directory / filename).write_text(content)
+
+
+def create_index():
+    index = si.SearchIndex()
+    for filename, content in NOTES.items():
+        index.add(filename, content)
+    return index
+
+
+def test_parse_query_finds_phrases():
+    assert si.parse_query('"Spaced Repetition" memory "note"') == (
+        ['memory', 'note', 'spaced', 'repetition'],
+        [['spaced', 'repetition']])
+
+
+def test_bm25_ranks_frequent_terms_in_short_notes_first():
+    results = create_index().search('repetition')
+    assert [result[0] for result in results] == [
+        '01_Repetition_aaaaaaaaa.md', '02_Space_bbbbbbbbb.md',
+        '03_Long_ccccccccc.md']
+    assert results[0][1] == 'Spaced repetition'
+
+
+def test_notes_with_more_terms_rank_higher():
+    results = create_index().search('space nothing repetition')
+    assert results[0][0] == '02_Space_bbbbbbbbb.md'
+
+
+def test_phrase_must_occur_as_such():
+    results = create_index().search('"spaced repetition"')
+    assert [result[0] for result in results] == ['01_Repetition_aaaaaaaaa.md']
+    assert create_index().search('"helps repetition"') == []
+
+
+def test_unknown_word_matches_words_it_begins():
+    results = create_index().search('repet')
+    assert len(results) == 3
+    assert results[0][3] == ['repetition']
+
+
+def test_snippet_highlights_the_matches():
+    snippet = si.highlight_snippet(
+        NOTES['01_Repetition_aaaaaaaaa.md'], ['repetition'], [], width=10)
+    assert snippet == '# Spaced **repetition** Spaced re...'
+
+
+def test_index_is_updated_incrementally_and_persisted(tmp_path):
+    notes = tmp_path / 'notes'
+    notes.mkdir()
+    create_notes(notes)
+    path = str(tmp_path / 'index' / 'search.sqlite')
+    persistencyManager = PersistencyManager(notes)
+    index = si.SearchIndex(path)
+    index.refresh(persistencyManager)
+    assert len(index) == 3
+    changed = notes / '02_Space_bbbbbbbbb.md'
+    changed.write_text('# Space\nNow about astronomy.\n')
+    os.utime(changed, (1, 1))
+    os.remove(notes / '03_Long_ccccccccc.md')
+    index.refresh(persistencyManager, force=True)
+    assert [result[0] for result in index.search('repetition')] == [
+        '01_Repetition_aaaaaaaaa.md']
+    index.wait()
+    # a new process reads the persisted index
+    reloaded = si.SearchIndex(path)
+    assert reloaded.search('astronomy')[0][0] == '02_Space_bbbbbbbbb.md'
+    assert len(reloaded) == 2
+
+
+def test_modification_times_are_checked_in_the_background(
+        tmp_path, monkeypatch):
+    create_notes(tmp_path)
+    persistencyManager = PersistencyManager(tmp_path)
+    index = si.SearchIndex()
+    index.refresh(persistencyManager)
+    changed = tmp_path / '02_Space_bbbbbbbbb.md'
+    changed.write_text('# Space\nNow about astronomy.\n')
+    os.utime(changed, (1, 1))
+    monkeypatch.setattr(
+        persistencyManager, 'get_directory_fingerprint',
+        lambda: index._fingerprint)
+    monkeypatch.setattr(si, 'REFRESH_INTERVAL', 0)
+    index.refresh(persistencyManager)
+    index.wait()
+    assert index.search('astronomy')[0][0] == '02_Space_bbbbbbbbb.md'
@@ -0,0 +1,92 @@
+# test_sqlite_persistency.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import pytest
+from .context import tools4zettelkasten as zt
+from tools4zettelkasten.sqlite_persistency import (
+    SqlitePersistencyManager, close_databases)
+
+
+@pytest.fixture
+def sqlite_manager(tmp_path):
+    manager = SqlitePersistencyManager(tmp_path / "zettelkasten.db")
+    manager.overwrite_file_content(
+        "1_first_topic_41b4e4f8f.md", "# First topic\n\nsome text\n")
+    manager.overwrite_file_content(
+        "1_1_a_Thought_2c3c34ff5.md",
+        "# A Thought\n\n[first](1_first_topic_41b4e4f8f.md)\n")
+    yield manager
+    manager.close()
+
+
+def test_sqlite_list_and_read(sqlite_manager):
+    assert sqlite_manager.get_list_of_filenames() == [
+        "1_1_a_Thought_2c3c34ff5.md", "1_first_topic_41b4e4f8f.md"]
+    assert sqlite_manager.is_file_existing("1_first_topic_41b4e4f8f.md")
+    assert not sqlite_manager.is_file_existing("nonexisting.md")
+    lines = sqlite_manager.get_file_content("1_first_topic_41b4e4f8f.md")
+    assert lines == ["# First topic\n", "\n", "some text\n"]
+
+
+def test_sqlite_rename_file(sqlite_manager):
+    sqlite_manager.rename_file(
+        "1_first_topic_41b4e4f8f.md", "2_first_topic_41b4e4f8f.md")
+    assert not sqlite_manager.is_file_existing("1_first_topic_41b4e4f8f.md")
+    assert sqlite_manager.get_string_from_file_content(
+        "2_first_topic_41b4e4f8f.md").startswith("# First topic")
+
+
+def test_sqlite_group_commit_rolls_back_on_error(sqlite_manager):
+    with pytest.raises(RuntimeError):
+        with sqlite_manager.group_commit():
+            sqlite_manager.rename_file(
+                "1_first_topic_41b4e4f8f.md", "2_first_topic_41b4e4f8f.md")
+            raise RuntimeError("crash in the middle of a batch")
+    assert sqlite_manager.is_file_existing("1_first_topic_41b4e4f8f.md")
+    assert not sqlite_manager.is_file_existing("2_first_topic_41b4e4f8f.md")
+
+
+def test_sqlite_reorganize_links(sqlite_manager):
+    invalid_links = zt.reorganize.get_list_of_invalid_links(sqlite_manager)
+    assert invalid_links == []
+    sqlite_manager.rename_file(
+        "1_first_topic_41b4e4f8f.md", "2_first_topic_41b4e4f8f.md")
+    commands = zt.reorganize.generate_list_of_link_correction_commands(
+        sqlite_manager)
+    assert len(commands) == 1
+    assert commands[0].replace_with == "[first](2_first_topic_41b4e4f8f.md)"
+
+
+def test_create_persistency_manager(tmp_path):
+    manager = zt.persistency.create_persistency_manager(
+        "sqlite://" + str(tmp_path / "notes.db"))
+    assert isinstance(manager, SqlitePersistencyManager)
+    # one connection per database and process
+    assert manager is zt.persistency.create_persistency_manager(
+        "sqlite://" + str(tmp_path / "notes.db"))
+    close_databases()
+    manager = zt.persistency.create_persistency_manager(str(tmp_path))
+    assert isinstance(manager, zt.persistency.PersistencyManager)
+
+
+def test_open_during_group_commit_of_other_connection(sqlite_manager):
+    with sqlite_manager.group_commit():
+        sqlite_manager.overwrite_file_content("2_new_3c3c34ff5.md", "# New\n")
+        reader = SqlitePersistencyManager(sqlite_manager.database)
+        assert reader.is_file_existing("1_first_topic_41b4e4f8f.md")
+        reader.close()
+
+
+def test_export_command(sqlite_manager, tmp_path):
+    from click.testing import CliRunner
+    target = tmp_path / "exported"
+    runner = CliRunner()
+    result = runner.invoke(zt.cli.export, [
+        '--source', 'sqlite://' + str(sqlite_manager.database),
+        '--target', str(target)])
+    assert result.exit_code == 0
+    assert sorted(p.name for p in target.iterdir()) == [
+        "1_1_a_Thought_2c3c34ff5.md", "1_first_topic_41b4e4f8f.md"]
+    assert (target / "1_first_topic_41b4e4f8f.md").read_text() == (
+        "# First topic\n\nsome text\n")
@@ -0,0 +1,103 @@
+# test_title_index.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+import os
+import threading
+from tools4zettelkasten import title_index as ti
+from tools4zettelkasten.persistency import PersistencyManager
+
+
+def create_notes(directory):
+    notes = {
+        '01_Zettelkasten_Methode_aaaaaaaaa.md': '# Die Zettelkasten Methode\n',
+        '02_Reading_List_bbbbbbbbb.md': '# Books to read\n',
+        '03_Zettel_ccccccccc.md': 'no heading\n',
+    }
+    for filename, content in notes.items():
+        (directory / filename).write_text(content)
+
+
+def test_trigrams_are_padded_per_word():
+    assert ti.get_trigrams('Ab c') == {'  a', ' ab', 'ab ', '  c', ' c '}
+
+
+def test_search_tolerates_typos(tmp_path):
+    create_notes(tmp_path)
+    index = ti.TitleIndex()
+    index.refresh(PersistencyManager(tmp_path))
+    results = index.search('zettelkastne')
+    assert results[0][:2] == (
+        '01_Zettelkasten_Methode_aaaaaaaaa.md', 'Die Zettelkasten Methode')
+    # the title is taken from the heading, the base filename is indexed too
+    assert index.search('books')[0][0] == '02_Reading_List_bbbbbbbbb.md'
+    assert index.search('reading list')[0][0] == '02_Reading_List_bbbbbbbbb.md'
+    assert index.search('ccccccccc') == [
+        ('03_Zettel_ccccccccc.md', 'Zettel', 1.0)]
+    assert index.search('xyzxyz') == []
+
+
+def test_search_keeps_notes_exactly_at_the_min_score():
+    index = ti.TitleIndex()
+    index.add('01_Graph_aaaaaaaaa.md', 'Graph')
+    index.add('02_Grasp_bbbbbbbbb.md', 'Grasp')
+    index.add('03_Other_ccccccccc.md', 'Other')
+    query_trigrams = ti.get_trigrams('graph')
+    shared = query_trigrams & ti.get_trigrams('grasp')
+    min_score = len(shared) / len(query_trigrams)
+    results = index.search('graph', min_score=min_score)
+    assert [filename for filename, _, _ in results] == [
+        '01_Graph_aaaaaaaaa.md', '02_Grasp_bbbbbbbbb.md']
+    assert results[1][2] == round(min_score, 3)
+    assert len(index.search('graph', min_score=min_score + 0.01)) == 1
+
+
+def test_refresh_reads_only_changed_notes(tmp_path, monkeypatch):
+    create_notes(tmp_path)
+    persistencyManager = PersistencyManager(tmp_path)
+    index = ti.TitleIndex()
+    index.refresh(persistencyManager)
+    read = []
+    update_note = index.update_note
+
+    def counting_update(manager, filename):
+        read.append(filename)
+        update_note(manager, filename)
+
+    monkeypatch.setattr(index, 'update_note', counting_update)
+    changed = tmp_path / '02_Reading_List_bbbbbbbbb.md'
+    changed.write_text('# Bibliothek\n')
+    os.utime(changed, (1, 1))
+    os.remove(tmp_path / '03_Zettel_ccccccccc.md')
+    index.refresh(persistencyManager, force=True)
+    assert read == ['02_Reading_List_bbbbbbbbb.md']
+    assert len(index) == 2
+    assert index.search('bibliotek')[0][1] == 'Bibliothek'
+    assert all(
+        result[0] != '03_Zettel_ccccccccc.md'
+        for result in index.search('zettel'))
+
+
+def test_periodic_check_runs_in_the_background(tmp_path, monkeypatch):
+    create_notes(tmp_path)
+    persistencyManager = PersistencyManager(tmp_path)
+    index = ti.TitleIndex()
+    index.refresh(persistencyManager)
+    changed = tmp_path / '02_Reading_List_bbbbbbbbb.md'
+    changed.write_text('# Bibliothek\n')
+    os.utime(changed, (1, 1))
+    listed_by = []
+    get_list_of_filenames = persistencyManager.get_list_of_filenames
+
+    def listing():
+        listed_by.append(threading.current_thread())
+        return get_list_of_filenames()
+
+    monkeypatch.setattr(
+        persistencyManager, 'get_list_of_filenames', listing)
+    monkeypatch.setattr(ti, 'REFRESH_INTERVAL', 0)
+    # the note is edited in place, the directory fingerprint is the same
+    index.refresh(persistencyManager)
+    index.wait()
+    assert listed_by and threading.current_thread() not in listed_by
+    assert index.search('bibliotek')[0][1] == 'Bibliothek'
@@ -3,46 +3,212 @@
 # Licensed under the MIT license
 
 from dataclasses import dataclass
+from functools import cached_property
+import hashlib
+import logging
+import math
+import subprocess
+import sys
 import pprint as pp
+import graphviz
 from graphviz import Digraph
 from . import handle_filenames as hf
 from . import reorganize as ro
 from . import settings as st
 from . import flask_views as fv
 from .persistency import PersistencyManager
+from .link_table import LinkTable, STRUCTURE, EXPLICIT, is_in_topic
 from textwrap import fill
 
 
 @dataclass
 class Analysis:
+    """notes and links of (a part of) the Zettelkasten
+
+    The links are kept in a LinkTable. The lists of Link objects are
+    created on first use and kept, the table must not be changed
+    afterwards.
+    """
     list_of_filenames: list[str]
-    list_of_explicit_links: list[ro.Link]
-    list_of_structure_links: list[ro.Link]
-    list_of_links: list[ro.Link]
+    link_table: LinkTable
     tree: list
 
+    @cached_property
+    def list_of_explicit_links(self) -> list[ro.Link]:
+        return self.link_table.select(kind=EXPLICIT).to_links()
+
+    @cached_property
+    def list_of_structure_links(self) -> list[ro.Link]:
+        return self.link_table.select(kind=STRUCTURE).to_links()
+
+    @cached_property
+    def list_of_links(self) -> list[ro.Link]:
+        """structure links followed by explicit links"""
+        return self.link_table.to_links()
+
+
+def create_link_table(list_of_structure_links, list_of_explicit_links):
+    link_table = LinkTable()
+    link_table.extend(list_of_structure_links, STRUCTURE)
+    link_table.extend(list_of_explicit_links, EXPLICIT)
+    return link_table
+
+
+def add_explicit_links(
+        link_table: LinkTable, persistencyManager: PersistencyManager,
+        list_of_filenames: list[str]):
+    """adds the links of the notes to the table note by note
+
+    Unlike ro.get_list_of_links no list of all links is built.
+    """
+    for filename in list_of_filenames:
+        lines_of_filecontent = persistencyManager.get_file_content(filename)
+        if not lines_of_filecontent:
+            logging.error("empty file: " + filename)
+            continue
+        link_table.extend(
+            ro.get_list_of_links_from_file(filename, lines_of_filecontent),
+            EXPLICIT)
+
 
 def create_graph_analysis(persistencyManager: PersistencyManager) -> Analysis:
     list_of_filenames = persistencyManager.get_list_of_filenames()
-    list_of_explicit_links = ro.get_list_of_links(persistencyManager)
-    tokenized_list = ro.generate_tokenized_list(
-        persistencyManager.get_list_of_filenames())
+    tokenized_list = ro.generate_tokenized_list(list_of_filenames)
     tree = ro.generate_tree(tokenized_list)
-    list_of_structure_links = ro.get_hierarchy_links(tree)
-    list_of_links = (
-        list_of_structure_links + list_of_explicit_links)
+    link_table = create_link_table(ro.get_hierarchy_links(tree), [])
+    add_explicit_links(link_table, persistencyManager, list_of_filenames)
     return Analysis(
         list_of_filenames=list_of_filenames,
-        list_of_explicit_links=list_of_explicit_links,
-        list_of_structure_links=list_of_structure_links,
-        list_of_links=list_of_links,
+        link_table=link_table,
         tree=tree)
 
 
+def create_topic_analysis(
+        persistencyManager: PersistencyManager, prefix: str) -> Analysis:
+    """analysis of the notes of one topic
+
+    Only the notes of the topic are read, the hierarchy is derived
+    from the filenames of all notes.
+    """
+    all_filenames = persistencyManager.get_list_of_filenames()
+    tree = ro.generate_tree(ro.generate_tokenized_list(all_filenames))
+    list_of_filenames = [
+        filename for filename in all_filenames
+        if is_in_topic(filename, prefix)]
+    link_table = create_link_table(ro.get_hierarchy_links(tree), [])
+    add_explicit_links(link_table, persistencyManager, list_of_filenames)
+    return Analysis(
+        list_of_filenames=list_of_filenames,
+        link_table=link_table.select(filenames=list_of_filenames),
+        tree=tree)
+
+
+def find_note(list_of_filenames: list[str], note: str) -> str:
+    """finds the filename of a note given by filename or id"""
+    for filename in list_of_filenames:
+        if filename == note or hf.create_Note(filename).id == note:
+            return filename
+    raise ValueError("no note " + note)
+
+
+def get_neighborhood(
+        link_table: LinkTable, center: str, hops: int) -> list[str]:
+    """the notes within a number of links around a note
+
+    Links are followed in both directions.
+    """
+    neighbours = {}
+    for source, target in zip(link_table.sources, link_table.targets):
+        neighbours.setdefault(source, set()).add(target)
+        neighbours.setdefault(target, set()).add(source)
+    center_id = link_table.note_id(center)
+    neighborhood = [center_id]
+    visited = {center_id}
+    frontier = [center_id]
+    for _ in range(hops):
+        next_frontier = []
+        for note_id in frontier:
+            for neighbour in sorted(neighbours.get(note_id, ())):
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    neighborhood.append(neighbour)
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+    return [link_table.notes[note_id] for note_id in neighborhood]
+
+
+def create_neighborhood_analysis(
+        analysis: Analysis, note: str, hops: int = 1) -> Analysis:
+    """restricts an analysis to the k-hop neighborhood of a note
+
+    :param analysis: analysis of the whole Zettelkasten
+    :param note: filename or id of the note in the center
+    :param hops: number of structure or explicit links to follow
+    """
+    center = find_note(analysis.list_of_filenames, note)
+    # links to missing notes do not connect their sources
+    list_of_filenames = get_neighborhood(
+        analysis.link_table.select(filenames=analysis.list_of_filenames),
+        center, hops)
+    return Analysis(
+        list_of_filenames=list_of_filenames,
+        link_table=analysis.link_table.select(filenames=list_of_filenames),
+        tree=analysis.tree)
+
+
+def get_graph_fingerprint(
+        list_of_filenames: list[str], list_of_links: list[ro.Link]) -> str:
+    """fingerprint of the nodes and edges of the graph
+
+    Changes of a note which neither rename it nor change its links do
+    not change the fingerprint.
+    """
+    graph = hashlib.sha256()
+    for filename in sorted(list_of_filenames):
+        graph.update(filename.encode('utf-8') + b'\n')
+    graph.update(b'\n')
+    for link in sorted(
+            (link.source, link.description, link.target)
+            for link in list_of_links):
+        graph.update('\t'.join(link).encode('utf-8') + b'\n')
+    return graph.hexdigest()
+
+
 def show_tree_as_list(tree):
     pp.pprint(tree)
 
 
+def _add_node_of_note(dot: Digraph, filename: str, url_in_nodes: bool):
+    note = hf.create_Note(filename)
+    title_of_node = (
+        note.ordering.replace('_', ' ') +
+        ' ' + note.base_filename.replace("_", " "))
+    if url_in_nodes:
+        dot.node(
+            note.id,
+            fill(title_of_node, width=30),
+            shape='box',
+            URL=fv.url_for_file(filename),
+            style='rounded')
+    else:
+        dot.node(
+            note.id,
+            fill(title_of_node, width=30),
+            shape='box',
+            style='rounded')
+
+
+def _add_edge_of_link(dot: Digraph, link: ro.Link):
+    source_note = hf.create_Note(link.source)
+    target_note = hf.create_Note(link.target)
+    if link.description == st.DIRECT_DAUGHTER_ZETTEL:
+        dot.edge(source_note.id, target_note.id, color='blue')
+    elif link.description == st.DIRECT_SISTER_ZETTEL:
+        dot.edge(source_note.id, target_note.id)
+    else:
+        dot.edge(source_note.id, target_note.id, color='red')
+
+
 def create_graph_of_zettelkasten(
         list_of_filenames: list[str],
         list_of_links: list[ro.Link],
@@ -51,40 +217,175 @@ def create_graph_of_zettelkasten(
 
     # Nodes
     for filename in list_of_filenames:
-        note = hf.create_Note(filename)
-        title_of_node = (
-            note.ordering.replace('_', ' ') +
-            ' ' + note.base_filename.replace("_", " "))
-        if url_in_nodes:
-            dot.node(
-                note.id,
-                fill(title_of_node, width=30),
-                shape='box',
-                URL=fv.url_for_file(filename),
-                style='rounded')
-        else:
-            dot.node(
-                note.id,
-                fill(title_of_node, width=30),
-                shape='box',
-                style='rounded')
+        _add_node_of_note(dot, filename, url_in_nodes)
 
     # Edges
     for link in list_of_links:
-        source_note = hf.create_Note(link.source)
-        target_note = hf.create_Note(link.target)
-        if link.description == st.DIRECT_DAUGHTER_ZETTEL:
-            dot.edge(source_note.id, target_note.id, color='blue')
-        elif link.description == st.DIRECT_SISTER_ZETTEL:
-            dot.edge(source_note.id, target_note.id)
-        else:
-            dot.edge(source_note.id, target_note.id, color='red')
+        _add_edge_of_link(dot, link)
 
     return dot
 
 
-def show_graph_of_zettelkasten(dot: Digraph):
+def iter_dot_lines_of_zettelkasten(
+        list_of_filenames: list[str],
+        list_of_links: list[ro.Link],
+        url_in_nodes: bool):
+    """yields the DOT source of the graph line by line
+
+    The lines are the same as the ones of create_graph_of_zettelkasten,
+    but the source is never held in memory as a whole.
+    """
+    dot = Digraph(comment='Zettelkasten')
+    # an empty graph consists of the head lines and the closing tail
+    *head, tail = list(dot)
+    yield from head
+    for filename in list_of_filenames:
+        _add_node_of_note(dot, filename, url_in_nodes)
+        yield from dot.body
+        dot.body.clear()
+    for link in list_of_links:
+        _add_edge_of_link(dot, link)
+        yield from dot.body
+        dot.body.clear()
+    yield tail
+
+
+def write_dot_lines(lines, output, echo: bool = False):
+    """writes DOT lines to a text file, a pipe or stdout
+
+    :param lines: iterable of DOT lines, e.g. a Digraph or the lines of
+        iter_dot_lines_of_zettelkasten
+    :param output: file object opened for writing text
+    :param echo: also print the lines to stdout
+    """
+    for line in lines:
+        output.write(line)
+        if echo:
+            sys.stdout.write(line)
+
+
+def render_dot_lines(
+        lines, filepath: str, format: str = 'png', engine: str = 'dot',
+        echo: bool = False) -> str:
+    """pipes DOT lines into the graphviz engine and writes the result
+
+    The lines are written to the engine while they are produced, so a
+    large graph is not held in memory as one string.
+
+    :return: path of the rendered file
+    """
+    output_path = filepath + '.' + format
+    process = subprocess.Popen(
+        [engine, '-T' + format, '-o', output_path],
+        stdin=subprocess.PIPE, encoding='utf-8')
+    try:
+        write_dot_lines(lines, process.stdin, echo=echo)
+    finally:
+        process.stdin.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, process.args)
+    return output_path
+
+
+def get_cluster_prefix(filename: str, depth: int) -> str:
+    """the ordering of the subtree at the given depth containing a note
+
+    With depth 2 the note 01_02_03 belongs to the cluster 01_02, the
+    note 01 is a cluster of its own.
+    """
+    ordering = hf.create_Note(filename).ordering
+    return '_'.join(ordering.split('_')[:depth])
+
+
+def _cluster_node_id(prefix: str) -> str:
+    return 'cluster ' + prefix
+
+
+def create_overview_graph_of_zettelkasten(
+        list_of_filenames: list[str],
+        list_of_structure_links: list[ro.Link],
+        list_of_explicit_links: list[ro.Link],
+        depth: int,
+        url_in_nodes: bool) -> Digraph:
+    """graph with the subtrees below a depth collapsed into single nodes
+
+    The node of a subtree shows the title of its root note and the
+    number of notes. Links between the notes of two subtrees are
+    combined into one edge, explicit links are labelled with their
+    number. With url_in_nodes a subtree links to its own overview one
+    level deeper.
+    """
+    dot = Digraph(comment='Zettelkasten overview')
+    clusters = {}
+    for filename in list_of_filenames:
+        clusters.setdefault(
+            get_cluster_prefix(filename, depth), []).append(filename)
+
+    # Nodes
+    for prefix, filenames in clusters.items():
+        root = next((
+            filename for filename in filenames
+            if hf.create_Note(filename).ordering == prefix), None)
+        title = prefix.replace('_', ' ')
+        if root is not None:
+            title += ' ' + hf.create_Note(root).base_filename.replace(
+                '_', ' ')
+        attributes = {'shape': 'box', 'style': 'rounded'}
+        if len(filenames) > 1:
+            title += f' ({len(filenames)} notes)'
+            attributes = {'shape': 'folder'}
+            if url_in_nodes:
+                attributes['URL'] = fv.url_for_topic(prefix, depth + 1)
+        elif url_in_nodes:
+            attributes['URL'] = fv.url_for_file(filenames[0])
+        dot.node(
+            _cluster_node_id(prefix), fill(title, width=30), **attributes)
+
+    # Edges
+    cluster_of = {
+        filename: prefix
+        for prefix, filenames in clusters.items()
+        for filename in filenames}
+
+    def aggregate(list_of_links):
+        edges = {}
+        for link in list_of_links:
+            source = cluster_of.get(link.source)
+            target = cluster_of.get(link.target)
+            if source is None or target is None or source == target:
+                continue
+            key = (source, target, link.description)
+            edges[key] = edges.get(key, 0) + 1
+        return edges
+
+    for (source, target, description) in aggregate(list_of_structure_links):
+        dot.edge(
+            _cluster_node_id(source), _cluster_node_id(target),
+            **({'color': 'blue'}
+               if description == st.DIRECT_DAUGHTER_ZETTEL else {}))
+    explicit_edges = {}
+    for (source, target, _), number in aggregate(
+            list_of_explicit_links).items():
+        explicit_edges[(source, target)] = (
+            explicit_edges.get((source, target), 0) + number)
+    for (source, target), number in explicit_edges.items():
+        dot.edge(
+            _cluster_node_id(source), _cluster_node_id(target),
+            color='red', label=str(number),
+            penwidth=str(min(1 + math.log2(number), 8)))
+
+    return dot
+
+
+def show_graph_of_zettelkasten(
+        dot, print_source: bool = False, filepath: str = 'Digraph.gv'):
+    """renders the graph as png and opens it in the viewer
+
+    :param dot: a Digraph or an iterable of DOT lines
+    :param print_source: also print the DOT source
+    """
     # Generate Output
-    print(dot.source)
-    dot.format = 'png'
-    dot.render(view=True)
+    output_path = render_dot_lines(
+        dot, filepath, format='png', echo=print_source)
+    graphviz.view(output_path)
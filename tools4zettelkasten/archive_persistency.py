@@ -0,0 +1,237 @@
+# archive_persistency.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Read-only backend serving a Zettelkasten from a zip or tar snapshot.
+
+The member index of the archive is built once when the snapshot is
+opened. Notes of a zip or an uncompressed tar are decompressed lazily
+when they are read, so browsing or analysing a snapshot does not
+require unpacking it. A compressed tar has no random access, it is
+decompressed once into a temporary file when it is opened.
+"""
+
+import bz2
+import datetime
+import gzip
+import lzma
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from . import persistency as ps
+from .locking import LockManager
+
+ARCHIVE_SUFFIXES = (
+    '.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz',
+    '.txz')
+# snapshots kept open per process
+MAX_OPEN_SNAPSHOTS = 4
+
+
+def is_archive_location(location) -> bool:
+    """checks if a location names a zip or tar snapshot"""
+    return str(location).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+# magic numbers of the compressions of tar files
+DECOMPRESSORS = (
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+)
+# folder of resource forks in zip files created by the macOS Finder
+MACOS_RESOURCE_FOLDER = '__MACOSX'
+
+
+def _member_name(name):
+    """normalized name of an archive member, None if it is ignored
+
+    Hidden files, members of hidden folders and the resource folder of
+    macOS are ignored, so they do not hide the common folder of the
+    notes.
+    """
+    name = posixpath.normpath(name)
+    parts = name.split('/')
+    if parts[0] == MACOS_RESOURCE_FOLDER or any(
+            part.startswith('.') for part in parts):
+        return None
+    return name
+
+
+def _open_tar(archive):
+    """opens a tar file, a compressed one is decompressed first"""
+    with open(archive, 'rb') as file:
+        magic = file.read(6)
+    for prefix, decompressor in DECOMPRESSORS:
+        if magic.startswith(prefix):
+            decompressed = tempfile.TemporaryFile()
+            with decompressor(archive) as compressed:
+                shutil.copyfileobj(compressed, decompressed)
+            decompressed.seek(0)
+            return tarfile.open(fileobj=decompressed, mode='r:')
+    return tarfile.open(archive, mode='r:')
+
+
+def _common_folder(member_names):
+    """the single top level folder of a snapshot, '' if there is none"""
+    folders = {name.split('/', 1)[0] if '/' in name else ''
+               for name in member_names}
+    if len(folders) == 1:
+        return folders.pop()
+    return ''
+
+
+class ArchivePersistencyManager:
+    """PersistencyManager reading the notes from a zip or tar file
+
+    The interface is the same as the one of
+    :class:`tools4zettelkasten.persistency.PersistencyManager`.
+    All modifying operations raise a PermissionError.
+
+    Notes are expected at the top level of the archive. If the
+    archive contains exactly one top level folder (as created by
+    ``zip -r mycelium.zip mycelium``), the notes are taken from there.
+    """
+    def __init__(self, archive) -> None:
+        if (isinstance(archive, str)):
+            self.archive = Path(archive)
+        else:
+            self.archive = archive
+        self._lock = threading.Lock()
+        self.locks = LockManager(self.archive)
+        stat = os.stat(self.archive)
+        self._fingerprint = (stat.st_size, stat.st_mtime_ns)
+        if zipfile.is_zipfile(self.archive):
+            self._zip = zipfile.ZipFile(self.archive)
+            self._tar = None
+            members = {
+                _member_name(info.filename): info
+                for info in self._zip.infolist() if not info.is_dir()}
+        else:
+            self._zip = None
+            self._tar = _open_tar(self.archive)
+            members = {
+                _member_name(info.name): info
+                for info in self._tar.getmembers() if info.isfile()}
+        members.pop(None, None)
+        folder = _common_folder(members)
+        self._index = {}
+        for name, info in members.items():
+            folder_of_member, filename = posixpath.split(name)
+            if (folder_of_member == folder
+                    # do not process hidden files
+                    and not filename[0] == '.'):
+                self._index[filename] = info
+
+    @property
+    def directory(self):
+        """location of the snapshot, used for messages"""
+        return self.archive
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            fileobj = self._tar.fileobj
+            self._tar.close()
+            # the temporary file of a compressed tar
+            fileobj.close()
+
+    def _read_only(self):
+        raise PermissionError(
+            "snapshot " + str(self.archive) + " is read-only")
+
+    @contextmanager
+    def group_commit(self):
+        yield self
+
+    def get_list_of_filenames(self):
+        return list(self._index)
+
+    def get_directory_fingerprint(self):
+        """a snapshot never changes, the fingerprint identifies the file"""
+        return self._fingerprint
+
+    def get_string_from_file_content(self, filename):
+        info = self._index.get(filename)
+        if info is None:
+            raise FileNotFoundError(
+                "no note " + filename + " in " + str(self.archive))
+        with self._lock:
+            if self._zip is not None:
+                data = self._zip.read(info)
+            else:
+                data = self._tar.extractfile(info).read()
+        return data.decode('utf-8')
+
+    def get_file_content(self, filename):
+        return self.get_string_from_file_content(filename).splitlines(
+            keepends=True)
+
+    def is_file_existing(self, filename):
+        return filename in self._index
+
+    def is_markdown_file(self, filename):
+        return ps.is_markdown_file(filename)
+
+    def is_text_file(self, filename):
+        return ps.is_text_file(filename)
+
+    def get_modification_time(self, filename):
+        info = self._index[filename]
+        if self._zip is not None:
+            return datetime.datetime(*info.date_time).timestamp()
+        return float(info.mtime)
+
+    def overwrite_file_content(self, filename, new_content):
+        self._read_only()
+
+    def rename_file(self, oldfilename, newfilename):
+        self._read_only()
+
+
+# path -> (size and mtime, manager), least recently used first
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def open_snapshot(archive):
+    """returns a shared ArchivePersistencyManager for a snapshot
+
+    The index of a snapshot is built only once per process. A new
+    snapshot written to the same path (different size or mtime) is
+    opened again. Replaced snapshots and the least recently used ones
+    beyond MAX_OPEN_SNAPSHOTS are closed, with their temporary files.
+    """
+    archive = os.path.abspath(archive)
+    stat = os.stat(archive)
+    version = (stat.st_size, stat.st_mtime_ns)
+    with _snapshots_lock:
+        entry = _snapshots.get(archive)
+        if entry is not None and entry[0] == version:
+            _snapshots.move_to_end(archive)
+            return entry[1]
+        manager = ArchivePersistencyManager(archive)
+        if entry is not None:
+            entry[1].close()
+        _snapshots[archive] = (version, manager)
+        _snapshots.move_to_end(archive)
+        while len(_snapshots) > MAX_OPEN_SNAPSHOTS:
+            _, (_, evicted) = _snapshots.popitem(last=False)
+            evicted.close()
+        return manager
+
+
+def close_snapshots():
+    """closes the snapshots opened by open_snapshot"""
+    with _snapshots_lock:
+        for _, manager in _snapshots.values():
+            manager.close()
+        _snapshots.clear()
@@ -0,0 +1,146 @@
+# chat_store.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Server-side storage of chat conversations.
+
+The Flask session only carries the id of a conversation, the messages
+are kept in a SQLite database. Retention is bounded: old conversations
+expire and every conversation keeps only its latest messages.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from . import settings as st
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    sources TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation
+    ON messages (conversation_id, id);
+'''
+
+
+def new_conversation_id() -> str:
+    return uuid.uuid4().hex
+
+
+def window_history(
+        history: list, max_messages: int = None,
+        max_chars: int = None) -> list:
+    """Select the most recent messages that fit into the LLM context.
+
+    :param history: messages [{'role': ..., 'content': ...}], oldest first
+    :param max_messages: maximum number of messages to keep
+    :param max_chars: maximum number of characters of all kept messages
+    :return: the newest messages within both limits, oldest first
+    """
+    if max_messages is None:
+        max_messages = st.CHAT_CONTEXT_MESSAGES
+    if max_chars is None:
+        max_chars = st.CHAT_CONTEXT_CHARS
+    window = []
+    total_chars = 0
+    for message in reversed(history[-max_messages:] if max_messages else []):
+        total_chars += len(message['content'])
+        if total_chars > max_chars:
+            break
+        window.append(message)
+    window.reverse()
+    # do not start the window with an answer whose question was cut off
+    while window and window[0]['role'] == 'assistant':
+        window.pop(0)
+    return window
+
+
+class ChatHistoryStore:
+    """SQLite-backed store of chat messages keyed by conversation id."""
+
+    def __init__(self, path: str = None, max_messages: int = None,
+                 ttl_days: float = None):
+        if path is None:
+            path = st.CHAT_HISTORY_PATH
+        if max_messages is None:
+            max_messages = st.CHAT_HISTORY_MAX_MESSAGES
+        if ttl_days is None:
+            ttl_days = st.CHAT_HISTORY_TTL_DAYS
+        self.path = path
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.executescript(SCHEMA)
+            self._connection.commit()
+
+    def get_history(self, conversation_id: str) -> list:
+        """Return the messages of a conversation, oldest first."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT role, content, sources FROM messages "
+                "WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,)).fetchall()
+        history = []
+        for role, content, sources in rows:
+            message = {'role': role, 'content': content}
+            if sources is not None:
+                message['sources'] = json.loads(sources)
+            history.append(message)
+        return history
+
+    def append(self, conversation_id: str, role: str, content: str,
+               sources: list = None):
+        """Add a message and drop what exceeds the retention limits."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO messages "
+                "(conversation_id, role, content, sources, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, role, content,
+                 None if sources is None else json.dumps(sources), now))
+            self._connection.execute(
+                "DELETE FROM messages WHERE conversation_id = ? AND id <= ("
+                "SELECT id FROM messages WHERE conversation_id = ? "
+                "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (conversation_id, conversation_id, self.max_messages))
+            self._connection.execute(
+                "DELETE FROM messages WHERE conversation_id IN ("
+                "SELECT conversation_id FROM messages "
+                "GROUP BY conversation_id HAVING MAX(created) < ?)",
+                (now - self.ttl_seconds,))
+            self._connection.commit()
+
+    def reset(self, conversation_id: str):
+        """Delete all messages of a conversation."""
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM messages WHERE conversation_id = ?",
+                (conversation_id,))
+            self._connection.commit()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_chat_store() -> ChatHistoryStore:
+    """Return the process-wide store for the configured CHAT_HISTORY_PATH."""
+    path = st.CHAT_HISTORY_PATH
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ChatHistoryStore(path)
+        return _stores[path]
@@ -9,15 +9,19 @@ Click is used as backbone for the cli.
 An excellent tutorial is found at "https://zetcode.com/python/click".
 """
 
+import sys
 import click
 from pyfiglet import Figlet
 # we have to rename stage so it does not interfere with command stage
 from . import stage as stg
-from .persistency import PersistencyManager
+from .persistency import (
+    PersistencyManager, create_persistency_manager, copy_notes)
 from . import reorganize as ro
 from . import analyse as an
+from . import graph_export as ge
 from . import flask_views as fv
 from . import settings as st
+from .chat_store import window_history
 from . import __version__
 from InquirerPy import prompt
 from dataclasses import dataclass
@@ -44,9 +48,34 @@ class Rename_command(Command):
     new_filename: str
 
 
+def is_outdated(is_unchanged) -> bool:
+    """Check if the confirmed commands still fit the notes.
+
+    Another process (Flask viewer, MCP server) may have changed the
+    notes while the user was asked. Called with the exclusive lock held.
+
+    :param is_unchanged: function returning True if the notes the
+        commands were made from are unchanged, None to skip the check
+    :return: True if the commands no longer fit the notes
+    """
+    if is_unchanged is None or is_unchanged():
+        return False
+    print(Fore.RED + "The notes have been changed in the meantime, "
+          "nothing was done. Please run the command again.")
+    return True
+
+
 def batch_replace(
         command_list: list[Replace_command],
-        persistencyManager: PersistencyManager):
+        persistencyManager: PersistencyManager,
+        is_unchanged=None):
+    """Replace text in files after a single confirmation.
+
+    :param command_list: A list of Replace_command objects.
+    :param persistencyManager: handler for manipulation of the file system
+    :param is_unchanged: function checking that the commands still fit
+        the notes, see is_outdated
+    """
     questions = [
         {
             "type": "confirm",
@@ -58,14 +87,19 @@ def batch_replace(
     print(command_list)
     result = prompt(questions)
     if result["proceed"]:
-        for command in command_list:
-            file_content = persistencyManager.get_string_from_file_content(
-                command.filename)
-            new_file_content = file_content.replace(
-                command.to_be_replaced,
-                command.replace_with)
-            persistencyManager.overwrite_file_content(
-                command.filename, new_file_content)
+        with persistencyManager.locks.exclusive():
+            if is_outdated(is_unchanged):
+                return
+            with persistencyManager.group_commit():
+                for command in command_list:
+                    file_content = (
+                        persistencyManager.get_string_from_file_content(
+                            command.filename))
+                    new_file_content = file_content.replace(
+                        command.to_be_replaced,
+                        command.replace_with)
+                    persistencyManager.overwrite_file_content(
+                        command.filename, new_file_content)
 
 
 def format_rename_output(command_list: list[Rename_command]):
@@ -109,7 +143,8 @@ def format_rename_output(command_list: list[Rename_command]):
 
 def batch_rename(
         command_list: list[Rename_command],
-        persistencyManager: PersistencyManager):
+        persistencyManager: PersistencyManager,
+        is_unchanged=None):
     """Rename a batch of files with single confirmation.
 
     Displays all planned renames, asks for confirmation once,
@@ -119,6 +154,8 @@ def batch_rename(
     :type command_list: list[Rename_command]
     :param persistencyManager: handler for manipulation of the file system
     :type persistencyManager: PersistencyManager
+    :param is_unchanged: function checking that the commands still fit
+        the notes, see is_outdated
     """
     if not command_list:
         format_rename_output(command_list)
@@ -137,9 +174,55 @@ def batch_rename(
 
     result = prompt(questions)
     if result["proceed"]:
-        for command in command_list:
-            persistencyManager.rename_file(
-                command.old_filename, command.new_filename)
+        with persistencyManager.locks.exclusive():
+            if is_outdated(is_unchanged):
+                return
+            with persistencyManager.group_commit():
+                for command in command_list:
+                    persistencyManager.rename_file(
+                        command.old_filename, command.new_filename)
+
+
+def batch_rename_from(create_commands, persistencyManager):
+    """Rename the files as planned from the current list of files.
+
+    The files are only renamed if the list of files is still the same
+    when the exclusive lock is held after the confirmation.
+
+    :param create_commands: function creating the rename commands from
+        a list of filenames
+    """
+    filenames = persistencyManager.get_list_of_filenames()
+
+    def is_unchanged():
+        return (sorted(persistencyManager.get_list_of_filenames())
+                == sorted(filenames))
+    batch_rename(
+        create_commands(filenames), persistencyManager,
+        is_unchanged=is_unchanged)
+
+
+def batch_replace_from(create_commands, persistencyManager):
+    """Replace text as planned from the current notes.
+
+    The plan is made again when the exclusive lock is held after the
+    confirmation, the text is only replaced if it is still the same.
+
+    :param create_commands: function creating the replace commands from
+        the persistencyManager
+    """
+    command_list = create_commands(persistencyManager)
+    batch_replace(
+        command_list, persistencyManager,
+        is_unchanged=lambda: (
+            create_commands(persistencyManager) == command_list))
+
+
+def create_hierarchy_rename_commands(list_of_filenames: list) -> list:
+    tokenized_list = ro.generate_tokenized_list(list_of_filenames)
+    tree = ro.generate_tree(tokenized_list)
+    potential_changes = ro.reorganize_filenames(tree)
+    return ro.create_rename_commands(potential_changes)
 
 
 def check_path_exists(path_to_check: str) -> bool:
@@ -298,19 +381,53 @@ def format_settings_output():
     print(Style.RESET_ALL)
 
 
-def show_banner():
+def show_banner(file=None):
     f = Figlet(font='slant')
-    print(f.renderText('zettelkasten tools'))
-    print("Copyright (c) 2021 Rupert Rebentisch, Version: ", __version__)
+    print(f.renderText('zettelkasten tools'), file=file)
+    print("Copyright (c) 2021 Rupert Rebentisch, Version: ", __version__,
+          file=file)
+
+
+# options of analyse whose value "-" writes data to stdout
+STDOUT_DATA_OPTIONS = ('--dot-file', '--export-file')
+
+
+def writes_data_to_stdout(args) -> bool:
+    """checks if the arguments of a command send its data to stdout"""
+    for position, arg in enumerate(args):
+        option, equals, value = arg.partition('=')
+        if option not in STDOUT_DATA_OPTIONS:
+            continue
+        if not equals:
+            value = args[position + 1] if position + 1 < len(args) else ''
+        if value == '-':
+            return True
+    return False
+
+
+class MessagesGroup(click.Group):
+    """group noting if the invoked command writes data to stdout
+
+    The arguments of the command are no longer available when the
+    callback of the group runs.
+    """
 
+    def invoke(self, ctx):
+        ctx.meta['data_to_stdout'] = writes_data_to_stdout(ctx.args)
+        return super().invoke(ctx)
 
 
 
-@click.group()
-def messages():
-    show_banner()
+
+@click.group(cls=MessagesGroup)
+@click.pass_context
+def messages(ctx):
+    # the DOT source or an export piped into another program must not
+    # start with the banner
+    output = sys.stderr if ctx.meta.get('data_to_stdout') else None
+    show_banner(file=output)
     init(autoreset=True)
-    print('Initializing of tools4zettelkasten ...')
+    print('Initializing of tools4zettelkasten ...', file=output)
     st.check_directories(strict=True)
     pass
 
@@ -325,39 +442,59 @@ def messages():
 def stage(fully):
     persistencyManager = PersistencyManager(
         st.ZETTELKASTEN_INPUT)
-    stg.process_files_from_input(persistencyManager)
+    with persistencyManager.locks.exclusive():
+        stg.process_files_from_input(persistencyManager)
     if fully:
         print('Searching for missing IDs')
-        batch_rename(
-            ro.attach_missing_ids(
-                persistencyManager.get_list_of_filenames()),
-            persistencyManager)
+        batch_rename_from(ro.attach_missing_ids, persistencyManager)
         print('Searching for missing orderingss')
-        batch_rename(
-            ro.attach_missing_orderings(
-                persistencyManager.get_list_of_filenames()),
-            persistencyManager)
+        batch_rename_from(ro.attach_missing_orderings, persistencyManager)
 
 
 @click.command(help='add ids, consecutive numbering, keep links alife')
 def reorganize():
-    persistencyManager = PersistencyManager(
-        st.ZETTELKASTEN)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
     print('Searching for missing IDs')
-    batch_rename(
-        ro.attach_missing_ids(
-            persistencyManager.get_list_of_filenames()), persistencyManager)
+    batch_rename_from(ro.attach_missing_ids, persistencyManager)
     print('Searching for necessary changes in hierachy')
-    tokenized_list = ro.generate_tokenized_list(
-        persistencyManager.get_list_of_filenames())
-    tree = ro.generate_tree(tokenized_list)
-    potential_changes = ro.reorganize_filenames(tree)
-    batch_rename(ro.create_rename_commands(
-        potential_changes), persistencyManager)
+    batch_rename_from(create_hierarchy_rename_commands, persistencyManager)
     print('Searching for invalid links')
-    list_of_commands = ro.generate_list_of_link_correction_commands(
-        persistencyManager)
-    batch_replace(list_of_commands, persistencyManager)
+    batch_replace_from(
+        ro.generate_list_of_link_correction_commands, persistencyManager)
+
+
+def show_graph_metrics(analysis, explicit_only, top):
+    try:
+        from . import graph_metrics as gm
+    except ImportError:
+        print(Fore.RED + "numpy and scipy are required for metrics.")
+        print("Install with: pip install 'tools4zettelkasten[metrics]'")
+        return
+    link_table = (
+        analysis.link_table.select(kind=an.EXPLICIT) if explicit_only
+        else analysis.link_table)
+    summary = gm.summarize_graph_metrics(
+        gm.compute_graph_metrics(analysis.list_of_filenames, link_table),
+        top=top)
+    print(f"Linked pairs of notes: {summary['connected_pairs']}")
+    print("Weakly connected components: "
+          f"{summary['weakly_connected_components']} "
+          f"(largest: {summary['largest_weak_component']} notes)")
+    print("Strongly connected components: "
+          f"{summary['strongly_connected_components']} "
+          f"(largest: {summary['largest_strong_component']} notes)")
+    for title, key in (
+            ('PageRank', 'pagerank'), ('Hubs', 'hubs'),
+            ('Authorities', 'authorities'), ('Most linked', 'most_linked'),
+            ('Most linking', 'most_linking')):
+        print(Fore.YELLOW + title + ":" + Style.RESET_ALL)
+        for entry in summary[key]:
+            print(f"  {entry['score']:>10g}  {entry['filename']}")
+    for title, key in (('Orphans', 'orphans'), ('Dead ends', 'dead_ends')):
+        print(Fore.YELLOW + f"{title} ({len(summary[key])}):"
+              + Style.RESET_ALL)
+        for filename in summary[key]:
+            print("  " + filename)
 
 
 @click.command(help='analyse your Zettelkasten')
@@ -365,32 +502,209 @@ def reorganize():
         '-t',
         '--type',
         help='type of analysis',
-        type=click.Choice(['graph', 'tree'], case_sensitive=False),
+        type=click.Choice(
+            ['graph', 'overview', 'tree', 'metrics'], case_sensitive=False),
         default='graph',
         show_default=True
     )
-def analyse(type):
-    print(type)
-    print("Analysing the Zettelkasten")
-    persistencyManager = PersistencyManager(
-        st.ZETTELKASTEN)
-    analysis = an.create_graph_analysis(
-        persistencyManager)
-    print("Number of Zettel: ", len(analysis.list_of_filenames))
+@click.option(
+    '--topic',
+    default=None,
+    help='only the notes of a topic, given by its ordering, e.g. 01_02')
+@click.option(
+    '--around',
+    default=None,
+    help='only the neighborhood of a note, given by filename or id')
+@click.option(
+    '--hops',
+    default=1,
+    type=int,
+    help='links to follow from the note given by --around',
+    show_default=True)
+@click.option(
+    '--depth',
+    default=1,
+    type=int,
+    help='overview: subtrees below this depth are collapsed, drill down '
+         'with --topic <subtree> --depth <depth + 1>',
+    show_default=True)
+@click.option(
+    '--dot-file',
+    default=None,
+    help='write the DOT source to this file ("-" for stdout) instead of '
+         'rendering it, e.g. to pipe it into graphviz')
+@click.option(
+    '--print-source',
+    is_flag=True,
+    help='print the DOT source while rendering the graph')
+@click.option(
+    '--explicit-only',
+    is_flag=True,
+    help='metrics: only consider explicit links, not the structure')
+@click.option(
+    '--top',
+    default=10,
+    type=int,
+    help='metrics: number of notes listed per ranking',
+    show_default=True)
+@click.option(
+    '--export',
+    type=click.Choice(ge.EXPORT_FORMATS),
+    default=None,
+    help='export notes and typed links instead of analysing them, '
+         'npz holds CSR matrices and requires numpy and scipy')
+@click.option(
+    '--export-file',
+    default=None,
+    help='file of the export ("-" for stdout), default: '
+         'zettelkasten.<format>')
+def analyse(
+        type, topic, around, hops, depth, dot_file, print_source,
+        explicit_only, top, export, export_file):
+    # keep stdout clean when the DOT source or an export is written to it
+    messages_output = (
+        sys.stderr if '-' in (dot_file, export_file) else sys.stdout)
+    print(type, file=messages_output)
+    print("Analysing the Zettelkasten", file=messages_output)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    if topic is not None:
+        analysis = an.create_topic_analysis(persistencyManager, topic)
+    else:
+        analysis = an.create_graph_analysis(
+            persistencyManager)
+    if around is not None:
+        try:
+            analysis = an.create_neighborhood_analysis(
+                analysis, around, hops)
+        except ValueError as error:
+            print(Fore.RED + str(error), file=sys.stderr)
+            return
+    print("Number of Zettel: ", len(analysis.list_of_filenames),
+          file=messages_output)
+    if export is not None:
+        export_graph(analysis, export, export_file)
+        return
     if (type == 'tree'):
         an.show_tree_as_list(analysis.tree)
+        return
+    if (type == 'metrics'):
+        show_graph_metrics(analysis, explicit_only, top)
+        return
+    if (type == 'overview'):
+        dot = an.create_overview_graph_of_zettelkasten(
+            analysis.list_of_filenames,
+            analysis.list_of_structure_links,
+            analysis.list_of_explicit_links,
+            depth,
+            url_in_nodes=False)
     else:
-        dot = an.create_graph_of_zettelkasten(
+        # the lines of the graph are produced while they are written
+        dot = an.iter_dot_lines_of_zettelkasten(
             analysis.list_of_filenames,
             analysis.list_of_links,
             url_in_nodes=False)
-        an.show_graph_of_zettelkasten(dot)
+    if dot_file == '-':
+        an.write_dot_lines(dot, sys.stdout)
+    elif dot_file is not None:
+        with open(dot_file, 'w', encoding='utf-8') as output:
+            an.write_dot_lines(dot, output, echo=print_source)
+        print("DOT source written to " + dot_file)
+    else:
+        an.show_graph_of_zettelkasten(dot, print_source=print_source)
+
+
+def export_graph(analysis, format, export_file):
+    if export_file is None:
+        export_file = 'zettelkasten.' + format
+    elif (format == 'npz' and export_file != '-'
+            and not export_file.endswith('.npz')):
+        # numpy would append the suffix itself, report the real path
+        export_file += '.npz'
+    try:
+        if export_file == '-':
+            ge.write_export(
+                format, analysis.list_of_filenames, analysis.link_table,
+                sys.stdout.buffer if format == 'npz' else sys.stdout)
+        elif format == 'npz':
+            ge.write_export(
+                format, analysis.list_of_filenames, analysis.link_table,
+                export_file)
+        else:
+            with open(export_file, 'w', encoding='utf-8') as output:
+                ge.write_export(
+                    format, analysis.list_of_filenames,
+                    analysis.link_table, output)
+    except ImportError:
+        print(Fore.RED + "numpy and scipy are required for npz.",
+              file=sys.stderr)
+        print("Install with: pip install 'tools4zettelkasten[metrics]'",
+              file=sys.stderr)
+        return
+    if export_file != '-':
+        print("Graph exported to " + export_file)
 
 
 @click.command(help='start flask server')
-def start():
+@click.option(
+    '--warm-up/--no-warm-up',
+    default=st.RAG_WARM_UP,
+    help='load vector store and embedding model at start',
+    show_default=True
+)
+@click.option(
+    '--production',
+    is_flag=True,
+    help='serve with a production WSGI server instead of the '
+         'development server')
+@click.option(
+    '--server',
+    type=click.Choice(['waitress', 'gunicorn']),
+    default='waitress',
+    help='production server, gunicorn runs several worker processes',
+    show_default=True)
+@click.option(
+    '--host', default='127.0.0.1', help='address to bind to',
+    show_default=True)
+@click.option(
+    '--port', default=5001, type=int, help='port to bind to',
+    show_default=True)
+@click.option(
+    '--workers', default=1, type=int,
+    help='worker processes (gunicorn)', show_default=True)
+@click.option(
+    '--threads', default=8, type=int,
+    help='threads per worker', show_default=True)
+def start(warm_up, production, server, host, port, workers, threads):
     print("starting flask server")
-    fv.run_flask_server()
+    if not production:
+        fv.run_flask_server(warm_up=warm_up)
+        return
+    try:
+        fv.run_production_server(
+            host=host, port=port, workers=workers, threads=threads,
+            server=server, warm_up=warm_up)
+    except ImportError as error:
+        print(Fore.RED + str(error))
+
+
+@click.command(help='copy all notes into another folder or database')
+@click.option(
+    '--source',
+    default=None,
+    help='location to read from (default: ZETTELKASTEN setting)')
+@click.option(
+    '--target',
+    required=True,
+    help='markdown folder or sqlite:///path.db to write to')
+def export(source, target):
+    if source is None:
+        source = st.ZETTELKASTEN
+    source_manager = create_persistency_manager(source)
+    target_manager = create_persistency_manager(target)
+    if isinstance(target_manager, PersistencyManager):
+        target_manager.directory.mkdir(parents=True, exist_ok=True)
+    number_of_notes = copy_notes(source_manager, target_manager)
+    print(f"Exported {number_of_notes} notes from {source} to {target}")
 
 
 @click.command(help='show version and current settings')
@@ -434,7 +748,7 @@ def vectorize(full, stats):
             print(Fore.RED + f"Error: {e}")
         return
 
-    persistencyManager = PersistencyManager(st.ZETTELKASTEN)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
 
     if full:
         import chromadb
@@ -488,7 +802,12 @@ def vectorize(full, stats):
               help='number of zettel to retrieve per question '
                    '(default: RAG_TOP_K setting, currently '
                    f'{st.RAG_TOP_K})')
-def chat(top_k):
+@click.option('--mode', type=click.Choice(st.RAG_SEARCH_MODES),
+              default=st.RAG_SEARCH_MODE,
+              help='retrieval: embeddings (vector), BM25 full-text index '
+                   '(lexical) or both fused by rank (hybrid)',
+              show_default=True)
+def chat(top_k, mode):
     try:
         from . import rag
     except ImportError:
@@ -502,8 +821,8 @@ def chat(top_k):
         print("Please set it to your OpenAI API key.")
         return
 
-    store = rag.VectorStore()
-    if store.get_stats()['total_documents'] == 0:
+    if (mode != 'lexical'
+            and rag.get_vector_store().get_stats()['total_documents'] == 0):
         print(Fore.YELLOW + "Vector database is empty. "
               "Run 'vectorize' first.")
         return
@@ -525,7 +844,7 @@ def chat(top_k):
         if not query.strip():
             continue
 
-        search_results = store.search(query, top_k=top_k)
+        search_results = rag.search(query, top_k=top_k, mode=mode)
         try:
             print(f"\n{Fore.GREEN}Zettelkasten:{Style.RESET_ALL} ", end="",
                   flush=True)
@@ -576,11 +895,13 @@ def chat(top_k):
 
         conversation_history.append({'role': 'user', 'content': query})
         conversation_history.append({'role': 'assistant', 'content': response})
+        conversation_history = window_history(conversation_history)
 
 
 messages.add_command(stage)
 messages.add_command(reorganize)
 messages.add_command(analyse)
+messages.add_command(export)
 messages.add_command(start)
 messages.add_command(settings)
 messages.add_command(mcp)
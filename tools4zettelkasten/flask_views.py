@@ -5,11 +5,24 @@
 from ast import Str
 from flask import (
     Flask, render_template, send_from_directory, redirect, url_for, request,
-    session, jsonify)
+    session, jsonify, Response, make_response, abort)
 from . import settings as st
+from . import handle_filenames as hf
 from . import analyse as an
-from . import reorganize as ro
-from .persistency import PersistencyManager
+from . import graph_export as ge
+from .persistency import (
+    PersistencyManager, create_persistency_manager,
+    close_persistency_managers)
+from .chat_store import get_chat_store, new_conversation_id, window_history
+from .render_cache import RenderCache, SvgRenderCache, fingerprint
+from .note_index import get_note_index
+from .title_index import get_title_index
+from .graph_layout import LayoutCache, render_svg_with_stable_layout
+from . import __version__
+import bisect
+import gzip
+import json
+import math
 import markdown
 from pygments.formatters import HtmlFormatter
 from flask_wtf import FlaskForm
@@ -18,6 +31,11 @@ from wtforms.fields import SubmitField
 from flask_pagedown import PageDown
 import os
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # After some attempts I initialize the app object in this file.
 # The app object will be initialized in the import procedure of
 # this file.
@@ -33,30 +51,231 @@ app = Flask(
 
 pagedown = PageDown(app)
 
+MARKDOWN_EXTENSIONS = [
+    "fenced_code",
+    'codehilite',
+    'attr_list',
+    'pymdownx.arithmatex']
+MARKDOWN_EXTENSION_CONFIGS = {'pymdownx.arithmatex': {'generic': True}}
+MARKDOWN_CONFIG_FINGERPRINT = fingerprint({
+    'markdown': markdown.__version__,
+    'extensions': MARKDOWN_EXTENSIONS,
+    'extension_configs': MARKDOWN_EXTENSION_CONFIGS})
+# the style sheet of the code highlighting is the same for all notes
+CODE_CSS_STRING = HtmlFormatter(
+    style="emacs", full=True, cssclass="codehilite").get_style_defs()
+
+render_cache = RenderCache(
+    maxsize=st.RENDER_CACHE_SIZE, directory=st.RENDER_CACHE_PATH or None)
+svg_cache = SvgRenderCache()
+layout_cache = (
+    LayoutCache(st.GRAPH_LAYOUT_PATH) if st.GRAPH_LAYOUT_PATH else None)
+# node and edge lists served by /api/graph, per topic and link type
+graph_data_cache = RenderCache(maxsize=16)
+# notes of one level of the tree on the start page per request
+TREE_PAGE_SIZE = 200
+TREE_MAX_PAGE_SIZE = 1000
+GRAPH_PAGE_SIZE = 1000
+GRAPH_MAX_PAGE_SIZE = 10000
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'image/svg+xml', 'application/json', 'text/css',
+    'application/javascript'}
+
+
+def make_etag(*parts) -> str:
+    """ETag of a page, changes with the given parts or a new version."""
+    return fingerprint([__version__] + list(parts))[:32]
+
+
+def get_notes_fingerprint(persistencyManager) -> str:
+    """Fingerprint of the names and modification times of all notes."""
+    return fingerprint([
+        persistencyManager.get_directory_fingerprint(),
+        sorted(
+            (filename, persistencyManager.get_modification_time(filename))
+            for filename in persistencyManager.get_list_of_filenames())])
+
+
+def conditional_response(etag: str, render):
+    """Answer with 304 if the browser has the page already.
+
+    The page is only rendered if the ETag does not match. The ETag is
+    weak, so it remains valid for the compressed response.
+
+    :param etag: ETag of the current version of the page
+    :param render: function returning the page
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress text responses with brotli or gzip."""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < st.COMPRESS_MIN_SIZE:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
 
 class PageDownForm(FlaskForm):
     pagedown = PageDownField('Enter your markdown')
     submit = SubmitField('Save')
 
 
-def run_flask_server():
+def warm_up_rag():
+    """Load the shared vector store in the background, if RAG is installed."""
+    try:
+        from . import rag
+    except ImportError:
+        return
+    rag.warm_up_vector_store(background=True)
+
+
+def configure_secret_key():
+    """Use FLASK_SECRET_KEY or, if it is not set, a random key."""
+    app.config['SECRET_KEY'] = st.FLASK_SECRET_KEY or os.urandom(32)
+
+
+def preload_note_index():
+    """Build the navigation order of the notes before requests arrive."""
+    try:
+        persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+        with persistencyManager.locks.shared():
+            get_note_index(persistencyManager)
+    except OSError as error:
+        print("note index not preloaded: " + str(error))
+
+
+def run_flask_server(warm_up: bool = False):
     """Run the flask server on port 5001.
 
     Port 5001 is used instead of the Flask default 5000
     because macOS Monterey and later use port 5000 for AirPlay Receiver.
+
+    :param warm_up: load the vector store and embedding model in the
+        background, so the first chat message does not wait for them
     """
-    SECRET_KEY = os.urandom(32)
-    app.config['SECRET_KEY'] = SECRET_KEY
+    # in debug mode the reloader serves the requests from a child
+    # process, the parent only watches the files and needs no model
+    if warm_up and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up_rag()
+    configure_secret_key()
     app.debug = True
     print("Server running at http://127.0.0.1:5001/")
     app.run(host='127.0.0.1', port=5001)
 
 
+def run_production_server(
+        host: str = '127.0.0.1', port: int = 5001, workers: int = 1,
+        threads: int = 8, server: str = 'waitress', warm_up: bool = False):
+    """Run the flask app under a production WSGI server.
+
+    waitress serves all requests from one process with a pool of
+    threads. gunicorn (POSIX only) forks worker processes. The app and
+    the note index are loaded before the workers are forked, so they
+    start with the index in place. The connections used for it are
+    closed before the fork, every worker opens its own.
+
+    :param host: address to bind to
+    :param port: port to bind to
+    :param workers: number of worker processes (gunicorn only)
+    :param threads: number of threads (per worker)
+    :param server: 'waitress' or 'gunicorn'
+    :param warm_up: load the vector store in every serving process
+    """
+    configure_secret_key()
+    if not st.FLASK_SECRET_KEY and (server == 'gunicorn' or workers > 1):
+        print("FLASK_SECRET_KEY is not set, "
+              "sessions are lost when the server restarts")
+    preload_note_index()
+    if server == 'gunicorn':
+        # the workers must not share the connection or client
+        close_persistency_managers()
+        _run_gunicorn(host, port, workers, threads, warm_up)
+        return
+    try:
+        import waitress
+    except ImportError:
+        raise ImportError(
+            "waitress is required for the production server. "
+            "Install with: pip install 'tools4zettelkasten[server]'")
+    if workers > 1:
+        print("waitress runs a single process, use --threads "
+              "or --server gunicorn for more workers")
+    if warm_up:
+        warm_up_rag()
+    print(f"Server running at http://{host}:{port}/")
+    waitress.serve(app, host=host, port=port, threads=threads)
+
+
+def _run_gunicorn(host, port, workers, threads, warm_up):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise ImportError(
+            "gunicorn is required for --server gunicorn. "
+            "Install with: pip install 'tools4zettelkasten[server]'")
+
+    options = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        # load the app and the note index once before forking
+        'preload_app': True,
+    }
+    if warm_up:
+        # threads do not survive a fork, every worker loads on its own
+        options['post_fork'] = lambda server, worker: warm_up_rag()
+
+    class ZettelkastenApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    ZettelkastenApplication().run()
+
+
+def render_markdown(markdown_string: str) -> str:
+    return markdown.markdown(
+        markdown_string, output_format='html5',
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs=MARKDOWN_EXTENSION_CONFIGS)
+
+
 def url_for_file(filename) -> Str:
     URL = url_for('show_md_file', file=filename)
     return URL
 
 
+def url_for_topic(prefix, depth) -> Str:
+    """URL of the overview graph of a topic, used to drill down"""
+    return url_for('svggraph_of_topic', prefix=prefix, depth=depth)
+
+
 def get_adjacent_files(filename: str, sorted_list: list) -> tuple:
     """Ermittelt vorherige und nächste Datei in der hierarchischen Liste.
 
@@ -78,59 +297,107 @@ def get_adjacent_files(filename: str, sorted_list: list) -> tuple:
 def get_sorted_zettelkasten_list(persistencyManager: PersistencyManager) -> list:
     """Ermittelt die hierarchisch sortierte Liste aller Notizen.
 
+    Die Liste wird zwischengespeichert, bis sich die Dateien ändern.
+
     :param persistencyManager: PersistencyManager Instanz
     :return: Hierarchisch sortierte Liste der Dateinamen
     """
-    zettelkasten_list = persistencyManager.get_list_of_filenames()
-    tokenized_list = ro.generate_tokenized_list(zettelkasten_list)
-    tree = ro.generate_tree(tokenized_list)
-    return ro.flatten_tree_to_list(tree)
+    return get_note_index(persistencyManager).order
 
 
 @app.route('/')
 def index():
-    persistencyManager = PersistencyManager(
-        st.ZETTELKASTEN)
-    zettelkasten_list = get_sorted_zettelkasten_list(persistencyManager)
-    return render_template('startpage.html', zettelkasten=zettelkasten_list)
+    """Top level of the hierarchy, the subtrees are loaded on demand."""
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    with persistencyManager.locks.shared():
+        etag = make_etag(
+            'index', persistencyManager.get_directory_fingerprint())
+        return conditional_response(etag, lambda: render_template(
+            'startpage.html',
+            tree=get_tree_page(
+                get_note_index(persistencyManager), '', 0,
+                TREE_PAGE_SIZE)))
+
+
+def get_tree_page(note_index, ordering: str, offset: int, limit: int) -> dict:
+    """One page of the children of a note with their subtree sizes."""
+    children = note_index.get_children(ordering)
+    nodes = []
+    for filename in children[offset:offset + limit]:
+        note = hf.create_Note(filename)
+        descendants = (
+            note_index.count_descendants(note.ordering)
+            if note.ordering else 0)
+        nodes.append({
+            'filename': filename,
+            'ordering': note.ordering,
+            'title': note.base_filename.replace('_', ' '),
+            'url': url_for_file(filename),
+            'descendants': descendants,
+        })
+    return {
+        'ordering': ordering,
+        'offset': offset,
+        'limit': limit,
+        'total': len(children),
+        'children': nodes,
+    }
+
+
+@app.route('/api/tree')
+def api_tree():
+    """Children of the note with ?ordering=<ordering>, the top level
+    without it, paged with offset and limit."""
+    ordering = request.args.get('ordering', '')
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get(
+        'limit', TREE_PAGE_SIZE, type=int), 1), TREE_MAX_PAGE_SIZE)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    with persistencyManager.locks.shared():
+        etag = make_etag(
+            'api/tree', persistencyManager.get_directory_fingerprint(),
+            ordering, offset, limit)
+        return conditional_response(etag, lambda: jsonify(get_tree_page(
+            get_note_index(persistencyManager), ordering, offset, limit)))
 
 
 @app.route('/<file>')
 def show_md_file(file):
-    persistencyManager = PersistencyManager(
-        st.ZETTELKASTEN)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
     filename = file
 
-    # Hierarchisch sortierte Liste für Navigation ermitteln
-    sorted_list = get_sorted_zettelkasten_list(persistencyManager)
-    previous_file, next_file = get_adjacent_files(filename, sorted_list)
-
-    input_file = persistencyManager.get_string_from_file_content(filename)
-    htmlString = markdown.markdown(
-        input_file, output_format='html5',
-        extensions=[
-            "fenced_code",
-            'codehilite',
-            'attr_list',
-            'pymdownx.arithmatex'],
-        extension_configs={'pymdownx.arithmatex': {'generic': True}}
-    )
-    formatter = HtmlFormatter(style="emacs", full=True, cssclass="codehilite")
-    css_string = formatter.get_style_defs()
-    return render_template(
-        "mainpage.html",
-        codeCSSString="<style>" + css_string + "</style>",
-        htmlString=htmlString,
-        filename=filename,
-        previous_file=previous_file,
-        next_file=next_file)
+    with persistencyManager.locks.shared():
+        # Nachbarn in der hierarchisch sortierten Liste nachschlagen
+        previous_file, next_file = get_note_index(
+            persistencyManager).get_adjacent_files(filename)
+
+        input_file = persistencyManager.get_string_from_file_content(
+            filename)
+    etag = make_etag(
+        'note', filename, fingerprint(input_file),
+        MARKDOWN_CONFIG_FINGERPRINT, previous_file, next_file)
+
+    def _render():
+        htmlString = render_cache.get_or_render(
+            filename, input_file, MARKDOWN_CONFIG_FINGERPRINT,
+            render_markdown)
+        return render_template(
+            "mainpage.html",
+            codeCSSString="<style>" + CODE_CSS_STRING + "</style>",
+            htmlString=htmlString,
+            filename=filename,
+            previous_file=previous_file,
+            next_file=next_file)
+
+    return conditional_response(etag, _render)
 
 
 @app.route('/edit/<filename>', methods=['GET', 'POST'])
 def edit(filename):
-    persistencyManager = PersistencyManager(
-        st.ZETTELKASTEN)
-    input_file = persistencyManager.get_string_from_file_content(filename)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    with persistencyManager.locks.shared():
+        input_file = persistencyManager.get_string_from_file_content(
+            filename)
     markdown_string = input_file
     form = PageDownForm()
     form.pagedown.data = markdown_string
@@ -138,38 +405,289 @@ def edit(filename):
         if request.method == 'POST':
             new_markdown_string = request.form['pagedown']
             form.pagedown.data = new_markdown_string
-            persistencyManager.overwrite_file_content(
-                filename, new_markdown_string)
+            with persistencyManager.locks.shared(), \
+                    persistencyManager.locks.file_lock(filename):
+                persistencyManager.overwrite_file_content(
+                    filename, new_markdown_string)
+                get_title_index(persistencyManager).update_note(
+                    persistencyManager, filename)
             return redirect(url_for('show_md_file', file=filename))
     return render_template('edit.html', form=form, filename=filename)
 
 
+@app.route('/api/suggest')
+def api_suggest():
+    """Notes whose title matches ?q=, tolerant of typos, best first."""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    with persistencyManager.locks.shared():
+        matches = get_title_index(persistencyManager).search(query, limit)
+    suggestions = []
+    for filename, title, score in matches:
+        note = hf.create_Note(filename)
+        suggestions.append({
+            'filename': filename,
+            'title': title,
+            'id': note.id,
+            'ordering': note.ordering,
+            'url': url_for_file(filename),
+            'score': score,
+        })
+    return jsonify(suggestions)
+
+
 @app.route('/images/<path:filename>')
 def send_image(filename):
+    # images are answered with ETag and Last-Modified by send_file
     return send_from_directory(
         st.ZETTELKASTEN_IMAGES,
-        filename)
+        filename,
+        max_age=st.IMAGE_CACHE_MAX_AGE)
 
 
 @app.route('/svggraph')
 def svggraph():
-    persistencyManager = PersistencyManager(
-        st.ZETTELKASTEN)
-    analysis = an.create_graph_analysis(
-        persistencyManager)
-    dot = an.create_graph_of_zettelkasten(
-            analysis.list_of_filenames,
-            analysis.list_of_links,
-            url_in_nodes=True)
-    chart_output = dot.pipe(format='svg').decode('utf-8')
+    """Graph of all notes, ?around=<note>&hops=<k> selects a neighborhood,
+    ?depth=<d> shows an overview with the subtrees below d collapsed."""
+    around = request.args.get('around')
+    depth = request.args.get('depth', type=int)
+    if around or depth:
+        return svggraph_of_view(
+            None, around, request.args.get('hops', 1, type=int), depth)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    with persistencyManager.locks.shared():
+        notes_fingerprint = get_notes_fingerprint(persistencyManager)
+    etag = make_etag('svggraph', notes_fingerprint)
+    if request.if_none_match.contains_weak(etag):
+        # the browser shows the graph of the current notes already
+        return conditional_response(etag, None)
+
+    def _create_graph():
+        with persistencyManager.locks.shared():
+            analysis = an.create_graph_analysis(
+                persistencyManager)
+        # the nodes contain URLs, so the graph is built in the request
+        dot = an.create_graph_of_zettelkasten(
+                analysis.list_of_filenames,
+                analysis.list_of_links,
+                url_in_nodes=True)
+        graph_fingerprint = an.get_graph_fingerprint(
+            analysis.list_of_filenames, analysis.list_of_links)
+        if layout_cache is None:
+            return graph_fingerprint, lambda: dot.pipe(
+                format='svg').decode('utf-8')
+        node_ids = [
+            hf.create_Note(filename).id
+            for filename in analysis.list_of_filenames]
+        return graph_fingerprint, lambda: render_svg_with_stable_layout(
+            dot, node_ids, layout_cache, str(persistencyManager.directory))
+
+    # while a changed graph is rendered, the last SVG is served with the
+    # ETag of the notes it was rendered from
+    chart_output, rendered_fingerprint = svg_cache.get_svg(
+        notes_fingerprint, _create_graph)
+    return conditional_response(
+        make_etag('svggraph', rendered_fingerprint),
+        lambda: render_template('visualzk.html', chart_output=chart_output))
+
+
+@app.route('/svggraph/<prefix>')
+def svggraph_of_topic(prefix):
+    """Graph of the notes of the topic with the ordering prefix."""
+    return svggraph_of_view(
+        prefix, request.args.get('around') or None,
+        request.args.get('hops', 1, type=int),
+        request.args.get('depth', type=int))
+
+
+def svggraph_of_view(topic, around, hops, depth=None):
+    """Render the graph of a part of the Zettelkasten.
+
+    Only the notes of the view are laid out, so the time graphviz needs
+    depends on the size of the view. A topic is read without the other
+    notes. With a depth the subtrees below it are collapsed into single
+    nodes, which link to the overview one level deeper.
+    """
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    with persistencyManager.locks.shared():
+        notes_fingerprint = get_notes_fingerprint(persistencyManager)
+    etag = make_etag(
+        'svggraph', notes_fingerprint, topic, around, hops, depth)
+
+    def _render():
+        with persistencyManager.locks.shared():
+            if topic is not None:
+                analysis = an.create_topic_analysis(
+                    persistencyManager, topic)
+            else:
+                analysis = an.create_graph_analysis(persistencyManager)
+        if around is not None:
+            try:
+                analysis = an.create_neighborhood_analysis(
+                    analysis, around, hops)
+            except ValueError:
+                abort(404)
+        if depth:
+            dot = an.create_overview_graph_of_zettelkasten(
+                analysis.list_of_filenames,
+                analysis.list_of_structure_links,
+                analysis.list_of_explicit_links,
+                depth,
+                url_in_nodes=True)
+        else:
+            dot = an.create_graph_of_zettelkasten(
+                    analysis.list_of_filenames,
+                    analysis.list_of_links,
+                    url_in_nodes=True)
+        chart_output = dot.pipe(format='svg').decode('utf-8')
+        return render_template('visualzk.html', chart_output=chart_output)
+
+    return conditional_response(etag, _render)
+
+
+def get_graph_data(persistencyManager, notes_fingerprint, topic, kind):
+    """Nodes and edges of the graph, edges refer to node positions.
+
+    The lists are cached until the notes change.
+    """
+    name = f'{persistencyManager.directory}:{topic}:{kind}'
+    graph_data = graph_data_cache.get(name, notes_fingerprint)
+    if graph_data is not None:
+        return graph_data
+    with persistencyManager.locks.shared():
+        if topic is not None:
+            analysis = an.create_topic_analysis(persistencyManager, topic)
+        else:
+            analysis = an.create_graph_analysis(persistencyManager)
+    filenames = analysis.list_of_filenames
+    link_table = analysis.link_table.select(kind=kind, filenames=filenames)
+    positions = {
+        link_table.find_note_id(filename): position
+        for position, filename in enumerate(filenames)}
+    nodes = []
+    for filename in filenames:
+        attributes = ge.get_node_attributes(filename)
+        nodes.append([
+            filename, attributes['note_id'], attributes['ordering'],
+            attributes['title']])
+    edges = [
+        [positions[source], positions[target], edge_kind]
+        for source, target, edge_kind in zip(
+            link_table.sources, link_table.targets, link_table.kinds)]
+    # sorted by source, so a page of nodes has a contiguous range of edges
+    edges.sort(key=lambda edge: edge[0])
+    graph_data = {'nodes': nodes, 'edges': edges}
+    graph_data_cache.put(name, notes_fingerprint, graph_data)
+    return graph_data
+
+
+@app.route('/api/graph')
+def api_graph():
+    """Nodes and edges of the graph as compact JSON, one page of nodes.
+
+    Query parameters: topic (ordering prefix), link_type (all, structure
+    or explicit), page (starting with 1) and per_page. A node is
+    [filename, id, ordering, title], an edge is [source, target, type]
+    with the positions of the nodes in the whole graph. A page contains
+    the edges starting at its nodes.
+    """
+    topic = request.args.get('topic') or None
+    link_type = request.args.get('link_type', 'all')
+    kinds = {name: kind for kind, name in ge.LINK_TYPES.items()}
+    if link_type != 'all' and link_type not in kinds:
+        abort(400)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get(
+        'per_page', GRAPH_PAGE_SIZE, type=int), 1), GRAPH_MAX_PAGE_SIZE)
+    persistencyManager = create_persistency_manager(st.ZETTELKASTEN)
+    with persistencyManager.locks.shared():
+        notes_fingerprint = get_notes_fingerprint(persistencyManager)
+    etag = make_etag(
+        'api/graph', notes_fingerprint, topic, link_type, page, per_page)
+
+    def _render():
+        graph_data = get_graph_data(
+            persistencyManager, notes_fingerprint, topic,
+            kinds.get(link_type))
+        nodes = graph_data['nodes']
+        edges = graph_data['edges']
+        offset = (page - 1) * per_page
+        end = offset + per_page
+        first_edge = bisect.bisect_left(edges, [offset])
+        last_edge = bisect.bisect_left(edges, [end])
+        return jsonify({
+            'page': page,
+            'per_page': per_page,
+            'pages': max(math.ceil(len(nodes) / per_page), 1),
+            'total_nodes': len(nodes),
+            'total_edges': len(edges),
+            'offset': offset,
+            'link_types': [
+                ge.LINK_TYPES[kind] for kind in sorted(ge.LINK_TYPES)],
+            'nodes': nodes[offset:end],
+            'edges': edges[first_edge:last_edge],
+        })
+
+    return conditional_response(etag, _render)
+
+
+@app.route('/graph')
+def graph_view():
+    """Graph laid out in the browser with the data of /api/graph."""
+    return render_template(
+        'graph.html', topic=request.args.get('topic', ''),
+        link_type=request.args.get('link_type', 'all'))
+
+
+def get_conversation_history(chat_history: list) -> list:
+    """Extract the messages for the LLM from the displayed chat history.
+
+    Only the most recent messages are sent, see CHAT_CONTEXT_MESSAGES and
+    CHAT_CONTEXT_CHARS.
+    """
+    return window_history([
+        {'role': msg['role'], 'content': msg['content']}
+        for msg in chat_history
+        if msg['role'] in ('user', 'assistant')
+    ])
+
+
+def get_chat_id() -> str:
+    """Return the conversation id of this session, create one if needed."""
+    if 'chat_id' not in session:
+        session['chat_id'] = new_conversation_id()
+    return session['chat_id']
+
 
-    return render_template('visualzk.html', chart_output=chart_output)
+def get_search_mode(values) -> str:
+    """Search mode chosen in the chat form, RAG_SEARCH_MODE if none."""
+    mode = values.get('mode')
+    return mode if mode in st.RAG_SEARCH_MODES else st.RAG_SEARCH_MODE
+
+
+def get_sources(search_results: list) -> list:
+    """Describe the retrieved zettel for display below an answer."""
+    return [
+        {
+            'zettel_id': r.zettel_id,
+            'title': r.title,
+            'ordering': r.ordering,
+            'filename': r.filename,
+        }
+        for r in search_results
+    ]
+
+
+def format_sse(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
 @app.route('/chat', methods=['GET', 'POST'])
 def chat_view():
-    if 'chat_history' not in session:
-        session['chat_history'] = []
+    chat_id = get_chat_id()
+    chat_store = get_chat_store()
 
     if request.method == 'POST':
         query = request.form.get('query', '').strip()
@@ -179,54 +697,87 @@ def chat_view():
         try:
             from . import rag
         except ImportError:
-            session['chat_history'].append({
-                'role': 'error',
-                'content': "RAG dependencies not installed. "
-                           "Install with: pip install 'tools4zettelkasten[rag]'"
-            })
+            chat_store.append(
+                chat_id, 'error',
+                "RAG dependencies not installed. "
+                "Install with: pip install 'tools4zettelkasten[rag]'")
             return redirect(url_for('chat_view'))
 
+        mode = get_search_mode(request.form)
         try:
-            store = rag.VectorStore()
-            search_results = store.search(query)
-            conversation_history = []
-            for msg in session['chat_history']:
-                if msg['role'] in ('user', 'assistant'):
-                    conversation_history.append({
-                        'role': msg['role'],
-                        'content': msg['content']
-                    })
+            search_results = rag.search(query, mode=mode)
+            conversation_history = get_conversation_history(
+                chat_store.get_history(chat_id))
             response = rag.chat_completion(
                 query, search_results, conversation_history)
-            sources = [
-                {
-                    'zettel_id': r.zettel_id,
-                    'title': r.title,
-                    'ordering': r.ordering,
-                    'filename': r.filename,
-                }
-                for r in search_results
-            ]
-            session['chat_history'].append({
-                'role': 'user', 'content': query})
-            session['chat_history'].append({
-                'role': 'assistant',
-                'content': response,
-                'sources': sources,
-            })
-            session.modified = True
+            chat_store.append(chat_id, 'user', query)
+            chat_store.append(
+                chat_id, 'assistant', response,
+                sources=get_sources(search_results))
         except Exception as e:
-            session['chat_history'].append({
-                'role': 'error', 'content': str(e)})
-            session.modified = True
+            chat_store.append(chat_id, 'error', str(e))
 
-        return redirect(url_for('chat_view'))
+        return redirect(url_for('chat_view', mode=mode))
 
     return render_template(
-        'chat.html', chat_history=session.get('chat_history', []))
+        'chat.html', chat_history=chat_store.get_history(chat_id),
+        search_modes=st.RAG_SEARCH_MODES,
+        search_mode=get_search_mode(request.args))
+
+
+@app.route('/chat/stream')
+def chat_stream():
+    """Stream the answer to a chat question as Server-Sent Events.
+
+    The sources are sent first, followed by one ``token`` event per chunk
+    of the answer and a final ``done`` event. The complete exchange is
+    stored in the server-side chat history when the stream ends.
+    """
+    query = request.args.get('query', '').strip()
+    if not query:
+        return Response(
+            format_sse('error', 'empty question'),
+            mimetype='text/event-stream')
+    chat_id = get_chat_id()
+    chat_store = get_chat_store()
+    conversation_history = get_conversation_history(
+        chat_store.get_history(chat_id))
+    mode = get_search_mode(request.args)
+
+    def _generate():
+        try:
+            from . import rag
+        except ImportError:
+            yield format_sse(
+                'error',
+                "RAG dependencies not installed. "
+                "Install with: pip install 'tools4zettelkasten[rag]'")
+            return
+        try:
+            search_results = rag.search(query, mode=mode)
+            sources = get_sources(search_results)
+            yield format_sse('sources', sources)
+            chunks = []
+            for chunk in rag.chat_completion(
+                    query, search_results, conversation_history,
+                    stream=True):
+                chunks.append(chunk)
+                yield format_sse('token', chunk)
+            chat_store.append(chat_id, 'user', query)
+            chat_store.append(
+                chat_id, 'assistant', ''.join(chunks), sources=sources)
+            yield format_sse('done', {})
+        except Exception as e:
+            chat_store.append(chat_id, 'error', str(e))
+            yield format_sse('error', str(e))
+
+    return Response(
+        _generate(), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/chat/reset', methods=['POST'])
 def chat_reset():
-    session.pop('chat_history', None)
+    if 'chat_id' in session:
+        get_chat_store().reset(session.pop('chat_id'))
     return redirect(url_for('chat_view'))
@@ -0,0 +1,163 @@
+# graph_export.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Export of the graph of the Zettelkasten for external tools.
+
+GraphML can be opened in Gephi or yEd, the JSON export follows the
+node-link format of NetworkX (``networkx.node_link_graph``). Both are
+produced line by line and written while they are generated.
+
+The npz export holds the structure and the explicit links as CSR
+matrices together with the attributes of the notes, ``load_npz`` reads
+it back without parsing a single note. It requires numpy and scipy,
+install them with ``pip install 'tools4zettelkasten[metrics]'``.
+"""
+
+import json
+from xml.sax.saxutils import escape, quoteattr
+from . import handle_filenames as hf
+from .link_table import LinkTable, STRUCTURE, EXPLICIT
+
+EXPORT_FORMATS = ('graphml', 'json', 'npz')
+LINK_TYPES = {STRUCTURE: 'structure', EXPLICIT: 'explicit'}
+
+
+def get_node_attributes(filename: str) -> dict:
+    note = hf.create_Note(filename)
+    return {
+        'note_id': note.id,
+        'ordering': note.ordering,
+        'title': note.base_filename.replace('_', ' '),
+    }
+
+
+def _existing_links(list_of_filenames, link_table: LinkTable) -> LinkTable:
+    # links to missing notes would reference undefined nodes
+    return link_table.select(filenames=list_of_filenames)
+
+
+def iter_graphml_lines(list_of_filenames, link_table: LinkTable):
+    """the lines of a GraphML document, nodes are keyed by filename"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield ('<graphml xmlns="http://graphml.graphdrawing.org/xmlns" '
+           'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+           'xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns '
+           'http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n')
+    for key in ('note_id', 'ordering', 'title'):
+        yield (f'  <key id="{key}" for="node" attr.name="{key}" '
+               'attr.type="string"/>\n')
+    for key in ('type', 'description'):
+        yield (f'  <key id="{key}" for="edge" attr.name="{key}" '
+               'attr.type="string"/>\n')
+    yield '  <graph id="zettelkasten" edgedefault="directed">\n'
+    for filename in list_of_filenames:
+        yield f'    <node id={quoteattr(filename)}>'
+        for key, value in get_node_attributes(filename).items():
+            yield f'<data key="{key}">{escape(value)}</data>'
+        yield '</node>\n'
+    link_table = _existing_links(list_of_filenames, link_table)
+    for source, target, kind, description_id in zip(
+            link_table.sources, link_table.targets, link_table.kinds,
+            link_table.description_ids):
+        yield (
+            f'    <edge source={quoteattr(link_table.notes[source])} '
+            f'target={quoteattr(link_table.notes[target])}>'
+            f'<data key="type">{LINK_TYPES[kind]}</data>'
+            '<data key="description">'
+            f'{escape(link_table.descriptions[description_id])}</data>'
+            '</edge>\n')
+    yield '  </graph>\n'
+    yield '</graphml>\n'
+
+
+def iter_json_lines(list_of_filenames, link_table: LinkTable):
+    """the lines of a JSON document in the node-link format of NetworkX"""
+    yield '{"directed": true, "multigraph": true, "graph": {},\n'
+    yield ' "nodes": [\n'
+    separator = ''
+    for filename in list_of_filenames:
+        node = {'id': filename, **get_node_attributes(filename)}
+        yield separator + '  ' + json.dumps(node, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n ],\n "links": [\n'
+    separator = ''
+    link_table = _existing_links(list_of_filenames, link_table)
+    for source, target, kind, description_id in zip(
+            link_table.sources, link_table.targets, link_table.kinds,
+            link_table.description_ids):
+        link = {
+            'source': link_table.notes[source],
+            'target': link_table.notes[target],
+            'type': LINK_TYPES[kind],
+            'description': link_table.descriptions[description_id],
+        }
+        yield separator + '  ' + json.dumps(link, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n ]\n}\n'
+
+
+def save_npz(path, list_of_filenames, link_table: LinkTable):
+    """saves the notes and one CSR matrix per link type
+
+    The matrices count the links from row to column, rows and columns
+    follow the order of the filenames.
+    """
+    import numpy as np
+    from .graph_metrics import build_adjacency_matrix
+    filenames = list(list_of_filenames)
+    attributes = [get_node_attributes(filename) for filename in filenames]
+    arrays = {
+        'filenames': np.array(filenames, dtype=str),
+    }
+    for key in ('note_id', 'ordering', 'title'):
+        arrays[key + 's'] = np.array(
+            [attribute[key] for attribute in attributes], dtype=str)
+    for kind, name in LINK_TYPES.items():
+        matrix = build_adjacency_matrix(
+            filenames, link_table.select(kind=kind))
+        arrays[name + '_data'] = matrix.data.astype(np.int32)
+        arrays[name + '_indices'] = matrix.indices
+        arrays[name + '_indptr'] = matrix.indptr
+    np.savez_compressed(path, **arrays)
+
+
+def load_npz(path) -> dict:
+    """reads an npz export
+
+    :return: dict with the lists filenames, note_ids, orderings and
+        titles, and the CSR matrices structure and explicit
+    """
+    import numpy as np
+    from scipy import sparse
+    with np.load(path) as arrays:
+        graph = {
+            key: arrays[key].tolist()
+            for key in ('filenames', 'note_ids', 'orderings', 'titles')}
+        size = len(graph['filenames'])
+        for name in LINK_TYPES.values():
+            graph[name] = sparse.csr_matrix(
+                (arrays[name + '_data'], arrays[name + '_indices'],
+                 arrays[name + '_indptr']),
+                shape=(size, size))
+    return graph
+
+
+def write_export(format: str, list_of_filenames, link_table: LinkTable,
+                 output):
+    """writes the graph in one of the EXPORT_FORMATS
+
+    :param output: text file object for graphml and json, path or
+        binary file object for npz
+    """
+    if format == 'npz':
+        save_npz(output, list_of_filenames, link_table)
+        return
+    if format == 'graphml':
+        lines = iter_graphml_lines(list_of_filenames, link_table)
+    elif format == 'json':
+        lines = iter_json_lines(list_of_filenames, link_table)
+    else:
+        raise ValueError("unknown export format " + format)
+    for line in lines:
+        output.write(line)
@@ -0,0 +1,97 @@
+# graph_layout.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Node positions of the graph kept across renders.
+
+Without stored positions graphviz lays out the whole graph again after
+every change and the nodes jump around. Here the positions of the first
+layout are stored as JSON. Later renders pin the nodes which still exist
+and neato only places the new ones, then the SVG is drawn with all nodes
+at their stored positions.
+
+Positions are keyed by the id of the note, so a renamed or moved note
+keeps its place on the map.
+"""
+
+import json
+import os
+from graphviz import Digraph
+from . import persistency as ps
+from .render_cache import fingerprint
+
+
+class LayoutCache:
+    """Node positions in points, one JSON file per Zettelkasten."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _filename(self, location: str) -> str:
+        return fingerprint(location) + '.json'
+
+    def load(self, location: str) -> dict:
+        path = os.path.join(self.directory, self._filename(location))
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, location: str, positions: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        ps.overwrite_file_content(
+            self.directory, self._filename(location),
+            json.dumps(positions), atomic=True, sync_directory=False)
+
+
+def get_layout_positions(dot: Digraph, engine: str = None) -> dict:
+    """lays out the graph and returns the positions of the nodes"""
+    layout = json.loads(dot.pipe(format='json', engine=engine))
+    positions = {}
+    for graph_object in layout.get('objects', []):
+        # clusters have a bounding box but no position
+        if 'pos' in graph_object:
+            x, y = graph_object['pos'].split(',')
+            positions[graph_object['name']] = [float(x), float(y)]
+    return positions
+
+
+def pin_nodes(dot: Digraph, positions: dict) -> Digraph:
+    """copy of the graph with the given nodes fixed at their positions
+
+    The positions must only contain nodes of the graph, otherwise they
+    would be added to it.
+    """
+    pinned = dot.copy()
+    pinned.engine = 'neato'
+    # positions are given in points, like graphviz reports them
+    pinned.graph_attr.update(inputscale='72', overlap='false', splines='true')
+    for node_id, (x, y) in positions.items():
+        pinned.node(node_id, pos=f'{x},{y}!')
+    return pinned
+
+
+def render_svg_with_stable_layout(
+        dot: Digraph, node_ids, layout_cache: LayoutCache,
+        location: str) -> str:
+    """renders the SVG, only nodes without a stored position are placed
+
+    :param dot: graph as created by analyse.create_graph_of_zettelkasten
+    :param node_ids: ids of the nodes of the graph
+    :param layout_cache: store of the positions
+    :param location: Zettelkasten the graph belongs to
+    """
+    stored = layout_cache.load(location)
+    positions = {
+        node_id: stored[node_id] for node_id in node_ids
+        if node_id in stored}
+    if len(positions) < len(set(node_ids)):
+        if positions:
+            positions = get_layout_positions(pin_nodes(dot, positions))
+        else:
+            positions = get_layout_positions(dot)
+    if positions != stored:
+        layout_cache.save(location, positions)
+    # all nodes are pinned, neato only routes the edges
+    return pin_nodes(dot, positions).pipe(format='svg').decode('utf-8')
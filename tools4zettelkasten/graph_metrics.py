@@ -0,0 +1,178 @@
+# graph_metrics.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Graph metrics of the Zettelkasten on a sparse adjacency matrix.
+
+The LinkTable is turned into a CSR matrix once, all metrics are computed
+with vectorized matrix operations: PageRank, in and out degree, weakly
+and strongly connected components, orphans, dead ends and the hub and
+authority scores of HITS.
+
+numpy and scipy are optional dependencies, install them with
+``pip install 'tools4zettelkasten[metrics]'``.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from . import handle_filenames as hf
+from .link_table import LinkTable
+
+
+@dataclass
+class GraphMetrics:
+    filenames: list
+    pagerank: np.ndarray
+    in_degree: np.ndarray
+    out_degree: np.ndarray
+    hub_score: np.ndarray
+    authority_score: np.ndarray
+    weak_component_labels: np.ndarray
+    strong_component_labels: np.ndarray
+
+    @property
+    def number_of_weak_components(self) -> int:
+        return int(self.weak_component_labels.max(initial=-1) + 1)
+
+    @property
+    def number_of_strong_components(self) -> int:
+        return int(self.strong_component_labels.max(initial=-1) + 1)
+
+    @property
+    def orphans(self) -> list:
+        """notes without any link"""
+        mask = (self.in_degree == 0) & (self.out_degree == 0)
+        return [self.filenames[i] for i in np.flatnonzero(mask)]
+
+    @property
+    def dead_ends(self) -> list:
+        """notes which are linked but do not link to other notes"""
+        mask = (self.in_degree > 0) & (self.out_degree == 0)
+        return [self.filenames[i] for i in np.flatnonzero(mask)]
+
+    def top(self, scores: np.ndarray, number: int = 10) -> list:
+        """the notes with the highest scores, highest first"""
+        order = np.argsort(-scores, kind='stable')[:number]
+        return [(self.filenames[i], float(scores[i])) for i in order]
+
+
+def build_adjacency_matrix(list_of_filenames, links):
+    """sparse matrix with the number of links from row to column
+
+    :param links: LinkTable or list of Link objects
+    Links to or from notes which do not exist are ignored.
+    """
+    link_table = (
+        links if isinstance(links, LinkTable) else LinkTable.from_links(links))
+    size = len(list_of_filenames)
+    # map the note ids of the table to matrix positions, -1 if missing
+    positions = np.full(len(link_table.notes), -1, dtype=np.int64)
+    for position, filename in enumerate(list_of_filenames):
+        note_id = link_table.find_note_id(filename)
+        if note_id is not None:
+            positions[note_id] = position
+    sources = positions[np.frombuffer(link_table.sources, dtype=np.int32)]
+    targets = positions[np.frombuffer(link_table.targets, dtype=np.int32)]
+    existing = (sources >= 0) & (targets >= 0)
+    # duplicates are summed up when the matrix is converted
+    return sparse.coo_matrix(
+        (np.ones(int(existing.sum())),
+         (sources[existing], targets[existing])),
+        shape=(size, size)).tocsr()
+
+
+def pagerank(adjacency, damping=0.85, tolerance=1e-10, max_iterations=100):
+    """PageRank by power iteration, notes without links spread evenly"""
+    size = adjacency.shape[0]
+    if size == 0:
+        return np.zeros(0)
+    out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inverse = np.divide(
+        1.0, out_weight, out=np.zeros(size), where=~dangling)
+    transition = sparse.diags(inverse) @ adjacency
+    transposed = transition.T.tocsr()
+    rank = np.full(size, 1.0 / size)
+    for _ in range(max_iterations):
+        new_rank = damping * (transposed @ rank + rank[dangling].sum() / size)
+        new_rank += (1 - damping) / size
+        if np.abs(new_rank - rank).sum() < tolerance:
+            return new_rank
+        rank = new_rank
+    return rank
+
+
+def hits(adjacency, tolerance=1e-10, max_iterations=100):
+    """hub and authority scores of HITS, each normalized to sum 1"""
+    size = adjacency.shape[0]
+    hub = np.full(size, 1.0 / size) if size else np.zeros(0)
+    transposed = adjacency.T.tocsr()
+    authority = hub
+    for _ in range(max_iterations):
+        authority = transposed @ hub
+        authority_sum = authority.sum()
+        if authority_sum == 0:
+            return np.zeros(size), np.zeros(size)
+        authority /= authority_sum
+        new_hub = adjacency @ authority
+        new_hub /= new_hub.sum()
+        if np.abs(new_hub - hub).sum() < tolerance:
+            return new_hub, authority
+        hub = new_hub
+    return hub, authority
+
+
+def compute_graph_metrics(list_of_filenames, links) -> GraphMetrics:
+    """:param links: LinkTable or list of Link objects"""
+    filenames = list(list_of_filenames)
+    adjacency = build_adjacency_matrix(filenames, links)
+    # parallel links count once for the degrees
+    binary = adjacency.copy()
+    binary.data[:] = 1
+    hub_score, authority_score = hits(adjacency)
+    _, weak_labels = csgraph.connected_components(
+        adjacency, directed=True, connection='weak')
+    _, strong_labels = csgraph.connected_components(
+        adjacency, directed=True, connection='strong')
+    return GraphMetrics(
+        filenames=filenames,
+        pagerank=pagerank(adjacency),
+        in_degree=np.asarray(binary.sum(axis=0)).ravel().astype(int),
+        out_degree=np.asarray(binary.sum(axis=1)).ravel().astype(int),
+        hub_score=hub_score,
+        authority_score=authority_score,
+        weak_component_labels=weak_labels,
+        strong_component_labels=strong_labels)
+
+
+def summarize_graph_metrics(metrics: GraphMetrics, top: int = 10) -> dict:
+    """JSON serializable overview, used by the CLI and the MCP server"""
+
+    def describe(ranking):
+        return [{
+            "filename": filename,
+            "id": hf.create_Note(filename).id,
+            "score": round(score, 6)
+        } for filename, score in ranking]
+
+    weak_sizes = np.bincount(metrics.weak_component_labels)
+    strong_sizes = np.bincount(metrics.strong_component_labels)
+    return {
+        "total_notes": len(metrics.filenames),
+        # parallel links are counted once, like in the degrees
+        "connected_pairs": int(metrics.out_degree.sum()),
+        "weakly_connected_components": metrics.number_of_weak_components,
+        "largest_weak_component": int(weak_sizes.max(initial=0)),
+        "strongly_connected_components":
+            metrics.number_of_strong_components,
+        "largest_strong_component": int(strong_sizes.max(initial=0)),
+        "orphans": metrics.orphans,
+        "dead_ends": metrics.dead_ends,
+        "pagerank": describe(metrics.top(metrics.pagerank, top)),
+        "hubs": describe(metrics.top(metrics.hub_score, top)),
+        "authorities": describe(metrics.top(metrics.authority_score, top)),
+        "most_linked": describe(metrics.top(metrics.in_degree, top)),
+        "most_linking": describe(metrics.top(metrics.out_degree, top)),
+    }
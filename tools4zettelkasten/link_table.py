@@ -0,0 +1,184 @@
+# link_table.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Columnar table of the links between notes.
+
+Instead of one Link object with two filename strings per edge, the
+table interns every filename and every description once and keeps the
+edges in parallel int32 arrays. Filtering by kind or topic works on
+these arrays, with numpy masks if numpy is installed.
+``to_links()`` converts back to a list of Link objects for code that
+expects them.
+"""
+
+from array import array
+from itertools import compress
+from . import handle_filenames as hf
+from .reorganize import Link
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+STRUCTURE = 0
+EXPLICIT = 1
+# numpy types of the columns
+COLUMN_TYPES = {'i': 'int32', 'b': 'int8'}
+
+
+class LinkTable:
+    """links as parallel arrays of source, target, kind and description
+
+    Tables created by ``select`` share the interned filenames and
+    descriptions with the table they were selected from.
+    """
+
+    def __init__(self, notes=None, descriptions=None):
+        # interned filenames and descriptions, the ids are list positions
+        self.notes = [] if notes is None else notes
+        self.descriptions = [] if descriptions is None else descriptions
+        self._note_ids = {
+            filename: note_id for note_id, filename in enumerate(self.notes)}
+        self._description_ids = {
+            description: description_id
+            for description_id, description in enumerate(self.descriptions)}
+        self.sources = array('i')
+        self.targets = array('i')
+        self.kinds = array('b')
+        self.description_ids = array('i')
+
+    def __len__(self):
+        return len(self.sources)
+
+    def note_id(self, filename: str) -> int:
+        """id of a filename, interned on first use"""
+        note_id = self._note_ids.get(filename)
+        if note_id is None:
+            note_id = len(self.notes)
+            self.notes.append(filename)
+            self._note_ids[filename] = note_id
+        return note_id
+
+    def find_note_id(self, filename: str):
+        """id of a filename, None if it is not in the table"""
+        return self._note_ids.get(filename)
+
+    def _description_id(self, description: str) -> int:
+        description_id = self._description_ids.get(description)
+        if description_id is None:
+            description_id = len(self.descriptions)
+            self.descriptions.append(description)
+            self._description_ids[description] = description_id
+        return description_id
+
+    def add(self, source: str, description: str, target: str, kind: int):
+        self.sources.append(self.note_id(source))
+        self.targets.append(self.note_id(target))
+        self.kinds.append(kind)
+        self.description_ids.append(self._description_id(description))
+
+    def extend(self, list_of_links, kind: int):
+        for link in list_of_links:
+            self.add(link.source, link.description, link.target, kind)
+
+    @classmethod
+    def from_links(cls, list_of_links, kind: int = EXPLICIT):
+        table = cls()
+        table.extend(list_of_links, kind)
+        return table
+
+    def _selected(self, selectors) -> 'LinkTable':
+        """the links whose selector is true, selectors are bytes or a
+        numpy bool array"""
+        table = LinkTable.__new__(LinkTable)
+        table.notes = self.notes
+        table.descriptions = self.descriptions
+        table._note_ids = self._note_ids
+        table._description_ids = self._description_ids
+        for name in ('sources', 'targets', 'kinds', 'description_ids'):
+            column = getattr(self, name)
+            if isinstance(selectors, bytes):
+                selected = array(column.typecode, compress(column, selectors))
+            else:
+                selected = array(column.typecode)
+                selected.frombytes(_as_numpy(column)[selectors].tobytes())
+            setattr(table, name, selected)
+        return table
+
+    def _note_mask(self, filenames) -> bytearray:
+        mask = bytearray(len(self.notes))
+        for filename in filenames:
+            note_id = self._note_ids.get(filename)
+            if note_id is not None:
+                mask[note_id] = 1
+        return mask
+
+    def select(self, kind: int = None, topic: str = None,
+               filenames=None) -> 'LinkTable':
+        """links of one kind and/or between notes of a topic or a set
+
+        :param kind: STRUCTURE or EXPLICIT, None for both
+        :param topic: ordering prefix, both notes must be in the topic
+        :param filenames: both notes must be in this collection
+        """
+        masks = []
+        if topic is not None:
+            # the ordering starts the filename, the string test is cheap
+            masks.append(self._note_mask(
+                filename for filename in self.notes
+                if filename.startswith(topic)
+                and is_in_topic(filename, topic)))
+        if filenames is not None:
+            masks.append(self._note_mask(filenames))
+        if np is not None:
+            return self._selected(self._numpy_selectors(kind, masks))
+        if kind is None:
+            selectors = b'\x01' * len(self)
+        else:
+            # the kinds are bytes, translate them to 1 for the kind
+            table = bytearray(256)
+            table[kind] = 1
+            selectors = self.kinds.tobytes().translate(table)
+        for mask in masks:
+            selectors = bytes(
+                selected and mask[source] and mask[target]
+                for selected, source, target in zip(
+                    selectors, self.sources, self.targets))
+        return self._selected(selectors)
+
+    def _numpy_selectors(self, kind, masks):
+        selectors = np.ones(len(self), dtype=bool)
+        if kind is not None:
+            selectors &= _as_numpy(self.kinds) == kind
+        for mask in masks:
+            mask = np.frombuffer(mask, dtype=bool)
+            selectors &= mask[_as_numpy(self.sources)]
+            selectors &= mask[_as_numpy(self.targets)]
+        return selectors
+
+    def to_links(self) -> list:
+        """the links as list of Link objects, in the order of the table"""
+        return [
+            Link(self.notes[source], self.descriptions[description_id],
+                 self.notes[target])
+            for source, target, description_id in zip(
+                self.sources, self.targets, self.description_ids)]
+
+
+def _as_numpy(column: array):
+    """numpy view of a column without copying it"""
+    if not column:
+        return np.zeros(0, dtype=COLUMN_TYPES[column.typecode])
+    return np.frombuffer(column, dtype=COLUMN_TYPES[column.typecode])
+
+
+def is_in_topic(filename: str, prefix: str) -> bool:
+    """checks if a note belongs to the topic with the ordering prefix
+
+    The topic 01_02 contains 01_02 itself and e.g. 01_02_03, but not
+    01_021.
+    """
+    ordering = hf.create_Note(filename).ordering
+    return ordering == prefix or ordering.startswith(prefix + '_')
@@ -0,0 +1,158 @@
+# locking.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Readers-writer locking for concurrent access to a Zettelkasten.
+
+The CLI, the Flask viewer and the MCP server may work on the same
+Zettelkasten at the same time. Structural operations (reorganize,
+stage) take the exclusive lock of the Zettelkasten, readers take the
+shared lock and do not block each other. Edits of a single note take
+the shared lock plus the lock of that note.
+
+On POSIX systems the locks are ``flock`` locks on files below
+``LOCK_PATH``, so they work across threads and processes. Elsewhere
+they fall back to locks within the current process.
+"""
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from . import settings as st
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SHARED = 'shared'
+EXCLUSIVE = 'exclusive'
+
+
+class ReadWriteLock:
+    """in-process readers-writer lock, waiting writers are preferred"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire(self, mode):
+        with self._condition:
+            if mode == EXCLUSIVE:
+                self._waiting_writers += 1
+                while self._writer or self._readers:
+                    self._condition.wait()
+                self._waiting_writers -= 1
+                self._writer = True
+            else:
+                while self._writer or self._waiting_writers:
+                    self._condition.wait()
+                self._readers += 1
+
+    def release(self, mode):
+        with self._condition:
+            if mode == EXCLUSIVE:
+                self._writer = False
+            else:
+                self._readers -= 1
+            self._condition.notify_all()
+
+
+_in_process_locks = {}
+_in_process_locks_guard = threading.Lock()
+
+
+def _in_process_lock(path):
+    with _in_process_locks_guard:
+        if path not in _in_process_locks:
+            _in_process_locks[path] = ReadWriteLock()
+        return _in_process_locks[path]
+
+
+@contextmanager
+def _hold(path, mode):
+    if fcntl is None:
+        lock = _in_process_lock(path)
+        lock.acquire(mode)
+        try:
+            yield
+        finally:
+            lock.release(mode)
+        return
+    # every acquisition opens its own file description, so flock
+    # also separates threads of the same process
+    with open(path, 'a') as lock_file:
+        fcntl.flock(
+            lock_file.fileno(),
+            fcntl.LOCK_EX if mode == EXCLUSIVE else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class LockManager:
+    """locks of one Zettelkasten location
+
+    The locks are reentrant per thread: a thread holding the exclusive
+    lock may enter shared sections, a thread holding the shared lock
+    may enter further shared sections. Upgrading a shared lock to an
+    exclusive one raises a RuntimeError instead of deadlocking.
+    """
+
+    def __init__(self, location, lock_directory=None) -> None:
+        if lock_directory is None:
+            lock_directory = st.LOCK_PATH
+        key = hashlib.sha256(
+            os.path.abspath(str(location)).encode('utf-8')).hexdigest()[:16]
+        self.lock_directory = os.path.join(lock_directory, key)
+        self._held = threading.local()
+
+    def _lock_file(self, name):
+        # created on first use, constructing a persistency manager must
+        # not write below LOCK_PATH
+        os.makedirs(self.lock_directory, exist_ok=True)
+        return os.path.join(self.lock_directory, name)
+
+    def _held_modes(self):
+        if not hasattr(self._held, 'modes'):
+            self._held.modes = []
+        return self._held.modes
+
+    @contextmanager
+    def _directory(self, mode):
+        modes = self._held_modes()
+        if EXCLUSIVE in modes or (mode == SHARED and modes):
+            modes.append(mode)
+            try:
+                yield
+            finally:
+                modes.pop()
+            return
+        if modes:
+            raise RuntimeError(
+                "shared lock can not be upgraded to an exclusive lock")
+        with _hold(self._lock_file('zettelkasten.lock'), mode):
+            modes.append(mode)
+            try:
+                yield
+            finally:
+                modes.pop()
+
+    def shared(self):
+        """lock for reading, readers do not block each other"""
+        return self._directory(SHARED)
+
+    def exclusive(self):
+        """lock for structural changes like renames of many notes"""
+        return self._directory(EXCLUSIVE)
+
+    @contextmanager
+    def file_lock(self, filename):
+        """exclusive lock of a single note, e.g. for an edit"""
+        path = self._lock_file(os.path.basename(filename) + '.lock')
+        with _hold(path, EXCLUSIVE):
+            yield
@@ -5,15 +5,18 @@ It is part of the tools4zettelkasten package and uses the same settings and
 core modules as the CLI and Flask interfaces.
 """
 
+import functools
 import re
 from typing import Any
 
 from mcp.server.fastmcp import FastMCP
 
 from . import handle_filenames as hf
-from .persistency import PersistencyManager
+from .persistency import PersistencyManager, create_persistency_manager
 from . import reorganize as ro
 from . import analyse
+from .title_index import get_title_index
+from .search_index import get_search_index, highlight_snippet, parse_query
 from . import settings as st
 
 # Initialize MCP server
@@ -22,7 +25,7 @@ mcp = FastMCP("zettelkasten")
 
 def get_zettelkasten_manager() -> PersistencyManager:
     """Get PersistencyManager for the main Zettelkasten."""
-    return PersistencyManager(st.ZETTELKASTEN)
+    return create_persistency_manager(st.ZETTELKASTEN)
 
 
 def get_input_manager() -> PersistencyManager:
@@ -30,11 +33,27 @@ def get_input_manager() -> PersistencyManager:
     return PersistencyManager(st.ZETTELKASTEN_INPUT)
 
 
+def reading(get_manager):
+    """Run the tool under the shared lock of the manager's location.
+
+    Reorganizations and staging take the exclusive lock, so a read tool
+    never sees a half renamed Zettelkasten.
+    """
+    def decorator(tool):
+        @functools.wraps(tool)
+        def wrapper(*args, **kwargs):
+            with get_manager().locks.shared():
+                return tool(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 # =============================================================================
 # Input Management Tools
 # =============================================================================
 
 @mcp.tool()
+@reading(get_input_manager)
 def list_input_files() -> list[dict[str, Any]]:
     """List all files in the input folder.
 
@@ -73,6 +92,7 @@ def list_input_files() -> list[dict[str, Any]]:
 
 
 @mcp.tool()
+@reading(get_input_manager)
 def preview_staging() -> list[dict[str, str]]:
     """Preview what staging would do without making changes.
 
@@ -133,7 +153,8 @@ def stage_file(filename: str) -> dict[str, Any]:
         new_filename = hf.create_filename(note.ordering, new_base, note.id)
 
         if new_filename != filename:
-            manager.rename_file(filename, new_filename)
+            with manager.locks.exclusive():
+                manager.rename_file(filename, new_filename)
             return {
                 "success": True,
                 "old_name": filename,
@@ -155,6 +176,7 @@ def stage_file(filename: str) -> dict[str, Any]:
 # =============================================================================
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def get_zettel(identifier: str) -> dict[str, Any]:
     """Get a single Zettel by ID or filename.
 
@@ -210,63 +232,66 @@ def get_zettel(identifier: str) -> dict[str, Any]:
 
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def search_zettel(query: str, limit: int = 10) -> list[dict[str, Any]]:
-    """Full-text search in the Zettelkasten.
+    """Full-text search in the Zettelkasten, best matches first.
+
+    Notes are ranked with BM25, notes containing more of the words rank
+    higher. Use double quotes for phrases, e.g. "spaced repetition".
 
     Args:
-        query: Search term (case-insensitive)
+        query: Search terms (case-insensitive)
         limit: Maximum number of results (default: 10)
     """
     manager = get_zettelkasten_manager()
-    files = manager.get_list_of_filenames()
+    index = get_search_index(manager, st.SEARCH_INDEX_PATH or None)
+    _, phrases = parse_query(query)
 
     results = []
-    query_lower = query.lower()
-
-    for filename in files:
-        if not manager.is_markdown_file(filename):
-            continue
-
+    for filename, title, score, terms in index.search(query, limit):
+        note = hf.create_Note(filename)
         try:
             content = manager.get_string_from_file_content(filename)
-            content_lower = content.lower()
+        except Exception:
+            continue
+        results.append({
+            "filename": filename,
+            "title": title,
+            "id": note.id,
+            "ordering": note.ordering,
+            "score": score,
+            "snippet": highlight_snippet(content, terms, phrases)
+        })
 
-            if query_lower in content_lower:
-                note = hf.create_Note(filename)
+    return results
 
-                # Extract title
-                lines = content.split("\n")
-                title = note.base_filename.replace("_", " ")
-                if lines and lines[0].startswith("#"):
-                    title = lines[0].lstrip("#").strip()
-
-                # Find snippet around the match
-                idx = content_lower.find(query_lower)
-                start = max(0, idx - 50)
-                end = min(len(content), idx + len(query) + 50)
-                snippet = content[start:end]
-                if start > 0:
-                    snippet = "..." + snippet
-                if end < len(content):
-                    snippet = snippet + "..."
-
-                results.append({
-                    "filename": filename,
-                    "title": title,
-                    "id": note.id,
-                    "ordering": note.ordering,
-                    "snippet": snippet.replace("\n", " ")
-                })
 
-                if len(results) >= limit:
-                    break
-        except Exception:
-            continue
+@mcp.tool()
+@reading(get_zettelkasten_manager)
+def find_by_title(query: str, limit: int = 10) -> list[dict[str, Any]]:
+    """Find Zettel by a (half-remembered or misspelled) title.
 
+    Args:
+        query: Part of the title or filename, typos are tolerated
+        limit: Maximum number of results (default: 10)
+    """
+    manager = get_zettelkasten_manager()
+    results = []
+    for filename, title, score in get_title_index(manager).search(
+            query, limit):
+        note = hf.create_Note(filename)
+        results.append({
+            "filename": filename,
+            "title": title,
+            "id": note.id,
+            "ordering": note.ordering,
+            "score": score
+        })
     return results
 
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def list_zettel(prefix: str = "", limit: int = 50) -> list[dict[str, Any]]:
     """List Zettel, optionally filtered by ordering prefix.
 
@@ -311,6 +336,7 @@ def list_zettel(prefix: str = "", limit: int = 50) -> list[dict[str, Any]]:
 
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def get_statistics() -> dict[str, Any]:
     """Get statistics about the Zettelkasten.
 
@@ -366,6 +392,7 @@ def get_statistics() -> dict[str, Any]:
 # =============================================================================
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def get_links(identifier: str) -> dict[str, Any]:
     """Get all links for a Zettel (both outgoing and incoming).
 
@@ -416,6 +443,7 @@ def get_links(identifier: str) -> dict[str, Any]:
 
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def find_related(identifier: str, limit: int = 5) -> list[dict[str, Any]]:
     """Find Zettel related to the given one.
 
@@ -525,6 +553,7 @@ def find_related(identifier: str, limit: int = 5) -> list[dict[str, Any]]:
 
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def analyze_structure(topic: str = "") -> dict[str, Any]:
     """Analyze the structure of the Zettelkasten or a specific topic.
 
@@ -585,11 +614,84 @@ def analyze_structure(topic: str = "") -> dict[str, Any]:
         return {"error": str(e)}
 
 
+@mcp.tool()
+@reading(get_zettelkasten_manager)
+def graph_metrics(
+        topic: str = "", explicit_only: bool = False,
+        top: int = 10) -> dict[str, Any]:
+    """Compute graph metrics of the Zettelkasten or of a topic.
+
+    Returns PageRank, hub and authority rankings, the most linked notes,
+    connected components, orphans and dead ends. Requires numpy and scipy.
+
+    Args:
+        topic: Optional ordering prefix to restrict the graph (e.g., "01")
+        explicit_only: Only consider explicit links, not the hierarchy
+        top: Number of notes per ranking (default: 10)
+    """
+    try:
+        from . import graph_metrics as gm
+    except ImportError:
+        return {"error": "numpy and scipy are not installed. Install "
+                         "with: pip install 'tools4zettelkasten[metrics]'"}
+
+    manager = get_zettelkasten_manager()
+    try:
+        if topic:
+            analysis = analyse.create_topic_analysis(manager, topic)
+        else:
+            analysis = analyse.create_graph_analysis(manager)
+        link_table = (
+            analysis.link_table.select(kind=analyse.EXPLICIT) if explicit_only
+            else analysis.link_table)
+        return gm.summarize_graph_metrics(
+            gm.compute_graph_metrics(
+                analysis.list_of_filenames, link_table),
+            top=top)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@mcp.tool()
+def semantic_search(
+        query: str, top_k: int = 5, mode: str = "") -> list[dict[str, Any]]:
+    """Semantic search in the Zettelkasten using the vector database.
+
+    Requires the RAG extras and a database filled by 'vectorize'. The
+    hybrid mode also finds exact terms like acronyms, identifiers and
+    names by fusing the vector search with the full-text index.
+
+    Args:
+        query: Question or topic in natural language
+        top_k: Maximum number of results (default: 5)
+        mode: "vector", "lexical" or "hybrid" (default: RAG_SEARCH_MODE)
+    """
+    try:
+        from . import rag
+    except ImportError:
+        return [{"error": "RAG dependencies not installed. Install with: "
+                          "pip install 'tools4zettelkasten[rag]'"}]
+
+    try:
+        search_results = rag.search(query, top_k=top_k, mode=mode or None)
+    except Exception as e:
+        return [{"error": str(e)}]
+
+    return [{
+        "filename": r.filename,
+        "title": r.title,
+        "id": r.zettel_id,
+        "ordering": r.ordering,
+        "score": r.score
+    } for r in search_results]
+
+
 # =============================================================================
 # Reorganization Tools
 # =============================================================================
 
 @mcp.tool()
+@reading(get_zettelkasten_manager)
 def preview_reorganize() -> dict[str, Any]:
     """Preview what reorganization would do.
 
@@ -651,7 +753,6 @@ def execute_reorganize(confirm: bool = False) -> dict[str, Any]:
         }
 
     manager = get_zettelkasten_manager()
-    files = manager.get_list_of_filenames()
 
     results = {
         "ids_added": 0,
@@ -660,51 +761,59 @@ def execute_reorganize(confirm: bool = False) -> dict[str, Any]:
         "errors": []
     }
 
-    try:
-        # Step 1: Add missing IDs
-        id_commands = ro.attach_missing_ids(files)
-        for cmd in id_commands:
-            try:
-                manager.rename_file(cmd[1], cmd[2])
-                results["ids_added"] += 1
-            except Exception as e:
-                results["errors"].append(f"Failed to add ID to {cmd[1]}: {e}")
-
-        # Refresh file list after ID changes
-        files = manager.get_list_of_filenames()
-
-        # Step 2: Reorganize ordering
-        tokenized = ro.generate_tokenized_list(files)
-        tree = ro.generate_tree(tokenized)
-        potential_changes = ro.reorganize_filenames(tree)
-        rename_commands = ro.create_rename_commands(potential_changes)
-
-        for cmd in rename_commands:
-            try:
-                manager.rename_file(cmd[1], cmd[2])
-                results["files_renamed"] += 1
-            except Exception as e:
-                results["errors"].append(f"Failed to rename {cmd[1]}: {e}")
-
-        # Refresh file list after renames
-        files = manager.get_list_of_filenames()
-
-        # Step 3: Fix links
-        link_commands = ro.generate_list_of_link_correction_commands(manager)
-        for cmd in link_commands:
-            try:
-                content = manager.get_string_from_file_content(cmd.filename)
-                new_content = content.replace(cmd.to_be_replaced, cmd.replace_with)
-                manager.overwrite_file_content(cmd.filename, new_content)
-                results["links_fixed"] += 1
-            except Exception as e:
-                results["errors"].append(f"Failed to fix link in {cmd.filename}: {e}")
-
-        results["success"] = True
-
-    except Exception as e:
-        results["success"] = False
-        results["errors"].append(f"Reorganization failed: {e}")
+    with manager.locks.exclusive(), manager.group_commit():
+        try:
+            # Step 1: Add missing IDs
+            files = manager.get_list_of_filenames()
+            id_commands = ro.attach_missing_ids(files)
+            for cmd in id_commands:
+                try:
+                    manager.rename_file(cmd.old_filename, cmd.new_filename)
+                    results["ids_added"] += 1
+                except Exception as e:
+                    results["errors"].append(
+                        f"Failed to add ID to {cmd.old_filename}: {e}")
+
+            # Refresh file list after ID changes
+            files = manager.get_list_of_filenames()
+
+            # Step 2: Reorganize ordering
+            tokenized = ro.generate_tokenized_list(files)
+            tree = ro.generate_tree(tokenized)
+            potential_changes = ro.reorganize_filenames(tree)
+            rename_commands = ro.create_rename_commands(potential_changes)
+
+            for cmd in rename_commands:
+                try:
+                    manager.rename_file(cmd.old_filename, cmd.new_filename)
+                    results["files_renamed"] += 1
+                except Exception as e:
+                    results["errors"].append(
+                        f"Failed to rename {cmd.old_filename}: {e}")
+
+            # Refresh file list after renames
+            files = manager.get_list_of_filenames()
+
+            # Step 3: Fix links
+            link_commands = (
+                ro.generate_list_of_link_correction_commands(manager))
+            for cmd in link_commands:
+                try:
+                    content = manager.get_string_from_file_content(
+                        cmd.filename)
+                    new_content = content.replace(
+                        cmd.to_be_replaced, cmd.replace_with)
+                    manager.overwrite_file_content(cmd.filename, new_content)
+                    results["links_fixed"] += 1
+                except Exception as e:
+                    results["errors"].append(
+                        f"Failed to fix link in {cmd.filename}: {e}")
+
+            results["success"] = True
+
+        except Exception as e:
+            results["success"] = False
+            results["errors"].append(f"Reorganization failed: {e}")
 
     return results
 
@@ -712,6 +821,12 @@ def execute_reorganize(confirm: bool = False) -> dict[str, Any]:
 def run_server():
     """Initialize settings and run the MCP server."""
     st.check_directories(strict=False)
+    if st.RAG_WARM_UP:
+        try:
+            from . import rag
+            rag.warm_up_vector_store(background=True)
+        except ImportError:
+            pass
     mcp.run()
 
 
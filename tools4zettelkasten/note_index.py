@@ -0,0 +1,143 @@
+# note_index.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Cached hierarchical order of the notes of a Zettelkasten.
+
+Sorting the notes hierarchically requires tokenizing all filenames and
+building the tree of the Zettelkasten. The result only depends on the
+list of filenames, so it is cached per location together with a map
+from filename to position. The cache is invalidated when the directory
+fingerprint of the PersistencyManager changes. As the fingerprint may
+miss a change (e.g. two changes within one tick of a coarse directory
+mtime), the list of filenames is compared every REFRESH_INTERVAL
+seconds as well.
+
+The index also answers which notes are the children of a note and how
+many notes its subtree has, so the start page can show the hierarchy
+one level at a time.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from . import handle_filenames as hf
+from . import reorganize as ro
+
+# seconds after which the filenames are listed again, even if the
+# directory fingerprint is unchanged
+REFRESH_INTERVAL = 10
+
+
+@dataclass
+class NoteIndex:
+    fingerprint: object
+    order: list
+    positions: dict = field(default_factory=dict)
+    # sorted filenames the index was built from and when they were listed
+    filenames: list = None
+    checked: float = 0
+    # children and subtree sizes by ordering, built on first use
+    _children: dict = field(default=None, repr=False, compare=False)
+    _descendants: dict = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not self.positions:
+            self.positions = {
+                filename: position
+                for position, filename in enumerate(self.order)}
+
+    def get_adjacent_files(self, filename: str) -> tuple:
+        """Return previous and next note, None if there is none."""
+        position = self.positions.get(filename)
+        if position is None:
+            return (None, None)
+        previous_file = self.order[position - 1] if position > 0 else None
+        next_file = (
+            self.order[position + 1]
+            if position < len(self.order) - 1 else None)
+        return (previous_file, next_file)
+
+    def _build_hierarchy(self):
+        children = {}
+        descendants = {}
+        # orderings of the ancestors of the current note, the order of
+        # the index lists parents before their children
+        ancestors = []
+        for filename in self.order:
+            ordering = hf.create_Note(filename).ordering
+            tokens = ordering.split('_') if ordering else []
+            while ancestors and not (
+                    len(ancestors[-1][0]) < len(tokens)
+                    and tokens[:len(ancestors[-1][0])] == ancestors[-1][0]):
+                ancestors.pop()
+            parent = ancestors[-1][1] if ancestors else ''
+            children.setdefault(parent, []).append(filename)
+            for _, ancestor in ancestors:
+                descendants[ancestor] += 1
+            if tokens:
+                descendants.setdefault(ordering, 0)
+                ancestors.append((tokens, ordering))
+        self._descendants = descendants
+        self._children = children
+
+    def get_children(self, ordering: str = '') -> list:
+        """Notes directly below the note with the ordering, '' for the top.
+
+        A note whose parent does not exist is a child of its nearest
+        existing ancestor.
+        """
+        if self._children is None:
+            self._build_hierarchy()
+        return self._children.get(ordering, [])
+
+    def count_descendants(self, ordering: str) -> int:
+        """Number of notes in the subtree below the note with the ordering."""
+        if self._descendants is None:
+            self._build_hierarchy()
+        return self._descendants.get(ordering, 0)
+
+
+def build_note_index(persistency_manager, fingerprint=None,
+                     zettelkasten_list=None) -> NoteIndex:
+    """Sort the notes hierarchically, see reorganize.flatten_tree_to_list.
+
+    :param zettelkasten_list: the filenames, None to list them here
+    """
+    if zettelkasten_list is None:
+        zettelkasten_list = persistency_manager.get_list_of_filenames()
+    tokenized_list = ro.generate_tokenized_list(zettelkasten_list)
+    tree = ro.generate_tree(tokenized_list)
+    return NoteIndex(
+        fingerprint, ro.flatten_tree_to_list(tree),
+        filenames=sorted(zettelkasten_list), checked=time.monotonic())
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_note_index(persistency_manager) -> NoteIndex:
+    """Return the cached NoteIndex, rebuild it if the notes have changed."""
+    location = str(persistency_manager.directory)
+    fingerprint = persistency_manager.get_directory_fingerprint()
+    with _indexes_lock:
+        index = _indexes.get(location)
+    zettelkasten_list = None
+    if index is not None and index.fingerprint == fingerprint:
+        if time.monotonic() - index.checked < REFRESH_INTERVAL:
+            return index
+        zettelkasten_list = persistency_manager.get_list_of_filenames()
+        if sorted(zettelkasten_list) == index.filenames:
+            index.checked = time.monotonic()
+            return index
+    index = build_note_index(
+        persistency_manager, fingerprint, zettelkasten_list)
+    with _indexes_lock:
+        _indexes[location] = index
+    return index
+
+
+def clear_note_indexes():
+    with _indexes_lock:
+        _indexes.clear()
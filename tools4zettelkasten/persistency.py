@@ -4,7 +4,14 @@
 
 import os
 import logging
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from .locking import LockManager
+
+SQLITE_SCHEME = 'sqlite://'
+S3_SCHEME = 's3://'
 
 
 def is_file_existing(directory, filename) -> bool:
@@ -97,9 +104,74 @@ def get_string_from_file_content(directory, filename):
     return content_string
 
 
-def overwrite_file_content(directory, filename, new_content):
-    with open(directory / filename, 'w') as afile:
-        afile.write(new_content)
+def fsync_directory(directory):
+    """flushes the directory entry of a folder to disk
+
+    After a rename the new name is only durable once the directory
+    itself has been synced. Platforms which can not open directories
+    (e.g. Windows) silently skip this step.
+
+    :param directory: name of the directory
+    :type directory: path
+    """
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def overwrite_file_content(
+        directory, filename, new_content,
+        atomic=False, sync_directory=True):
+    """overwrites the content of a file
+
+    By default the file is truncated and written in place. With
+    ``atomic=True`` the content is written to a hidden temporary file
+    in the same directory, flushed to disk and then renamed over the
+    original file. A crash therefore leaves either the old or the new
+    version of the note, never a half-written one.
+
+    :param directory: the name of the directory containing the file
+    :type directory: path
+    :param filename: name of the file
+    :type filename: string
+    :param new_content: the new content of the file
+    :type new_content: string
+    :param atomic: write via temporary file and rename
+    :type atomic: bool
+    :param sync_directory: fsync the directory after an atomic write.
+                           Batches switch this off and sync only once
+                           (see PersistencyManager.group_commit).
+    :type sync_directory: bool
+    """
+    target = Path(directory) / filename
+    if not atomic:
+        with open(target, 'w') as afile:
+            afile.write(new_content)
+        return
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=directory, prefix='.' + filename + '.', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w') as afile:
+            afile.write(new_content)
+            afile.flush()
+            os.fsync(afile.fileno())
+        if target.exists():
+            # keep the permissions of the original note
+            os.chmod(temp_path, os.stat(target).st_mode)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    if sync_directory:
+        fsync_directory(directory)
 
 
 class PersistencyManager:
@@ -107,12 +179,45 @@ class PersistencyManager:
 
     Later we can add the same functionality on different
     persistency mechanisms (like local folder, dropbox, AWS-S3 etc.)
+
+    Content is overwritten atomically (temporary file and rename) unless
+    ``atomic_writes`` is switched off. Inside of ``group_commit()`` the
+    directory is synced only once at the end of the batch instead of
+    after every single file. The batch belongs to the thread which
+    opened it, other threads keep syncing their changes immediately.
+
+    ``locks`` coordinates concurrent access by the CLI, the Flask viewer
+    and the MCP server (see :mod:`tools4zettelkasten.locking`).
     """
-    def __init__(self, directory) -> None:
+    def __init__(self, directory, atomic_writes=True) -> None:
         if (isinstance(directory, str)):
             self.directory = Path(directory)
         else:
             self.directory = directory
+        self.atomic_writes = atomic_writes
+        # depth and dirty flag of the group commit of each thread
+        self._group_commit_state = threading.local()
+        self.locks = LockManager(self.directory)
+
+    @contextmanager
+    def group_commit(self):
+        """bundles the durability of a batch of changes
+
+        All writes and renames within the block are flushed with a
+        single fsync of the directory when the outermost block is left.
+        """
+        state = self._group_commit_state
+        state.depth = getattr(state, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            state.depth -= 1
+            if state.depth == 0 and getattr(state, 'dirty', False):
+                state.dirty = False
+                fsync_directory(self.directory)
+
+    def _in_group_commit(self) -> bool:
+        return getattr(self._group_commit_state, 'depth', 0) > 0
 
     def get_list_of_filenames(self):
         return list_of_filenames_from_directory(directory=self.directory)
@@ -125,14 +230,31 @@ class PersistencyManager:
             directory=self.directory, filename=filename)
 
     def overwrite_file_content(self, filename, new_content):
+        in_group_commit = self._in_group_commit()
         overwrite_file_content(
             directory=self.directory,
             filename=filename,
-            new_content=new_content)
+            new_content=new_content,
+            atomic=self.atomic_writes,
+            sync_directory=not in_group_commit)
+        if in_group_commit and self.atomic_writes:
+            self._group_commit_state.dirty = True
 
     def is_file_existing(self, filename):
         return is_file_existing(directory=self.directory, filename=filename)
 
+    def get_modification_time(self, filename):
+        return os.path.getmtime(self.directory / filename)
+
+    def get_directory_fingerprint(self):
+        """changes whenever a file is added, deleted or renamed
+
+        The modification time of the folder is updated by the file
+        system for every change of its entries, the notes need not be
+        listed. Lock files are kept outside of the folder.
+        """
+        return os.stat(self.directory).st_mtime_ns
+
     def is_markdown_file(self, filename):
         return is_markdown_file(filename)
 
@@ -144,3 +266,65 @@ class PersistencyManager:
             directory=self.directory,
             oldfilename=oldfilename,
             newfilename=newfilename)
+        if self._in_group_commit():
+            self._group_commit_state.dirty = True
+        else:
+            fsync_directory(self.directory)
+
+
+def create_persistency_manager(location):
+    """creates the PersistencyManager for a configured location
+
+    A plain path is a folder of markdown files. A location of the form
+    ``sqlite:///path/to/notes.db`` is served by the SQLite backend,
+    ``s3://bucket/prefix`` by the S3 compatible object store backend.
+    A zip or tar file is served read-only as a snapshot.
+
+    :param location: folder or URL of the Zettelkasten
+    :type location: string or path
+    :return: a PersistencyManager for the location
+    """
+    location = str(location)
+    if location.startswith(SQLITE_SCHEME):
+        from .sqlite_persistency import open_database
+        return open_database(location[len(SQLITE_SCHEME):])
+    if location.startswith(S3_SCHEME):
+        from .s3_persistency import open_bucket, split_s3_location
+        return open_bucket(*split_s3_location(location))
+    from .archive_persistency import open_snapshot, is_archive_location
+    if is_archive_location(location):
+        return open_snapshot(location)
+    return PersistencyManager(location)
+
+
+def close_persistency_managers():
+    """closes the managers shared per process by the backends
+
+    Call it before forking, the children open their own connections
+    and clients (threads of the S3 backend do not survive a fork).
+    """
+    from .sqlite_persistency import close_databases
+    from .s3_persistency import close_buckets
+    from .archive_persistency import close_snapshots
+    close_databases()
+    close_buckets()
+    close_snapshots()
+
+
+def copy_notes(source, target):
+    """copies all notes from one PersistencyManager to another
+
+    Used to export a database backend back to a markdown folder
+    or to load a folder into a database.
+
+    :param source: PersistencyManager to read from
+    :param target: PersistencyManager to write to
+    :return: number of copied notes
+    :rtype: int
+    """
+    filenames = source.get_list_of_filenames()
+    with target.group_commit():
+        for filename in filenames:
+            target.overwrite_file_content(
+                filename, source.get_string_from_file_content(filename))
+    return len(filenames)
@@ -6,10 +6,12 @@ import re
 import hashlib
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from . import handle_filenames as hf
 from . import settings as st
-from .persistency import PersistencyManager
+from .persistency import PersistencyManager, create_persistency_manager
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,11 @@ for _lib in ('chromadb', 'urllib3', 'sentence_transformers', 'httpx',
              'httpcore', 'openai', 'posthog'):
     logging.getLogger(_lib).setLevel(logging.WARNING)
 
+# reciprocal rank fusion: damping of the ranks and number of candidates
+# per retriever, as multiple of the requested results
+RRF_K = 60
+RRF_CANDIDATES = 4
+
 
 SYSTEM_PROMPT = (
     "Du bist ein Assistent, der Fragen basierend auf einem persönlichen "
@@ -137,7 +144,7 @@ class VectorStore:
             )
         os.makedirs(chroma_path, exist_ok=True)
         self._client = chromadb.PersistentClient(path=chroma_path)
-        self._embedder = embedder or ZettelkastenEmbedder()
+        self._embedder = embedder or get_embedder()
         self._collection = self._client.get_or_create_collection(
             name='zettelkasten',
             metadata={'hnsw:space': 'cosine'}
@@ -337,6 +344,163 @@ class VectorStore:
         }
 
 
+_embedder = None
+_vector_store = None
+_registry_lock = threading.Lock()
+
+
+def get_embedder() -> ZettelkastenEmbedder:
+    """Return the process-wide embedder, loading the model on first use.
+
+    Loading the SentenceTransformer model takes seconds, so it is done
+    only once per process and shared by all VectorStore instances.
+    """
+    global _embedder
+    if _embedder is None:
+        with _registry_lock:
+            if _embedder is None:
+                _embedder = ZettelkastenEmbedder()
+    return _embedder
+
+
+def get_vector_store() -> VectorStore:
+    """Return the process-wide VectorStore, created on first use.
+
+    Flask, the CLI chat loop and the MCP server share this instance, so
+    the ChromaDB client and the embedding model stay warm between
+    requests. Safe to call from several threads.
+    """
+    global _vector_store
+    if _vector_store is None:
+        embedder = get_embedder()
+        with _registry_lock:
+            if _vector_store is None:
+                _vector_store = VectorStore(embedder=embedder)
+    return _vector_store
+
+
+def warm_up_vector_store(background: bool = True):
+    """Load the shared VectorStore and embedding model ahead of time.
+
+    :param background: if True, load in a daemon thread and return
+        immediately
+    :return: the thread doing the warm up, or None if run in foreground
+    """
+    def _warm_up():
+        try:
+            get_vector_store()
+            logger.info("Vector store and embedding model are ready")
+        except Exception as e:
+            logger.warning(f"Warm up of vector store failed: {e}")
+
+    if not background:
+        _warm_up()
+        return None
+    thread = threading.Thread(
+        target=_warm_up, name='vector-store-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> list:
+    """Fuse rankings by the sum of 1 / (k + rank) of every ranking.
+
+    :param rankings: lists of keys, best first
+    :return: list of (key, fused score), best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def lexical_search(persistency_manager: PersistencyManager, query: str,
+                   top_k: int = None) -> list:
+    """Search the notes with the BM25 index of search_index.
+
+    Finds exact terms like acronyms, code identifiers and names, which
+    the embedding model tends to miss.
+    """
+    from .search_index import get_search_index
+    if top_k is None:
+        top_k = int(st.RAG_TOP_K)
+    index = get_search_index(
+        persistency_manager, st.SEARCH_INDEX_PATH or None)
+    search_results = []
+    for filename, title, score, _ in index.search(query, top_k):
+        components = hf.get_filename_components(filename)
+        search_results.append(SearchResult(
+            zettel_id=components[2],
+            title=title,
+            ordering=components[0],
+            filename=filename,
+            content=persistency_manager.get_string_from_file_content(
+                filename),
+            score=score,
+        ))
+    return search_results
+
+
+def _result_key(search_result: SearchResult) -> str:
+    return search_result.zettel_id or search_result.filename
+
+
+def hybrid_search(query: str, top_k: int = None,
+                  persistency_manager: PersistencyManager = None,
+                  vector_store=None) -> list:
+    """Search with BM25 and the vector store, fused by reciprocal rank.
+
+    Both queries run concurrently. Each retrieves RRF_CANDIDATES times
+    top_k candidates, the score of a result is its fused score.
+    """
+    if top_k is None:
+        top_k = int(st.RAG_TOP_K)
+    if persistency_manager is None:
+        persistency_manager = create_persistency_manager(st.ZETTELKASTEN)
+    if vector_store is None:
+        vector_store = get_vector_store()
+    candidates = top_k * RRF_CANDIDATES
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        vector_future = executor.submit(
+            vector_store.search, query, candidates)
+        lexical_results = lexical_search(
+            persistency_manager, query, candidates)
+        vector_results = vector_future.result()
+    results_by_key = {}
+    # the vector store holds the content which was embedded
+    for search_result in lexical_results + vector_results:
+        results_by_key[_result_key(search_result)] = search_result
+    fused = reciprocal_rank_fusion([
+        [_result_key(r) for r in vector_results],
+        [_result_key(r) for r in lexical_results]])
+    search_results = []
+    for key, score in fused[:top_k]:
+        search_result = results_by_key[key]
+        search_result.score = score
+        search_results.append(search_result)
+    return search_results
+
+
+def search(query: str, top_k: int = None, mode: str = None) -> list:
+    """Retrieve zettel for a question with the given search mode.
+
+    :param mode: 'vector', 'lexical' or 'hybrid', default RAG_SEARCH_MODE
+    """
+    if mode is None:
+        mode = st.RAG_SEARCH_MODE
+    if mode == 'vector':
+        return get_vector_store().search(query, top_k=top_k)
+    if mode == 'lexical':
+        return lexical_search(
+            create_persistency_manager(st.ZETTELKASTEN), query, top_k)
+    if mode == 'hybrid':
+        return hybrid_search(query, top_k)
+    raise ValueError(
+        f"unknown search mode {mode}, use one of "
+        + ", ".join(st.RAG_SEARCH_MODES))
+
+
 def format_context(search_results: list) -> str:
     """Format search results as context for the LLM prompt."""
     parts = []
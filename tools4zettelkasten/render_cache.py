@@ -0,0 +1,197 @@
+# render_cache.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Caches of the HTML and SVG rendered by the Flask viewer.
+
+Rendering a note with syntax highlighting is expensive, so the result is
+kept in an LRU cache. The key consists of the filename, the hash of the
+content and the fingerprint of the markdown configuration, an edited
+note or a changed configuration therefore never returns stale HTML.
+
+Optionally the rendered HTML is also written to a directory, so a
+restarted server does not have to render all notes again. On disk there
+is at most one entry per note, the entry of the latest content.
+
+The SVG graph of the whole Zettelkasten takes graphviz much longer. It
+is re-rendered in the background when the graph changes, meanwhile the
+last good SVG is served (stale-while-revalidate).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from . import persistency as ps
+
+
+def fingerprint(value) -> str:
+    """SHA-256 hash of a string or of a JSON serializable configuration."""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True)
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """LRU cache of rendered HTML with optional persistence on disk."""
+
+    def __init__(self, maxsize: int = 256, directory: str = None):
+        self.maxsize = maxsize
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_filename(self, filename: str) -> str:
+        return fingerprint(filename) + '.html'
+
+    def _read_from_disk(self, filename: str, key: str):
+        if not self.directory:
+            return None
+        path = os.path.join(self.directory, self._disk_filename(filename))
+        try:
+            with open(path, encoding='utf-8') as file:
+                stored_key = file.readline().rstrip('\n')
+                if stored_key != key:
+                    return None
+                return file.read()
+        except OSError:
+            return None
+
+    def _write_to_disk(self, filename: str, key: str, html: str):
+        if not self.directory:
+            return
+        ps.overwrite_file_content(
+            self.directory, self._disk_filename(filename),
+            key + '\n' + html, atomic=True, sync_directory=False)
+
+    def get(self, filename: str, key: str):
+        """Return the cached HTML or None."""
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(filename)
+                return entry[1]
+        html = self._read_from_disk(filename, key)
+        if html is not None:
+            self._remember(filename, key, html)
+        return html
+
+    def _remember(self, filename: str, key: str, html: str):
+        with self._lock:
+            self._entries[filename] = (key, html)
+            self._entries.move_to_end(filename)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def put(self, filename: str, key: str, html: str):
+        self._remember(filename, key, html)
+        self._write_to_disk(filename, key, html)
+
+    def get_or_render(self, filename: str, content: str,
+                      config_fingerprint: str, render) -> str:
+        """Return the HTML of a note, render it only if it is not cached.
+
+        :param filename: name of the note
+        :param content: markdown of the note
+        :param config_fingerprint: fingerprint of the render configuration
+        :param render: function creating the HTML from the markdown
+        """
+        key = fingerprint(content) + ':' + config_fingerprint
+        html = self.get(filename, key)
+        if html is None:
+            html = render(content)
+            self.put(filename, key, html)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SvgRenderCache:
+    """Last rendered SVG of the graph, re-rendered in the background.
+
+    Two fingerprints are involved: the source fingerprint is cheap to
+    compute (e.g. names and modification times of the notes), the graph
+    fingerprint covers the nodes and edges. An edit which does not
+    change the graph is therefore not rendered again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._svg = None
+        self._source_fingerprint = None
+        self._graph_fingerprint = None
+        self._pending = None
+
+    def get_svg(self, source_fingerprint: str, create_graph) -> tuple:
+        """Return the SVG and the source fingerprint it belongs to.
+
+        :param source_fingerprint: fingerprint of the current notes
+        :param create_graph: function returning the graph fingerprint and
+            a function rendering the SVG of the current notes
+        :return: (svg, source fingerprint of the returned svg)
+        """
+        with self._lock:
+            if (self._svg is not None
+                    and self._source_fingerprint == source_fingerprint):
+                return self._svg, self._source_fingerprint
+        graph_fingerprint, render = create_graph()
+        with self._lock:
+            if (self._svg is not None
+                    and self._graph_fingerprint == graph_fingerprint):
+                self._source_fingerprint = source_fingerprint
+                return self._svg, self._source_fingerprint
+            if self._svg is not None:
+                if self._pending is None or (
+                        self._pending.fingerprint != graph_fingerprint):
+                    self._schedule(
+                        source_fingerprint, graph_fingerprint, render)
+                return self._svg, self._source_fingerprint
+        # nothing to serve yet, the first render has to be waited for
+        svg = render()
+        self._store(source_fingerprint, graph_fingerprint, svg)
+        return svg, source_fingerprint
+
+    def _store(self, source_fingerprint, graph_fingerprint, svg):
+        with self._lock:
+            self._svg = svg
+            self._source_fingerprint = source_fingerprint
+            self._graph_fingerprint = graph_fingerprint
+
+    def _schedule(self, source_fingerprint, graph_fingerprint, render):
+        """Render in the background, called with the lock held."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+        def _render():
+            try:
+                svg = render()
+            except Exception:
+                logging.exception("rendering of the graph failed")
+                svg = None
+            # the lock is released only after self._pending is assigned
+            with self._lock:
+                if svg is not None:
+                    self._svg = svg
+                    self._source_fingerprint = source_fingerprint
+                    self._graph_fingerprint = graph_fingerprint
+                if self._pending is future:
+                    self._pending = None
+
+        future = self._executor.submit(_render)
+        future.fingerprint = graph_fingerprint
+        self._pending = future
+
+    def wait(self):
+        """Block until a scheduled render has finished."""
+        with self._lock:
+            pending = self._pending
+        if pending is not None:
+            pending.result()
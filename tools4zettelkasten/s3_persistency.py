@@ -0,0 +1,372 @@
+# s3_persistency.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""S3 compatible object store backend for the Zettelkasten.
+
+Notes are stored as objects below a key prefix of a bucket. Every note
+that has been read once is kept in a local read-through cache. The
+cached copy is validated with the ETag of the object, which is known
+from the (paginated) listing, so a warm cache costs one LIST request
+instead of one GET per note. Notes can be prefetched in parallel.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from . import persistency as ps
+from . import settings as st
+from .locking import LockManager
+
+# S3 accepts at most 1000 keys per DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+# seconds a listing is reused by get_list_of_filenames and
+# get_directory_fingerprint, so a request checking the fingerprint and
+# then listing the notes costs at most one LIST
+LISTING_MAX_AGE = 1.0
+
+
+def split_s3_location(location):
+    """splits s3://bucket/some/prefix into bucket and prefix
+
+    :param location: the URL of the Zettelkasten
+    :type location: string
+    :return: bucket and prefix (empty or ending with a slash)
+    :rtype: tuple
+    """
+    path = location[len(ps.S3_SCHEME):]
+    bucket, _, prefix = path.partition('/')
+    prefix = prefix.strip('/')
+    if prefix:
+        prefix += '/'
+    return bucket, prefix
+
+
+def _is_not_modified(error):
+    code = str(error.response.get('Error', {}).get('Code', ''))
+    return code in ('304', 'NotModified')
+
+
+def _is_not_found(error):
+    code = str(error.response.get('Error', {}).get('Code', ''))
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+class S3PersistencyManager:
+    """PersistencyManager storing the notes in an S3 compatible bucket
+
+    The interface is the same as the one of
+    :class:`tools4zettelkasten.persistency.PersistencyManager`.
+    Inside of ``group_commit()`` the deletes of renamed objects are
+    collected and sent as batched DeleteObjects requests at the end.
+    """
+    def __init__(
+            self, bucket, prefix='', cache_directory=None, client=None,
+            max_workers=16, prefetch=False) -> None:
+        self.bucket = bucket
+        self.prefix = prefix
+        if cache_directory is None:
+            cache_directory = st.S3_CACHE_PATH
+        self.cache_directory = Path(cache_directory) / bucket / prefix
+        self.cache_directory.mkdir(parents=True, exist_ok=True)
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImportError(
+                    "boto3 is required for the S3 backend. "
+                    "Install with: pip install 'tools4zettelkasten[s3]'"
+                )
+            client = boto3.client(
+                's3', endpoint_url=st.S3_ENDPOINT_URL or None)
+        self._client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._prefetch = prefetch
+        # reentrant, done callbacks may run while the lock is held
+        self._lock = threading.RLock()
+        self._listing = {}
+        self._listed_at = None
+        self._futures = {}
+        self._pending_deletes = set()
+        self._group_commit_depth = 0
+        self.locks = LockManager(self.directory)
+
+    @property
+    def directory(self):
+        """location of the bucket, used for messages"""
+        return ps.S3_SCHEME + self.bucket + '/' + self.prefix
+
+    def _key(self, filename):
+        return self.prefix + filename
+
+    def _cache_path(self, filename):
+        return self.cache_directory / filename
+
+    def _etag_path(self, filename):
+        return self.cache_directory / (filename + '.etag')
+
+    def _cached_etag(self, filename):
+        try:
+            return self._etag_path(filename).read_text()
+        except OSError:
+            return None
+
+    def _store_in_cache(self, filename, content, etag):
+        ps.overwrite_file_content(
+            self.cache_directory, filename, content,
+            atomic=True, sync_directory=False)
+        ps.overwrite_file_content(
+            self.cache_directory, filename + '.etag', etag,
+            atomic=True, sync_directory=False)
+
+    def _list(self):
+        """lists all notes below the prefix, page by page
+
+        The ETags of the listing are remembered to validate the cache.
+        """
+        listing = {}
+        with self._lock:
+            pending_deletes = set(self._pending_deletes)
+        paginator = self._client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(
+                Bucket=self.bucket, Prefix=self.prefix, Delimiter='/'):
+            for entry in page.get('Contents', []):
+                filename = entry['Key'][len(self.prefix):]
+                if (not filename
+                        # do not process hidden files
+                        or filename[0] == '.'
+                        or entry['Key'] in pending_deletes):
+                    continue
+                listing[filename] = {
+                    'etag': entry['ETag'],
+                    'last_modified': entry['LastModified'].timestamp(),
+                }
+        with self._lock:
+            self._listing = listing
+            self._listed_at = time.monotonic()
+        return list(listing)
+
+    def _recent_listing(self):
+        """the notes of a listing younger than LISTING_MAX_AGE seconds
+
+        Writes of this manager are applied to the reused listing.
+        """
+        with self._lock:
+            if (self._listed_at is not None
+                    and time.monotonic() - self._listed_at
+                    < LISTING_MAX_AGE):
+                return list(self._listing)
+        return self._list()
+
+    def get_list_of_filenames(self):
+        """lists all notes below the prefix, see _recent_listing"""
+        filenames = self._recent_listing()
+        if self._prefetch:
+            self.prefetch_files(filenames)
+        return filenames
+
+    def get_directory_fingerprint(self):
+        """hash of the listed keys
+
+        The bucket may be changed by other hosts, so there is no cheaper
+        way to notice added, deleted or renamed notes than a paginated
+        LIST. It is sent at most every LISTING_MAX_AGE seconds, the
+        listing is shared with get_list_of_filenames.
+        """
+        filenames = sorted(self._recent_listing())
+        return hashlib.sha256(
+            '\n'.join(filenames).encode('utf-8')).hexdigest()
+
+    def close(self):
+        """stops the threads fetching notes"""
+        self._executor.shutdown(wait=True)
+
+    def _fetch(self, filename):
+        cached_etag = self._cached_etag(filename)
+        with self._lock:
+            listed = self._listing.get(filename)
+        if cached_etag is not None and listed is not None:
+            if listed['etag'] == cached_etag:
+                return self._cache_path(filename).read_text()
+        from botocore.exceptions import ClientError
+        request = {'Bucket': self.bucket, 'Key': self._key(filename)}
+        if cached_etag is not None:
+            request['IfNoneMatch'] = cached_etag
+        try:
+            response = self._client.get_object(**request)
+        except ClientError as error:
+            if _is_not_modified(error):
+                return self._cache_path(filename).read_text()
+            if _is_not_found(error):
+                raise FileNotFoundError(
+                    "no note " + filename + " in " + self.directory)
+            raise
+        content = response['Body'].read().decode('utf-8')
+        self._store_in_cache(filename, content, response['ETag'])
+        return content
+
+    def _fetch_async(self, filename):
+        with self._lock:
+            future = self._futures.get(filename)
+            if future is None:
+                future = self._executor.submit(self._fetch, filename)
+                self._futures[filename] = future
+                future.add_done_callback(
+                    lambda done, name=filename: self._forget(name, done))
+        return future
+
+    def _forget(self, filename, future):
+        with self._lock:
+            if self._futures.get(filename) is future:
+                del self._futures[filename]
+
+    def prefetch_files(self, filenames=None, wait=False):
+        """fetches notes into the local cache in parallel
+
+        :param filenames: notes to fetch, all listed notes if None
+        :param wait: block until all notes are in the cache
+        """
+        if filenames is None:
+            with self._lock:
+                filenames = list(self._listing)
+        futures = [self._fetch_async(filename) for filename in filenames]
+        if wait:
+            for future in futures:
+                future.exception()
+
+    def get_string_from_file_content(self, filename):
+        return self._fetch_async(filename).result()
+
+    def get_file_content(self, filename):
+        return self.get_string_from_file_content(filename).splitlines(
+            keepends=True)
+
+    def overwrite_file_content(self, filename, new_content):
+        response = self._client.put_object(
+            Bucket=self.bucket, Key=self._key(filename),
+            Body=new_content.encode('utf-8'),
+            ContentType='text/markdown; charset=utf-8')
+        self._store_in_cache(filename, new_content, response['ETag'])
+        with self._lock:
+            self._pending_deletes.discard(self._key(filename))
+            self._listing[filename] = {
+                'etag': response['ETag'],
+                'last_modified': time.time(),
+            }
+
+    def is_file_existing(self, filename):
+        if filename[0] == '.':
+            return False
+        with self._lock:
+            if filename in self._listing:
+                return True
+        from botocore.exceptions import ClientError
+        try:
+            self._client.head_object(
+                Bucket=self.bucket, Key=self._key(filename))
+        except ClientError as error:
+            if _is_not_found(error):
+                return False
+            raise
+        return self._key(filename) not in self._pending_deletes
+
+    def is_markdown_file(self, filename):
+        return ps.is_markdown_file(filename)
+
+    def is_text_file(self, filename):
+        return ps.is_text_file(filename)
+
+    def get_modification_time(self, filename):
+        with self._lock:
+            listed = self._listing.get(filename)
+        if listed is not None:
+            return listed['last_modified']
+        response = self._client.head_object(
+            Bucket=self.bucket, Key=self._key(filename))
+        return response['LastModified'].timestamp()
+
+    def rename_file(self, oldfilename, newfilename):
+        """renames a note by copying and deleting the object
+
+        Within ``group_commit()`` the delete is deferred and batched.
+        """
+        self._client.copy_object(
+            Bucket=self.bucket, Key=self._key(newfilename),
+            CopySource={'Bucket': self.bucket,
+                        'Key': self._key(oldfilename)})
+        cache_path = self._cache_path(oldfilename)
+        if cache_path.exists():
+            os.replace(cache_path, self._cache_path(newfilename))
+            os.replace(
+                self._etag_path(oldfilename), self._etag_path(newfilename))
+        with self._lock:
+            listed = self._listing.pop(oldfilename, None)
+            if listed is not None:
+                self._listing[newfilename] = listed
+            self._pending_deletes.discard(self._key(newfilename))
+            self._pending_deletes.add(self._key(oldfilename))
+            in_group_commit = self._group_commit_depth > 0
+        if not in_group_commit:
+            self._flush_deletes()
+        print('renamed: ', oldfilename, ' with: ', newfilename)
+
+    def _flush_deletes(self):
+        with self._lock:
+            keys = sorted(self._pending_deletes)
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            response = self._client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in batch],
+                        'Quiet': True})
+            for error in response.get('Errors', []):
+                logging.error(
+                    "delete-error: " + error['Key'] + " "
+                    + error.get('Message', ''))
+        with self._lock:
+            self._pending_deletes.difference_update(keys)
+
+    @contextmanager
+    def group_commit(self):
+        """batches the deletes of all renames within the block"""
+        with self._lock:
+            self._group_commit_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._group_commit_depth -= 1
+                outermost = self._group_commit_depth == 0
+            if outermost:
+                self._flush_deletes()
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def open_bucket(bucket, prefix='') -> S3PersistencyManager:
+    """returns the shared S3PersistencyManager of a bucket and prefix
+
+    The client, the threads fetching notes and the listing are created
+    once per process instead of for every request of the Flask viewer.
+    """
+    with _buckets_lock:
+        manager = _buckets.get((bucket, prefix))
+        if manager is None:
+            manager = _buckets[(bucket, prefix)] = S3PersistencyManager(
+                bucket, prefix)
+        return manager
+
+
+def close_buckets():
+    """closes the managers opened by open_bucket"""
+    with _buckets_lock:
+        for manager in _buckets.values():
+            manager.close()
+        _buckets.clear()
@@ -0,0 +1,447 @@
+# search_index.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Full-text search of the notes with an inverted index and BM25.
+
+Every note is split into lowercase word tokens. The index maps each term
+to the notes containing it together with the positions of the term, so
+a query only touches the notes of its terms and phrases in quotes can be
+checked without reading the notes. The results are ranked with BM25.
+
+The index is cached per location and persisted in SQLite, one row per
+note, so after an edit only the rows of the changed notes are written.
+Writing and the periodic check of the modification times run in a
+background thread, a query only waits for the update in memory. A
+restart only reads the notes which are new or have a new modification
+time.
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .render_cache import fingerprint
+from .title_index import get_title
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# BM25 parameters: saturation of the term frequency and length normalization
+K1 = 1.2
+B = 0.75
+# a term without exact matches is expanded to this many terms it begins
+MAX_PREFIX_EXPANSIONS = 20
+# seconds after which the modification times are checked again, even if
+# the directory fingerprint is unchanged (notes edited in place)
+REFRESH_INTERVAL = 10
+FORMAT_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS notes (
+    filename TEXT PRIMARY KEY,
+    modification_time TEXT,
+    title TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    positions TEXT NOT NULL
+);
+'''
+
+
+def _timestamp(modification_time):
+    """modification time as stored in the database"""
+    if isinstance(modification_time, (int, float, str)):
+        return modification_time
+    return str(modification_time)
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def parse_query(query: str) -> tuple:
+    """splits a query into single terms and phrases in double quotes
+
+    :return: (terms, phrases), a phrase is a list of terms
+    """
+    phrases = []
+    for phrase in re.findall(r'"([^"]*)"', query):
+        tokens = tokenize(phrase)
+        if len(tokens) > 1:
+            phrases.append(tokens)
+        elif tokens:
+            # a quoted single word is an ordinary term
+            query += ' ' + tokens[0]
+    terms = tokenize(re.sub(r'"[^"]*"', ' ', query))
+    for phrase in phrases:
+        terms.extend(phrase)
+    return list(dict.fromkeys(terms)), phrases
+
+
+def _contains_phrase(positions_of_terms: list) -> bool:
+    """checks if the terms occur at consecutive positions"""
+    following = [set(positions) for positions in positions_of_terms[1:]]
+    for start in positions_of_terms[0]:
+        if all(start + offset + 1 in positions
+               for offset, positions in enumerate(following)):
+            return True
+    return False
+
+
+def highlight_snippet(content: str, terms, phrases, width: int = 60) -> str:
+    """text around the first match, matched words marked with ** **"""
+    words = set(terms)
+    matches = [
+        match for match in TOKEN_PATTERN.finditer(content)
+        if match.group().lower() in words]
+    if not matches:
+        return content[:2 * width].replace('\n', ' ')
+    first = matches[0]
+    for phrase in phrases:
+        pattern = r'\b' + r'\W+'.join(map(re.escape, phrase)) + r'\b'
+        phrase_match = re.search(pattern, content, re.IGNORECASE)
+        if phrase_match:
+            first = phrase_match
+            break
+    start = max(0, first.start() - width)
+    end = min(len(content), first.end() + width)
+    parts = []
+    position = start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        parts.append(content[position:match.start()])
+        parts.append('**' + match.group() + '**')
+        position = match.end()
+    parts.append(content[position:end])
+    snippet = ''.join(parts).replace('\n', ' ')
+    if start > 0:
+        snippet = '...' + snippet
+    if end < len(content):
+        snippet = snippet + '...'
+    return snippet
+
+
+class SearchIndex:
+    """Positional inverted index of the notes with BM25 ranking."""
+
+    def __init__(self, path: str = None):
+        """
+        :param path: SQLite file the index is persisted to, None to keep
+            it in memory only
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # filename -> (modification time, title, length)
+        self._documents = {}
+        # term -> {filename: [positions]}
+        self._postings = {}
+        # filename -> terms of the note, to remove it from the postings
+        self._terms = {}
+        self._total_length = 0
+        self._vocabulary = None
+        self._fingerprint = None
+        self._checked = 0
+        # notes changed or removed since the last save
+        self._unsaved = set()
+        self._executor = None
+        # task -> future of the task, as long as it has not started
+        self._pending = {}
+        self._active = 0
+        self._idle = threading.Condition(self._lock)
+        self._connection = None
+        self._database_lock = threading.Lock()
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, filename: str, content: str, modification_time=None):
+        """indexes a note, replaces an older version of it"""
+        tokens = tokenize(content)
+        positions = {}
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        title = get_title(filename, content.split('\n', 1)[0])
+        with self._lock:
+            self._remove(filename)
+            self._insert(
+                filename, modification_time, title, len(tokens), positions)
+            self._unsaved.add(filename)
+
+    def _insert(self, filename, modification_time, title, length, positions):
+        self._documents[filename] = (modification_time, title, length)
+        self._terms[filename] = list(positions)
+        self._total_length += length
+        for term, term_positions in positions.items():
+            self._postings.setdefault(term, {})[filename] = term_positions
+        self._vocabulary = None
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._remove(filename)
+            self._unsaved.add(filename)
+
+    def _remove(self, filename: str):
+        document = self._documents.pop(filename, None)
+        if document is None:
+            return
+        self._total_length -= document[2]
+        for term in self._terms.pop(filename):
+            del self._postings[term][filename]
+            if not self._postings[term]:
+                del self._postings[term]
+        self._vocabulary = None
+
+    def update_note(self, persistency_manager, filename: str):
+        """reads one note again, e.g. after it was saved"""
+        self.add(
+            filename,
+            persistency_manager.get_string_from_file_content(filename),
+            _timestamp(persistency_manager.get_modification_time(filename)))
+        self._schedule('save', self.save)
+
+    def refresh(self, persistency_manager, force: bool = False):
+        """brings the index up to date with the notes
+
+        Only notes which are new or have a new modification time are read.
+        If the directory fingerprint is unchanged, the modification times
+        are checked in the background every REFRESH_INTERVAL seconds and
+        the query is answered right away. The index is saved in the
+        background if anything has changed.
+        """
+        fingerprint = persistency_manager.get_directory_fingerprint()
+        if not force and fingerprint == self._fingerprint:
+            now = time.monotonic()
+            if now - self._checked >= REFRESH_INTERVAL:
+                self._checked = now
+                self._schedule(
+                    'refresh',
+                    lambda: self._update(persistency_manager, force=True))
+            return
+        self._update(persistency_manager, fingerprint, force)
+
+    def _update(self, persistency_manager, fingerprint=None,
+                force: bool = False):
+        """reads the changed notes
+
+        :param fingerprint: directory fingerprint, None to get it here
+        """
+        with self._refresh_lock:
+            if fingerprint is None:
+                fingerprint = persistency_manager.get_directory_fingerprint()
+            elif not force and fingerprint == self._fingerprint:
+                # another thread has just brought the index up to date
+                return
+            filenames = [
+                filename
+                for filename in persistency_manager.get_list_of_filenames()
+                if persistency_manager.is_markdown_file(filename)]
+            removed = set(self._documents) - set(filenames)
+            for filename in removed:
+                self.remove(filename)
+            changed = bool(removed)
+            for filename in filenames:
+                modification_time = _timestamp(
+                    persistency_manager.get_modification_time(filename))
+                document = self._documents.get(filename)
+                if document is None or document[0] != modification_time:
+                    self.add(
+                        filename,
+                        persistency_manager.get_string_from_file_content(
+                            filename),
+                        modification_time)
+                    changed = True
+            self._fingerprint = fingerprint
+            self._checked = time.monotonic()
+        if changed:
+            self._schedule('save', self.save)
+
+    def _schedule(self, task: str, function):
+        """runs the function in the background thread, unless the same
+        task is already waiting there"""
+        with self._lock:
+            # a waiting task sees the latest changes when it runs
+            if task in self._pending:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+
+            def _run():
+                with self._lock:
+                    if self._pending.get(task) is future:
+                        del self._pending[task]
+                try:
+                    function()
+                except Exception:
+                    logging.exception("%s of the search index failed", task)
+                finally:
+                    with self._lock:
+                        self._active -= 1
+                        self._idle.notify_all()
+
+            self._active += 1
+            future = self._executor.submit(_run)
+            self._pending[task] = future
+
+    def wait(self):
+        """Block until the scheduled refreshes and saves have finished."""
+        with self._idle:
+            while self._active:
+                self._idle.wait()
+
+    def _expand(self, term: str) -> list:
+        """the term itself, or the indexed terms it is a prefix of"""
+        if term in self._postings:
+            return [term]
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        expansions = []
+        position = bisect.bisect_left(self._vocabulary, term)
+        while (position < len(self._vocabulary)
+               and self._vocabulary[position].startswith(term)
+               and len(expansions) < MAX_PREFIX_EXPANSIONS):
+            expansions.append(self._vocabulary[position])
+            position += 1
+        return expansions
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """notes matching the query, ranked by BM25
+
+        Notes matching more terms rank higher. Phrases in double quotes
+        must occur as such. A word which does not occur in any note
+        matches the words it begins, like the former substring search.
+
+        :return: list of (filename, title, score, terms), terms are the
+            indexed terms which matched
+        """
+        terms, phrases = parse_query(query)
+        with self._lock:
+            number_of_documents = len(self._documents)
+            if not terms or not number_of_documents:
+                return []
+            average_length = self._total_length / number_of_documents
+            scores = {}
+            matched_terms = {}
+            for term in terms:
+                for expansion in self._expand(term):
+                    documents = self._postings[expansion]
+                    idf = math.log(
+                        1 + (number_of_documents - len(documents) + 0.5)
+                        / (len(documents) + 0.5))
+                    for filename, positions in documents.items():
+                        length = self._documents[filename][2]
+                        frequency = len(positions)
+                        scores[filename] = scores.get(filename, 0) + idf * (
+                            frequency * (K1 + 1)
+                            / (frequency + K1 * (
+                                1 - B + B * length / average_length)))
+                        matched_terms.setdefault(filename, set()).add(
+                            expansion)
+            for phrase in phrases:
+                postings = [self._postings.get(term, {}) for term in phrase]
+                scores = {
+                    filename: score for filename, score in scores.items()
+                    if all(filename in documents for documents in postings)
+                    and _contains_phrase(
+                        [documents[filename] for documents in postings])}
+            ranking = sorted(
+                scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [
+                (filename, self._documents[filename][1], round(score, 4),
+                 sorted(matched_terms[filename]))
+                for filename, score in ranking]
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False)
+            version = self._connection.execute(
+                'PRAGMA user_version').fetchone()[0]
+            if version != FORMAT_VERSION:
+                self._connection.execute('DROP TABLE IF EXISTS notes')
+                self._connection.execute(
+                    f'PRAGMA user_version = {FORMAT_VERSION}')
+            self._connection.executescript(SCHEMA)
+            self._connection.commit()
+        return self._connection
+
+    def _load(self):
+        try:
+            with self._database_lock:
+                rows = self._connect().execute(
+                    'SELECT filename, modification_time, title, length, '
+                    'positions FROM notes').fetchall()
+        except sqlite3.Error:
+            logging.exception("the search index can not be read")
+            return
+        for filename, modification_time, title, length, positions in rows:
+            self._insert(
+                filename, json.loads(modification_time), title, length,
+                json.loads(positions))
+
+    def save(self):
+        """writes the notes changed since the last save"""
+        if not self.path:
+            return
+        with self._lock:
+            rows = []
+            removed = []
+            for filename in self._unsaved:
+                document = self._documents.get(filename)
+                if document is None:
+                    removed.append((filename,))
+                    continue
+                modification_time, title, length = document
+                positions = {
+                    term: self._postings[term][filename]
+                    for term in self._terms[filename]}
+                rows.append((
+                    filename, json.dumps(modification_time), title, length,
+                    json.dumps(positions)))
+            self._unsaved.clear()
+        with self._database_lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    'DELETE FROM notes WHERE filename = ?', removed)
+                connection.executemany(
+                    'INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?)',
+                    rows)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(
+        persistency_manager, directory: str = None) -> SearchIndex:
+    """Return the cached SearchIndex of the location, refreshed.
+
+    :param directory: where the indexes are persisted, one file per
+        location, None to keep them in memory only
+    """
+    location = str(persistency_manager.directory)
+    with _indexes_lock:
+        index = _indexes.get(location)
+        if index is None:
+            path = (
+                os.path.join(directory, fingerprint(location) + '.sqlite')
+                if directory else None)
+            index = _indexes[location] = SearchIndex(path)
+    index.refresh(persistency_manager)
+    return index
+
+
+def clear_search_indexes():
+    with _indexes_lock:
+        _indexes.clear()
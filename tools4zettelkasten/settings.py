@@ -12,16 +12,49 @@ load_dotenv(override=False)
 
 logger = logging.getLogger(__name__)
 
+# ZETTELKASTEN is a folder of markdown files or the URL of another
+# storage backend, e.g. sqlite:///path/to/zettelkasten.db,
+# s3://bucket/prefix or a read-only snapshot like mycelium.zip
 ZETTELKASTEN = os.environ.get('ZETTELKASTEN', '../zettelkasten/mycelium')
 ZETTELKASTEN_INPUT = os.environ.get('ZETTELKASTEN_INPUT',
                                     '../zettelkasten/input')
 
+# Lock files coordinating CLI, Flask and MCP server
+LOCK_PATH = os.path.expanduser(os.environ.get(
+    'LOCK_PATH', '~/.tools4zettelkasten/locks'))
+
+# S3 backend settings
+# endpoint of an S3 compatible store like MinIO, empty for AWS
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')
+S3_CACHE_PATH = os.path.expanduser(os.environ.get(
+    'S3_CACHE_PATH', '~/.tools4zettelkasten/s3_cache'))
+
 # Flask settings
 TEMPLATE_FOLDER = 'flask_frontend/templates'
 STATIC_FOLDER = 'flask_frontend/static'
 ZETTELKASTEN_IMAGES = os.environ.get(
     'ZETTELKASTEN_IMAGES',
     '/Users/rupertrebentisch/Dropbox/zettelkasten/mycelium/images')
+# key signing the session cookie, set it to keep chat sessions valid
+# across restarts and workers (empty: random key per start)
+FLASK_SECRET_KEY = os.environ.get('FLASK_SECRET_KEY', '')
+# notes kept in the cache of rendered HTML, and a directory to persist
+# the cache across restarts (empty: cache in memory only)
+RENDER_CACHE_SIZE = int(os.environ.get('RENDER_CACHE_SIZE', '256'))
+RENDER_CACHE_PATH = os.path.expanduser(
+    os.environ.get('RENDER_CACHE_PATH', ''))
+# node positions of the graph, kept so the map stays stable when notes
+# are added (empty: lay out the whole graph on every change)
+GRAPH_LAYOUT_PATH = os.path.expanduser(os.environ.get(
+    'GRAPH_LAYOUT_PATH', '~/.tools4zettelkasten/graph_layouts'))
+# seconds browsers may use images without asking the server again
+IMAGE_CACHE_MAX_AGE = int(os.environ.get('IMAGE_CACHE_MAX_AGE', '604800'))
+# responses smaller than this number of bytes are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '500'))
+
+# Full-text search index, persisted between runs (empty: memory only)
+SEARCH_INDEX_PATH = os.path.expanduser(os.environ.get(
+    'SEARCH_INDEX_PATH', '~/.tools4zettelkasten/search_index'))
 
 # Description of structural links in Zettelkasten
 DIRECT_SISTER_ZETTEL = "train of thoughts"
@@ -35,6 +68,24 @@ EMBEDDING_MODEL = os.environ.get(
     'EMBEDDING_MODEL', 'paraphrase-multilingual-MiniLM-L12-v2')
 RAG_TOP_K = int(os.environ.get('RAG_TOP_K', '5'))
 LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-5')
+# retrieval of the zettel for a question: 'vector' (embeddings),
+# 'lexical' (BM25 full-text index) or 'hybrid' (both, fused by rank)
+RAG_SEARCH_MODES = ('vector', 'lexical', 'hybrid')
+RAG_SEARCH_MODE = os.environ.get('RAG_SEARCH_MODE', 'vector')
+# load vector store and embedding model when a server starts
+RAG_WARM_UP = os.environ.get('RAG_WARM_UP', 'false').lower() in (
+    '1', 'true', 'yes')
+
+# Chat history, kept on the server and referenced from the session
+CHAT_HISTORY_PATH = os.path.expanduser(os.environ.get(
+    'CHAT_HISTORY_PATH', '~/.tools4zettelkasten/chat_history.db'))
+# messages kept per conversation and days until a conversation expires
+CHAT_HISTORY_MAX_MESSAGES = int(
+    os.environ.get('CHAT_HISTORY_MAX_MESSAGES', '200'))
+CHAT_HISTORY_TTL_DAYS = float(os.environ.get('CHAT_HISTORY_TTL_DAYS', '30'))
+# window of the history sent to the LLM with every question
+CHAT_CONTEXT_MESSAGES = int(os.environ.get('CHAT_CONTEXT_MESSAGES', '10'))
+CHAT_CONTEXT_CHARS = int(os.environ.get('CHAT_CONTEXT_CHARS', '12000'))
 
 
 def check_directories(strict: bool = True):
@@ -48,6 +99,11 @@ def check_directories(strict: bool = True):
         ('ZETTELKASTEN_INPUT', globals()['ZETTELKASTEN_INPUT']),
         ('ZETTELKASTEN_IMAGES', globals()['ZETTELKASTEN_IMAGES']),
     ]:
+        if name == 'ZETTELKASTEN' and (
+                '://' in path or os.path.isfile(path)):
+            # database, object store and snapshot locations are
+            # validated by their PersistencyManager
+            continue
         if not os.path.isdir(path):
             msg = (
                 f"{path} is not a directory, "
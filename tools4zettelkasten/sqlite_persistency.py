@@ -0,0 +1,204 @@
+# sqlite_persistency.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""SQLite storage backend for the Zettelkasten.
+
+Every note is stored as one row (filename, content, mtime) of a single
+database file. The filename is the primary key, so listing, existence
+checks and renames are indexed queries instead of directory operations.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from . import persistency as ps
+from .locking import LockManager
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS notes (
+    filename TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+-- counts the changes of the list of filenames, see
+-- get_directory_fingerprint()
+CREATE TABLE IF NOT EXISTS generation (value INTEGER NOT NULL);
+INSERT INTO generation SELECT 0
+    WHERE NOT EXISTS (SELECT 1 FROM generation);
+CREATE TRIGGER IF NOT EXISTS note_added AFTER INSERT ON notes
+    BEGIN UPDATE generation SET value = value + 1; END;
+CREATE TRIGGER IF NOT EXISTS note_deleted AFTER DELETE ON notes
+    BEGIN UPDATE generation SET value = value + 1; END;
+CREATE TRIGGER IF NOT EXISTS note_renamed AFTER UPDATE OF filename ON notes
+    BEGIN UPDATE generation SET value = value + 1; END;
+'''
+
+
+class SqlitePersistencyManager:
+    """PersistencyManager storing the notes in a SQLite database
+
+    The interface is the same as the one of
+    :class:`tools4zettelkasten.persistency.PersistencyManager`.
+    Inside of ``group_commit()`` all changes are collected in one
+    transaction, which is committed when the block is left.
+    """
+    def __init__(self, database) -> None:
+        if (isinstance(database, str)):
+            self.database = Path(database)
+        else:
+            self.database = database
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            str(self.database), check_same_thread=False)
+        self._lock = threading.RLock()
+        self._group_commit_depth = 0
+        self.locks = LockManager(self.database)
+        with self._lock:
+            # creating the schema writes, which would have to wait for a
+            # running group commit of another connection
+            if self._connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                    "AND name = 'generation'").fetchone() is None:
+                self._connection.executescript(SCHEMA)
+                self._connection.commit()
+
+    @property
+    def directory(self):
+        """location of the database, used for messages"""
+        return self.database
+
+    def close(self):
+        self._connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            try:
+                yield self._connection
+            except BaseException:
+                if self._group_commit_depth == 0:
+                    self._connection.rollback()
+                raise
+            if self._group_commit_depth == 0:
+                self._connection.commit()
+
+    @contextmanager
+    def group_commit(self):
+        """collects all changes of the block in one transaction"""
+        with self._lock:
+            self._group_commit_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._group_commit_depth -= 1
+                if self._group_commit_depth == 0:
+                    self._connection.rollback()
+                raise
+            self._group_commit_depth -= 1
+            if self._group_commit_depth == 0:
+                self._connection.commit()
+
+    def get_list_of_filenames(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT filename FROM notes "
+                "WHERE filename NOT LIKE '.%' ORDER BY filename")
+            return [row[0] for row in rows]
+
+    def get_directory_fingerprint(self):
+        """changes whenever a note is added, deleted or renamed"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT value FROM generation").fetchone()[0]
+
+    def get_string_from_file_content(self, filename):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content FROM notes WHERE filename = ?",
+                (filename,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(
+                "no note " + filename + " in " + str(self.database))
+        return row[0]
+
+    def get_file_content(self, filename):
+        return self.get_string_from_file_content(filename).splitlines(
+            keepends=True)
+
+    def overwrite_file_content(self, filename, new_content):
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO notes (filename, content, mtime) "
+                "VALUES (?, ?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET "
+                "content = excluded.content, mtime = excluded.mtime",
+                (filename, new_content, time.time()))
+
+    def is_file_existing(self, filename):
+        if filename[0] == '.':
+            return False
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM notes WHERE filename = ?",
+                (filename,)).fetchone()
+        return row is not None
+
+    def is_markdown_file(self, filename):
+        return ps.is_markdown_file(filename)
+
+    def is_text_file(self, filename):
+        return ps.is_text_file(filename)
+
+    def rename_file(self, oldfilename, newfilename):
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE notes SET filename = ? WHERE filename = ?",
+                (newfilename, oldfilename))
+            if cursor.rowcount == 0:
+                logging.error(
+                    "rename-error: note " + oldfilename
+                    + " not found in " + str(self.database))
+                return
+        print('renamed: ', oldfilename, ' with: ', newfilename)
+
+    def get_modification_time(self, filename):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT mtime FROM notes WHERE filename = ?",
+                (filename,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(
+                "no note " + filename + " in " + str(self.database))
+        return row[0]
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def open_database(database) -> SqlitePersistencyManager:
+    """returns the shared SqlitePersistencyManager of a database
+
+    One connection per database and process is opened, instead of one
+    for every request of the Flask viewer.
+    """
+    database = os.path.abspath(str(database))
+    with _databases_lock:
+        manager = _databases.get(database)
+        if manager is None:
+            manager = _databases[database] = SqlitePersistencyManager(
+                database)
+        return manager
+
+
+def close_databases():
+    """closes the connections opened by open_database"""
+    with _databases_lock:
+        for manager in _databases.values():
+            manager.close()
+        _databases.clear()
@@ -0,0 +1,246 @@
+# title_index.py
+# Copyright (c) 2024 Dr. Rupert Rebentisch
+# Licensed under the MIT license
+
+"""Typo tolerant search of notes by title.
+
+The title of every note (the heading in its first line) and its base
+filename are split into trigrams like in the pg_trgm extension of
+PostgreSQL. An inverted index maps each trigram to the notes containing
+it, so a query only touches the notes sharing a trigram with it.
+
+The index is cached per location. When the notes may have changed, only
+new notes and notes with a new modification time are read again.
+"""
+
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import handle_filenames as hf
+
+# seconds after which the modification times are checked again, even if
+# the directory fingerprint is unchanged (notes edited in place)
+REFRESH_INTERVAL = 10
+
+
+def get_trigrams(text: str) -> set:
+    """trigrams of the words of a text, words are padded with blanks"""
+    trigrams = set()
+    for word in text.lower().replace('_', ' ').split():
+        padded = '  ' + word + ' '
+        for position in range(len(padded) - 2):
+            trigrams.add(padded[position:position + 3])
+    return trigrams
+
+
+def get_title(filename: str, first_line: str) -> str:
+    """heading of the note, the base filename if there is no heading"""
+    if first_line.startswith('#'):
+        return first_line.lstrip('#').strip()
+    return hf.create_Note(filename).base_filename.replace('_', ' ')
+
+
+class TitleIndex:
+    """Inverted trigram index of the titles and base filenames."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # filename -> (modification time, title, trigrams)
+        self._entries = {}
+        self._postings = {}
+        self._ids = {}
+        self._fingerprint = None
+        self._checked = 0
+        self._executor = None
+        self._pending = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, filename: str, title: str, modification_time=None):
+        """adds a note or replaces its entry"""
+        note = hf.create_Note(filename)
+        trigrams = get_trigrams(
+            title + ' ' + note.base_filename.replace('_', ' '))
+        with self._lock:
+            self._remove(filename)
+            self._entries[filename] = (modification_time, title, trigrams)
+            if note.id:
+                self._ids[note.id] = filename
+            for trigram in trigrams:
+                self._postings.setdefault(trigram, set()).add(filename)
+
+    def remove(self, filename: str):
+        with self._lock:
+            self._remove(filename)
+
+    def _remove(self, filename: str):
+        entry = self._entries.pop(filename, None)
+        if entry is None:
+            return
+        note_id = hf.create_Note(filename).id
+        if self._ids.get(note_id) == filename:
+            del self._ids[note_id]
+        for trigram in entry[2]:
+            filenames = self._postings[trigram]
+            filenames.discard(filename)
+            if not filenames:
+                del self._postings[trigram]
+
+    def update_note(self, persistency_manager, filename: str):
+        """reads the title of one note again, e.g. after it was saved"""
+        content = persistency_manager.get_file_content(filename)
+        self.add(
+            filename, get_title(filename, content[0] if content else ''),
+            persistency_manager.get_modification_time(filename))
+
+    def refresh(self, persistency_manager, force: bool = False):
+        """brings the index up to date with the notes
+
+        Only notes which are new or have a new modification time are read.
+        If the directory fingerprint is unchanged, the modification times
+        are checked in the background every REFRESH_INTERVAL seconds and
+        the search is answered from the current index meanwhile.
+        """
+        fingerprint = persistency_manager.get_directory_fingerprint()
+        if not force and fingerprint == self._fingerprint:
+            now = time.monotonic()
+            if now - self._checked >= REFRESH_INTERVAL:
+                self._checked = now
+                self._schedule(
+                    lambda: self._update(persistency_manager, force=True))
+            return
+        self._update(persistency_manager, fingerprint, force)
+
+    def _update(self, persistency_manager, fingerprint=None,
+                force: bool = False):
+        """reads the changed notes
+
+        :param fingerprint: directory fingerprint, None to get it here
+        """
+        with self._refresh_lock:
+            if fingerprint is None:
+                fingerprint = persistency_manager.get_directory_fingerprint()
+            elif not force and fingerprint == self._fingerprint:
+                # another thread has just brought the index up to date
+                return
+            filenames = [
+                filename
+                for filename in persistency_manager.get_list_of_filenames()
+                if persistency_manager.is_markdown_file(filename)]
+            for filename in set(self._entries) - set(filenames):
+                self.remove(filename)
+            for filename in filenames:
+                modification_time = (
+                    persistency_manager.get_modification_time(filename))
+                entry = self._entries.get(filename)
+                if entry is None or entry[0] != modification_time:
+                    self.update_note(persistency_manager, filename)
+            self._fingerprint = fingerprint
+            self._checked = time.monotonic()
+
+    def _schedule(self, function):
+        """runs the function in the background thread, unless a check is
+        already waiting there"""
+        with self._lock:
+            if self._pending is not None:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+
+            def _run():
+                try:
+                    function()
+                except Exception:
+                    logging.exception("refresh of the title index failed")
+                finally:
+                    with self._lock:
+                        self._pending = None
+
+            self._pending = self._executor.submit(_run)
+
+    def wait(self):
+        """Block until a scheduled refresh has finished."""
+        with self._lock:
+            pending = self._pending
+        if pending is not None:
+            pending.result()
+
+    def search(self, query: str, limit: int = 10,
+               min_score: float = 0.3) -> list:
+        """notes matching the query, best match first
+
+        The score is the share of the trigrams of the query found in the
+        note, ties are broken by the share of the trigrams of the note
+        matched by the query (shorter titles first). A query equal to the
+        id of a note scores 1. Notes which can not reach ``min_score`` are
+        pruned before they are counted.
+
+        :return: list of (filename, title, score)
+        """
+        query_trigrams = get_trigrams(query)
+        if not query_trigrams:
+            return []
+        # a note must share this many trigrams to reach the minimal score
+        needed = max(math.ceil(min_score * len(query_trigrams) - 1e-9), 1)
+        counts = {}
+        with self._lock:
+            postings = sorted(
+                (self._postings.get(trigram, ())
+                 for trigram in query_trigrams), key=len)
+            # a note sharing the needed trigrams is found in one of the
+            # rarest len - needed + 1 postings, only they collect the
+            # candidates, the frequent postings just count them
+            number_of_rare = len(postings) - needed + 1
+            for filenames in postings[:number_of_rare]:
+                for filename in filenames:
+                    counts[filename] = counts.get(filename, 0) + 1
+            for filenames in postings[max(number_of_rare, 0):]:
+                for filename in counts:
+                    if filename in filenames:
+                        counts[filename] += 1
+            ranking = []
+            for filename, count in counts.items():
+                score = count / len(query_trigrams)
+                if score >= min_score:
+                    ranking.append((
+                        score, count / len(self._entries[filename][2]),
+                        filename))
+            filename = self._ids.get(query.strip().lower())
+            if filename is not None:
+                ranking.append((1.0, 1.0, filename))
+            ranking.sort(key=lambda match: (-match[0], -match[1], match[2]))
+            results = []
+            found = set()
+            for score, _, filename in ranking:
+                if filename in found:
+                    continue
+                found.add(filename)
+                results.append(
+                    (filename, self._entries[filename][1], round(score, 3)))
+                if len(results) >= limit:
+                    break
+        return results
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_title_index(persistency_manager) -> TitleIndex:
+    """Return the cached TitleIndex of the location, refreshed."""
+    location = str(persistency_manager.directory)
+    with _indexes_lock:
+        index = _indexes.get(location)
+        if index is None:
+            index = _indexes[location] = TitleIndex()
+    index.refresh(persistency_manager)
+    return index
+
+
+def clear_title_indexes():
+    with _indexes_lock:
+        _indexes.clear()